@@ -1,5 +1,7 @@
 # -*- coding:utf-8 -*-
 
+import os
+
 import redis
 
 
@@ -22,6 +24,17 @@ class Config:
     SESSION_REDIS = redis.StrictRedis(host=REDIS_HOST, port=REDIS_PORT)  # 保存session数据的redis配置
     PERMANENT_SESSION_LIFETIME = 86400  # session数据的有效期秒
 
+    # 图片存储后端，qiniu：七牛云存储，local：本地文件系统
+    # 数据库中保存的是所用后端生成的图片名，上线后修改此项会使已有的图片全部无法访问，需要先把图片迁移到新的后端
+    IMAGE_STORAGE = "qiniu"
+    # 本地存储图片的目录
+    IMAGE_STORAGE_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "media")
+
+    # 上传图片的最大大小，解析请求数据时超过限制立即返回413，分块上传同样受限，单位：字节
+    IMAGE_UPLOAD_MAX_SIZE = 10 * 1024 * 1024
+    # 请求数据的最大大小，Content-Length超过时不读取请求数据直接拒绝，比图片大小限制多留出表单其他字段的空间
+    MAX_CONTENT_LENGTH = IMAGE_UPLOAD_MAX_SIZE + 1024 * 1024
+
 
 class DevelopmentConfig(Config):
     """开发模式的配置参数"""
@@ -36,6 +36,10 @@ def create_app(config_name):
     # 从配置对象中为app设置配置信息
     app.config.from_object(config[config_name])
 
+    # 上传的文件在解析请求数据时写入有大小限制的临时文件
+    from .utils.image_processing import UploadRequest
+    app.request_class = UploadRequest
+
     # 为app中的url路由添加正则表达式匹配
     app.url_map.converters["regex"] = RegexConverter
 
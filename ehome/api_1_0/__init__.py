@@ -1,10 +1,18 @@
 # -*- coding:utf-8 -*-
 
-from flask import Blueprint
+from flask import Blueprint, jsonify
+
+from ehome.utils.response_code import RET
 
 api = Blueprint('api', __name__)
 
-from . import register,profile,house
+from . import register,profile,house,order,price
+
+
+@api.errorhandler(413)
+def request_entity_too_large(e):
+    """请求数据超过MAX_CONTENT_LENGTH，在读取请求数据之前已被拒绝，或者上传的文件在解析时超过IMAGE_UPLOAD_MAX_SIZE"""
+    return jsonify(errno=RET.PARAMERR, errmsg='上传的数据过大'), 413
 
 
 # 请求钩子
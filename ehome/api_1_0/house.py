@@ -8,70 +8,73 @@ from ehome import redis_store,constants,db
 # 导入flask内置的模块或方法
 from flask import current_app,jsonify,request,g,session
 # 导入模型类
-from ehome.models import Area,House,Facility,HouseImage,User,Order
+from ehome.models import Area,House,Facility,HouseImage,HousePriceRule,User,Order
 # 导入自定义的状态码
 from ehome.utils.response_code import RET
 # 导入登陆验证装饰器
 from ehome.utils.commons import login_required
-# 导入七牛云
-from ehome.utils.image_storage import storage
+# 导入图片存储和图片处理
+from ehome.utils import image_storage, image_processing
+# 导入房屋可预订日期索引
+from ehome.utils import availability
+# 导入读穿缓存
+from ehome.utils import cache
+# 导入游标分页
+from ehome.utils import pagination
+# 导入首页房屋排行
+from ehome.utils import house_rank
+# 导入已存在房屋编号的布隆过滤器
+from ehome.utils import house_bloom
+# 导入按天计价的报价
+from ehome.utils import pricing
 
 # 导入json模块
 import json
 # 导入datetime模块,对日期参数进行格式化
 import datetime
+# 导入calendar模块,计算每个月的天数
+import calendar
 
 
+# 列表页的排序条件:排序字段,是否倒序
+HOUSE_LIST_SORTS = {
+    'new': ('create_time', True),  # 房屋发布时间
+    'booking': ('order_count', True),  # 房屋成交量
+    'price-inc': ('price', False),  # 价格由低到高
+    'price-des': ('price', True),  # 价格由高到低
+}
+
 
 @api.route('/areas',methods=['GET'])
 def get_area_info():
     """
     获取区域信息
     首页区域信息加载----缓存数据库-----磁盘数据库----缓存数据库
-    1. 尝试从redis 数据库中获取缓存的区域信息
-    2. 如果获取过程发生异常，要把获取结果重新置为None值
-    3. 判断获取结果，如果有数据直接返回，可留下房屋缓存数据的日志信息
-    4. 查询mysql数据库，获取区域信息
-    5. 校验查询结果
-    6. 对查询结果进行保存，遍历查询结果，调用模型类实例方法，添加区域信息
-    7. 序列化数据，转为json,存入缓存中
-    8. 拼接字符串，直接返回区域信息的json数据
+    1. 通过读穿缓存获取区域信息，缓存失效时只有一个进程查询mysql重建缓存
+    2. 查询mysql数据库，获取区域信息
+    3. 校验查询结果，没有数据时不进行缓存
+    4. 遍历查询结果，调用模型类实例方法，添加区域信息
+    5. 序列化数据，转为json,由缓存层存入缓存中
+    6. 拼接字符串，直接返回区域信息的json数据
     :return:
     """
-    # 先尝试从redis缓存中获取区域信息
-    try:
-        ret = redis_store.get('area_info')
-    except Exception as e:
-        current_app.logger.error(e)
-        # 把ret重新置为None值
-        ret = None
-    # 判断获取结果
-    if ret:
-        # 记录访问redis数据库房屋区域信息的时间
-        current_app.logger.info('hit area info redis')
-        # 直接返回区域信息数据
-        return '{"errno":0, "errmsg":"OK", "data":%s}' %ret
-    # 查询mysql数据库，获取区域信息
-    try:
+    def build_area_info():
+        """查询mysql数据库，获取区域信息的json数据"""
         areas = Area.query.all()
+        # 判断查询结果
+        if not areas:
+            return None
+        # 遍历查询结果，调用模型类的实例方法，转为json字符串
+        return json.dumps([area.to_dict() for area in areas])
+    # 从缓存中获取区域信息，缓存失效时查询mysql数据库
+    try:
+        areas_json = cache.read_through('area_info', constants.AREA_INFO_REDIS_EXPIRES, build_area_info)
     except Exception as e:
         current_app.logger.error(e)
         return jsonify(errno=RET.DBERR, errmsg='获取区域信息失败')
     # 判断查询结果
-    if not areas:
+    if not areas_json:
         return jsonify(errno=RET.NODATA, errmsg='无区域信息')
-    # 定义列表存储查询结果
-    areas_list = []
-    # 遍历查询结果，调用模型类的实例方法，添加区域信息数据
-    for area in areas:
-        areas_list.append(area.to_dict())
-    # 转为json字符串，准备存入缓存中
-    areas_json = json.dumps(areas_list)
-    try:
-        redis_store.setex('area_info', constants.AREA_INFO_REDIS_EXPIRES,areas_json)
-    except Exception as e:
-        current_app.logger.error(e)
-        return jsonify(errno=RET.DBERR, errmsg='缓存区域信息异常')
     # 返回区域信息的json数据
     resp = '{"errno":0, "errmsg":"OK","data":%s}' % areas_json
     return resp
@@ -211,23 +214,34 @@ def save_house_image(house_id):
     if not house:
         return jsonify(errno=RET.NODATA,errmsg='房屋不存在')
 
-    # 读取图片数据
-    image_data = image.read()
+    # 在进程池中生成各尺寸的图片
+    try:
+        variants = image_processing.make_variants(image)
+    except IOError as e:
+        current_app.logger.error(e)
+        return jsonify(errno=RET.PARAMERR, errmsg='图片格式错误')
+    except Exception as e:
+        current_app.logger.error(e)
+        return jsonify(errno=RET.SERVERERR, errmsg='图片处理失败')
     # 调用七牛云接口
     try:
-        image_name = storage(image_data)
+        image_names = image_processing.store_variants(variants)
     except Exception as e:
         current_app.logger.error(e)
         return jsonify(errno=RET.THIRDERR, errmsg='七牛上传图片失败')
+    image_name = image_names['full']
     # 存储图片数据到mysql数据库中
     house_image = HouseImage()
     house_image.house_id =house_id
     house_image.url = image_name
+    house_image.card_url = image_names['card']
+    house_image.thumb_url = image_names['thumb']
     # 把图片数据加入到数据库会话对象中，HouseImage()模型类
     db.session.add(house_image)
     # 判断房屋主图片是否设置，因为首页需要展示房屋幻灯片信息，添加主图片设置
     if not house.index_image_url:
         house.index_image_url = image_name
+        house.index_image_card_url = image_names['card']
         # 把图片数据加入到数据库会话对象中，House()模型类
         db.session.add(house)
     # 提交数据到数据库中
@@ -239,7 +253,7 @@ def save_house_image(house_id):
         db.session.rollback()
         return jsonify(errno=RET.DBERR, errmsg='存储房屋图片异常')
     # 拼接图片的绝对路径，返回前端
-    image_url = constants.QINIU_DOMIN_PREFIX + image_name
+    image_url = image_storage.image_url(image_name)
     return jsonify(errno=RET.OK, errmsg='OK', data={'url':image_url})
 
 
@@ -249,27 +263,19 @@ def get_user_houses():
     """
     获取用户发布房屋信息
     1/获取取参数,user_id
-    2/根据用户id查询数据库,使用反向引用查询该用户发布的所有房屋信息
-    3/定义列表,如果有数据,存储查询结果,调用模型类的方法to_basic_dict()
+    2/根据用户id查询该用户发布的所有房屋信息
+    3/调用模型类的方法to_basic_dict_list(),批量获取房屋基本信息
     4/返回结果
     :return:
     """
     # 获取参数
     user_id = g.user_id
-    # 查询mysql数据库
+    # 查询mysql数据库,区域和用户信息随房屋一起查询
     try:
-        user = User.query.get(user_id)
-        # 使用反向引用,获取该用户发布的房屋信息,一对多的查询
-        houses = user.houses
+        houses_list = House.to_basic_dict_list(House.query.filter(House.user_id == user_id))
     except Exception as e:
         current_app.logger.error(e)
         return jsonify(errno=RET.DBERR,errmsg='查询用户房屋信息失败')
-    # 定义列表,准备存储查询结果
-    houses_list = []
-    # 判断查询结果有数据,遍历查询结果,添加房屋基本信息
-    if houses is not None:
-        for house in houses:
-            houses_list.append(house.to_basic_dict())
     # 返回结果
     return jsonify(errno=RET.OK,errmsg='OK',data={'houses':houses_list})
 
@@ -295,72 +301,45 @@ def check_login():
 @api.route('/houses/index',methods=['GET'])
 def get_houses_index():
     """
-    项目首页信息:缓存----磁盘----缓存
-    1/尝试从redis缓存中获取房屋信息
-    2/判断获取结果,如果有数据,记录访问时间,直接返回结果
-    3/查询mysql数据库
-    4/默认按照房屋成交量进行查询,
-    houses = House.query.order_by(House.order_count.desc()).limit(5)
-    5/判断查询结果
-    6/定义列表,遍历查询结果,添加数据,
-    7/判断是否设置主图片,如未设置主图片默认不添加
-    8/序列化房屋数据
-    9/存入到缓存中,
-    10/返回结果
+    项目首页信息:排行----缓存----磁盘
+    1/从redis的房屋排行中获取成交量最高的房屋编号,排行中只有设置了主图片的房屋,
+    house_ids = house_rank.top(5)
+    2/排行不存在时,只有抢到锁的进程查询mysql数据库中设置了主图片的房屋,重建排行,
+    没有房屋设置主图片时记录短时间有效的空标记,期间不再重建
+    3/批量获取房屋基本信息的缓存片段,缓存中没有的房屋才查询mysql数据库
+    4/拼接房屋基本信息的json数据
+    5/返回结果
     :return:
     """
-    #　尝试从redis获取房屋首页幻灯片信息
-    try:
-        ret = redis_store.get('home_page_data')
-    except Exception as e:
-        current_app.logger.error(e)
-        ret = None
-    # 如果有数据,记录访问缓存数据的时间,直接返回房屋信息
-    if ret:
-        current_app.logger.info('hit house index info redis')
-        return '{"errno":0,"errmsg":"OK","data":%s}' % ret
-    # 查询mysql数据库,获取房屋信息,默认按照房屋成交量进行倒叙查询
     try:
-        houses = House.query.order_by(House.order_count.desc()).limit(constants.HOME_PAGE_MAX_HOUSES)
+        houses_id = house_rank.top(constants.HOME_PAGE_MAX_HOUSES)
+        # 排行为空时从mysql数据库重建
+        if not houses_id:
+            house_rank.ensure(lambda: db.session.query(House.id, House.order_count).filter(House.index_image_url != ''))
+            houses_id = house_rank.top(constants.HOME_PAGE_MAX_HOUSES)
+        # 批量获取房屋基本信息
+        houses_json = House.cached_basic_json_list(houses_id)
     except Exception as e:
         current_app.logger.error(e)
         return jsonify(errno=RET.DBERR,errmsg='查询房屋信息失败')
-    # 校验查询结果
-    if not houses:
-        return jsonify(errno=RET.NODATA,errmsg='无房屋数据')
-    # 定义列表,遍历查询结果
-    houses_list = []
-    for house in houses:
-        # 判断房屋主图片如未设置,默认不添加数据
-        if not house.index_image_url:
-            continue
-        houses_list.append(house.to_basic_dict())
-    # 序列化数据
-    houses_json = json.dumps(houses_list)
-    # 把房屋数据存入到redis缓存中
-    try:
-        redis_store.setex('home_page_data',constants.HOME_PAGE_DATA_REDIS_EXPIRES,houses_json)
-    except Exception as e:
-        current_app.logger.error(e)
     # 返回结果
-    resp = '{"errno":0,"errmsg":"Ok","data":%s}' % houses_json
+    resp = '{"errno":0,"errmsg":"OK","data":[%s]}' % ','.join(houses_json)
     return resp
 
 
 @api.route("/houses/<int:house_id>",methods=['GET'])
 def get_house_detail(house_id):
     """
-    获取房屋详情信息:缓存----磁盘----缓存
+    获取房屋详情信息:过滤器----缓存----磁盘----缓存
     1/获取参数,user_id,把用户分为两类,登陆用户/未登陆用户
     user_id = session.get('user_id','-1')
     2/校验house_id参数
-    3/尝试从redis缓存中获取房屋信息
-    4/校验结果,如果有数据,
+    3/通过布隆过滤器判断房屋是否存在,一定不存在的房屋直接返回,不查询mysql数据库
+    4/通过读穿缓存获取房屋信息,缓存失效时只有一个进程查询mysql重建缓存
     5/查询mysql数据库
-    6/调用模型类的to_full_dict(),进行异常处理
-    7/序列化数据
-    8/存储到redis缓存中
-    9/返回结果
+    6/调用模型类的to_full_dict()
+    7/序列化数据,由缓存层存储到redis缓存中,房屋不存在时缓存空字符串,缓存时间较短
+    8/返回结果
     :return:
     """
     # 使用请求上下文对象session,从redis中获取用户身份信息,如未登陆,默认给-1值
@@ -368,41 +347,159 @@ def get_house_detail(house_id):
     # 校验房屋的存在
     if not house_id:
         return jsonify(errno=RET.PARAMERR,errmsg='参数错误')
-    # 尝试从redis中获取房屋信息
+    # 布隆过滤器判断房屋一定不存在时直接返回,过滤器不存在时继续查询缓存和mysql数据库
     try:
-        ret = redis_store.get('house_info_%s' % house_id)
+        exists = house_bloom.might_exist(house_id)
     except Exception as e:
         current_app.logger.error(e)
-        ret = None
-    # 判断获取结果
-    if ret:
-        current_app.logger.info('hit house detail info redis')
-        return '{"errno":0,"errmsg":"OK","data":{"user_id":%s,"house":%s}}' % (user_id,ret)
-    # 查询mysql数据库
+        exists = None
+    if exists is False:
+        return jsonify(errno=RET.NODATA,errmsg='无房屋数据')
+
+    def build_house_detail():
+        """查询mysql数据库,获取房屋详情信息的json数据,房屋不存在时返回空字符串"""
+        # 房屋主人和图片随房屋一起查询
+        house = House.query_full(house_id)
+        # 校验查询结果
+        if not house:
+            return ''
+        # 调用模型类中方法,获取房屋详情信息,序列化数据
+        return json.dumps(house.to_full_dict())
+    # 从缓存中获取房屋信息,缓存失效时查询mysql数据库
     try:
-        house = House.query.get(house_id)
+        house_json = cache.read_through('house_info_%s' % house_id, constants.HOUSE_DETAIL_REDIS_EXPIRE_SECOND,
+                                        build_house_detail, tags=('house_info',),
+                                        empty_expires=constants.HOUSE_DETAIL_NODATA_REDIS_EXPIRES)
     except Exception as e:
         current_app.logger.error(e)
         return jsonify(errno=RET.DBERR,errmsg='查询房屋详情信息失败')
     # 校验查询结果
-    if not house:
+    if not house_json:
         return jsonify(errno=RET.NODATA,errmsg='无房屋数据')
-    # 调用模型类中方法,获取房屋详情信息
+    # 返回结果
+    resp = '{"errno":0,"errmsg":"OK","data":{"user_id":%s,"house":%s}}' %(user_id,house_json)
+    return resp
+
+
+@api.route("/houses/<int:house_id>/calendar",methods=['GET'])
+def get_house_calendar(house_id):
+    """
+    获取房屋的可预订日历
+    1/获取参数,month起始月份,格式为YYYY-MM,默认为当前月份,months查询的月数,默认为1
+    2/校验参数,月数不能超过constants.HOUSE_CALENDAR_MAX_MONTHS
+    3/通过布隆过滤器判断房屋是否存在
+    4/从redis的房屋可预订日期索引中读取每个月的占用情况,不查询订单数据
+    5/返回结果,每个月的days为每天一个字符的字符串,"1"表示已被占用,"0"表示可以预订
+    :return:
+    """
+    # 获取参数
+    month_str = request.args.get('month','')
+    months = request.args.get('months','1')
+    # 对月份进行格式化
+    try:
+        if month_str:
+            first_day = datetime.datetime.strptime(month_str,'%Y-%m').date()
+        else:
+            first_day = datetime.date.today().replace(day=1)
+        months = int(months)
+    except Exception as e:
+        current_app.logger.error(e)
+        return jsonify(errno=RET.PARAMERR,errmsg='月份参数错误')
+    # 月数不能超过constants.HOUSE_CALENDAR_MAX_MONTHS
+    if not 1 <= months <= constants.HOUSE_CALENDAR_MAX_MONTHS:
+        return jsonify(errno=RET.PARAMERR,errmsg='月份参数错误')
+    # 判断房屋是否存在,过滤器还没有建立时查询mysql数据库
     try:
-        house_data = house.to_full_dict()
+        exists = house_bloom.might_exist(house_id)
+        if exists is None:
+            exists = db.session.query(House.id).filter(House.id == house_id).first() is not None
     except Exception as e:
         current_app.logger.error(e)
-        return jsonify(errno=RET.DBERR,errmsg='获取房屋详情信息异常')
-    # 序列化数据
-    house_json = json.dumps(house_data)
-    # 把房屋详情数据存入缓存中
+        return jsonify(errno=RET.DBERR,errmsg='查询房屋数据失败')
+    if not exists:
+        return jsonify(errno=RET.NODATA,errmsg='无房屋数据')
+    # 计算每个月的天数
+    month_days = []
+    year, month = first_day.year, first_day.month
+    for _ in range(months):
+        month_days.append(('%04d-%02d' % (year, month), calendar.monthrange(year, month)[1]))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    # 一次读取所有月份的占用情况
     try:
-        redis_store.setex('house_info_%s' % house_id,constants.HOUSE_DETAIL_REDIS_EXPIRE_SECOND,house_json)
+        flags = availability.occupied_days(house_id, first_day, sum(days for _, days in month_days))
     except Exception as e:
         current_app.logger.error(e)
+        return jsonify(errno=RET.DBERR,errmsg='查询房屋日历失败')
+    # 按月份拆分
+    calendar_list = []
+    start = 0
+    for month_str, days in month_days:
+        calendar_list.append({'month':month_str,'days':flags[start:start + days]})
+        start += days
     # 返回结果
-    resp = '{"errno":0,"errmsg":"OK","data":{"user_id":%s,"house":%s}}' %(user_id,house_json)
-    return resp
+    return jsonify(errno=RET.OK,errmsg='OK',data={'calendar':calendar_list})
+
+
+def query_houses(area_id, start_date, end_date, use_calendar=True):
+    """
+    构造满足区域和日期条件的房屋查询
+    :param use_calendar: 是否通过房屋可预订日期索引过滤有冲突的房屋,为False或索引不可用时由数据库子查询过滤
+    """
+    # 定义列表,存储查询房屋数据的过滤条件
+    params_filter = []
+    # 校验区域信息的存在
+    if area_id:
+        # a = [1,3,5,7,9]
+        # b = 5
+        # a.append(a == b) 添加的数据为true或false
+        # 返回的结果是sqlalchemy的对象
+        params_filter.append(House.area_id == area_id)
+    # 对日期进行处理,决定了房屋能否预定,只选择开始日期表示开始日期之后都要空闲,只选择结束日期同理
+    if start_date or end_date:
+        conflict_houses_id = None
+        if use_calendar:
+            # 获取满足区域条件的候选房屋编号,通过房屋可预订日期索引判断冲突,不再查询订单数据
+            candidate_houses_id = [house_id for house_id, in db.session.query(House.id).filter(*params_filter)]
+            try:
+                conflict_houses_id = availability.find_busy_houses(candidate_houses_id, start_date, end_date)
+            except Exception as e:
+                current_app.logger.error(e)
+        if conflict_houses_id is None:
+            # 索引不可用时退回到数据库子查询,由数据库过滤有冲突的房屋
+            conflict_filter = [Order.status.in_(availability.OCCUPYING_STATUS)]
+            if start_date:
+                conflict_filter.append(Order.end_date >= start_date)
+            if end_date:
+                conflict_filter.append(Order.begin_date <= end_date)
+            conflict_houses_id = db.session.query(Order.house_id).filter(*conflict_filter)
+        # 判断有冲突的房屋是否存在
+        if conflict_houses_id:
+            # 存入过滤参数中,进行取反操作,获取所有不冲突的房屋
+            params_filter.append(House.id.notin_(conflict_houses_id))
+    # 过滤条件已经完成
+    return House.query.filter(*params_filter)
+
+
+def query_houses_ids(area_id, start_date, end_date, sort_key, use_calendar=True):
+    """列表页缓存的房屋编号查询,满足过滤条件的全部房屋编号按排序条件排列"""
+    sort_field, descending = HOUSE_LIST_SORTS.get(sort_key, HOUSE_LIST_SORTS['new'])
+    sort_column = getattr(House, sort_field)
+    return query_houses(area_id, start_date, end_date, use_calendar).with_entities(House.id)\
+        .order_by(sort_column.desc() if descending else sort_column.asc(), House.id.desc())
+
+
+def add_houses_amount(houses_dict_list, start_date, end_date):
+    """
+    为列表页的房屋补充入住日期区间的总价amount,单位为分
+    当前页所有房屋的价格规则一次查询,通过pricing.quote_many()一起计算
+    """
+    if (end_date - start_date).days + 1 > constants.HOUSE_QUOTE_MAX_DAYS:
+        return
+    houses_id = [house['house_id'] for house in houses_dict_list]
+    amounts = pricing.quote_many(houses_id, [house['price'] or 0 for house in houses_dict_list],
+                                 HousePriceRule.for_houses(houses_id), start_date.date(), end_date.date())
+    for house in houses_dict_list:
+        house['amount'] = amounts.get(house['house_id'])
 
 
 @api.route('/houses',methods=['GET'])
@@ -416,26 +513,21 @@ def get_houses_list():
     3/判断如果有日期参数,对日期进行格式化处理,datetime模块
     4/确认用户选择的开始日期必须小于等于结束结束日期,至少预定1天
     5/对页数进行格式化,page = int(page)
-    6/尝试从redis中获取房屋列表信息,每页数据里存储多条数据,需要使用hash数据类型
-    ret = redis_store.hget('houses_%s_%s_%s_%s' % (area_id,start_date_str_end_date_str,sort_key))
-    7/如果有数据,记录访问房屋列表数据的信息,返回结果
+    6/通过读穿缓存获取满足过滤条件的房屋编号,按排序条件排好序存储在redis列表中,
+    键为'houses_id_list_%s_%s_%s_%s' % (area_id,start_date_str,end_date_str,sort_key)
+    7/缓存失效时只有一个进程查询mysql重建缓存,其他进程返回旧数据或等待重建结果
     8/需要查询mysql数据库,
     9/定义查询数据库的过滤条件,params_filter = []主要包括:区域信息/开始日期和结束日期
     10/根据过滤条件查询数据库,按照booking成交量/价格price-inc,price-des/房屋发布时间new;
-    houses = House.query.filter(*params_filter).order_by(House.create_time.desc())
-    11/对查询结果进行分页,paginate分页返回的结果,包括总页数,房屋数据
-    hosues_page = houses.paginate(page,2,False) /False分页如果发生异常不报错
-    houses_list = houses_page.items (分页后的房屋数据)
-    total_page = houses_page.pages (分页后的总页数)
-    12/遍历分页后的房屋数据,获取房屋的基本信息,需要调用模型类中的house_dict_list = to_basic_dict()方法
+    houses = db.session.query(House.id).filter(*params_filter).order_by(House.create_time.desc())
+    11/通过LRANGE只读取当前页的房屋编号,通过LLEN获取房屋总数计算总页数
+    12/调用模型类中的House.cached_basic_json_list(),一次MGET获取当前页房屋基本信息的缓存片段,
+    每个房屋的基本信息只缓存一份,房屋修改时只删除该房屋的片段
     13/构造响应数据:
     resp = {"errno":0,"errmsg":"OK","data":{"houses":houses_dict_list,"total_page":total_page,"current_page":page}}
-    14/序列化数据,resp_json = json.dumps(resp)
-    15/存入缓存中,设置redis中房屋列表数据,判断用户请求的页数小于等于总页数,即请求的页数是有数据的
-    16/对多条数据往redis中存储,需要开启事务,确保数据的完整性和一致性,
-    pip = redis_store.pipeline()
-    pip.multi()/pip.hset(redis_key,page,resp_json)/pip.expire(redis_key,7200)/pip.execute()
-    17/返回结果 return resp_json
+    14/拼接json字符串,返回结果
+    15/同时传入开始日期和结束日期时,按房屋的价格规则批量计算当前页每个房屋的总价amount
+    17/传入cursor参数时改为游标分页,见get_houses_cursor_page()
     :return:
     """
     # 获取参数,当前接口都是可选参数
@@ -444,6 +536,7 @@ def get_houses_list():
     end_date_str = request.args.get('ed','')
     sort_key = request.args.get('sk','new') # 如未传参默认new,房屋发布时间
     page = request.args.get('p','1') # 如未传参默认1,房屋列表页
+    cursor = request.args.get('cursor') # 传入游标参数时使用游标分页,空字符串表示第一页
     # 首先对日期进行格式化
     try:
         # 存储日期转换后的结果
@@ -467,121 +560,99 @@ def get_houses_list():
     except Exception as e:
         current_app.logger.error(e)
         return jsonify(errno=RET.DATAERR,errmsg='页数格式错误')
-    # 尝试从redis中获取房屋列表信息
+    # 按区域和日期条件过滤房屋
+    def list_query():
+        return query_houses(area_id, start_date, end_date)
+    # 判断排序条件,获取排序字段和排序方向,如果用户未选择排序条件,默认按照房屋发布时间进行排序
+    sort_field, descending = HOUSE_LIST_SORTS.get(sort_key, HOUSE_LIST_SORTS['new'])
+    # 传入了游标参数,使用游标分页
+    if cursor is not None:
+        count_key = 'houses_count_%s_%s_%s' % (area_id,start_date_str,end_date_str)
+        return get_houses_cursor_page(list_query, count_key, sort_key, sort_field, descending, cursor,
+                                      start_date, end_date)
+
+    def build_houses_ids():
+        """查询mysql数据库,获取满足过滤条件的全部房屋编号"""
+        houses = query_houses_ids(area_id, start_date, end_date, sort_key)
+        return [str(house_id) for house_id, in houses]
+    # 房屋编号列表的键里包含区域信息/开始日期/结束日期/排序条件
+    redis_key = 'houses_id_list_%s_%s_%s_%s' % (area_id,start_date_str,end_date_str,sort_key)
+    # 从缓存的房屋编号列表中只读取当前页,缓存失效时查询mysql数据库,再批量获取当前页的房屋基本信息
     try:
-        # 存储的数据类型为hash,键里包含区域信息/开始日期/结束日期/排序条件
-        redis_key = 'house_%s_%s_%s_%s' % (area_id,start_date_str,end_date_str,sort_key)
-        # 尝试获取redis缓存中的数据,指定键,属性
-        ret = redis_store.hget(redis_key,page)
-    except Exception as e:
-        current_app.logger.error(e)
-        ret = None
-    # 判断查询结果,如有数据直接返回
-    if ret:
-        # 记录访问redis数据的时间
-        current_app.logger.info('hit houses list info redis')
-        return ret
-    # 查询mysql数据库
-    try:
-        # 定义列表,存储查询房屋数据的过滤条件
-        params_filter = []
-        # 校验区域信息的存在
-        if area_id:
-            # a = [1,3,5,7,9]
-            # b = 5
-            # a.append(a == b) 添加的数据为true或false
-            # 返回的结果是sqlalchemy的对象
-            params_filter.append(House.area_id == area_id)
-        # 对日期进行处理,决定了房屋能否预定,判断用户如果选择了开始日期和结束日期
+        capacity = constants.HOUSE_LIST_PAGE_CAPACITY
+        # 页数小于1时按第一页处理,与paginate一致
+        first = (max(page, 1) - 1) * capacity
+        houses_ids, total_count = cache.read_through_range(redis_key, constants.HOUSE_LIST_REDIS_EXPIRES,
+                                                           build_houses_ids, first, capacity,
+                                                           tags=('houses_list',))
+        # 计算总页数
+        total_page = (total_count + capacity - 1) // capacity
+        houses_json = House.cached_basic_json_list([int(house_id) for house_id in houses_ids])
+        # 选择了入住日期区间时补充每个房屋的总价
         if start_date and end_date:
-            # 查询有冲突的订单
-            conflict_orders = Order.query.filter(Order.begin_date<=end_date,Order.end_date>=start_date).all()
-            # 遍历有冲突的订单,获取有冲突的房屋
-            conflict_houses_id = [order.house_id for order in conflict_orders]
-            # 判断有冲突的房屋是否存在
-            if conflict_houses_id:
-                # 存入过滤参数中,进行取反操作,获取所有不冲突的房屋
-                params_filter.append(House.id.notin_(conflict_houses_id))
-        # 如果用户只选择了开始日期
-        if start_date:
-            # 查询开始日期有冲突的订单数据
-            conflict_orders = Order.query.filter(Order.end_date>=start_date).all()
-            # 遍历有冲突的订单数据
-            conflict_houses_id = [order.house_id for order in conflict_orders]
-            # 判断有冲突的房屋存在
-            if conflict_houses_id:
-                params_filter.append(House.id.notin_(conflict_houses_id))
-        # 如果用户只选择了结束日期
-        if end_date:
-            conflict_orders = Order.query.filter(Order.begin_date<=end_date).all()
-            conflict_houses_id = [order.house_id for order in conflict_orders]
-            if conflict_houses_id:
-                params_filter.append(House.id.notin_(conflict_houses_id))
-        # 过滤条件已经完成,执行查询语句,获取房屋数据,进行排序查询
-        # 判断排序条件,按房屋成交排序查询
-        if 'booking' == sort_key:
-            houses = House.query.filter(*params_filter).order_by(House.order_count.desc())
-        # 按照房屋价格进行排序
-        elif 'price-inc' == sort_key:
-            houses = House.query.filter(*params_filter).order_by(House.price.asc())
-        elif 'prcie-des' == sort_key:
-            houses = House.query.filter(*params_filter).order_by(House.price.desc())
-        # 如果用户未选择排序条件,默认按照房屋发布时间进行排序
-        else:
-            houses = House.query.filter(*params_filter).order_by(House.create_time.desc())
-        # 对查询结果进行分页,page:页数,每页条目书,False分页出错,不会报错
-        houses_page = houses.paginate(page,constants.HOUSE_LIST_PAGE_CAPACITY,False)
-        # 存储分页后的房屋数据
-        houses_list = houses_page.items
-        # 存储分页后的总页数
-        total_page = houses_page.pages
-        # 定义列表,存储分页后的数据
-        houses_dict_list = []
-        # 遍历分页后的数据,调用了模型类方法,获取房屋基本数据
-        for house in houses_list:
-            houses_dict_list.append(house.to_basic_dict())
+            houses_dict_list = [json.loads(house_json) for house_json in houses_json]
+            add_houses_amount(houses_dict_list, start_date, end_date)
+            houses_json = [json.dumps(house_dict) for house_dict in houses_dict_list]
     except Exception as e:
         current_app.logger.error(e)
         return jsonify(errno=RET.DBERR,errmsg='查询房屋列表信息失败')
-    # 构造响应数据
-    resp = {"errno":0,"errmsg":"OK","data":{"houses":houses_dict_list,"total_page":total_page,"current_page":page}}
-    # 序列化数据
-    resp_json = json.dumps(resp)
-    # 判断用户请求的页数必须有数据
-    if page <= total_page:
-        # 构造redis_key
-        redis_key = 'houses_%s_%s_%s_%s' % (area_id,start_date_str,end_date_str,sort_key)
-        # 使用hash数据类型,对多条数据需要统一操作,使用事务
-        pip = redis_store.pipeline()
-        try:
-            # 开启事务
-            pip.multe()
-            # 设置数据
-            pip.hset(redis_key,page,resp_json)
-            # 设置过期时间
-            pip.expire(redis_key,constants.HOUSE_LIST_REDIS_EXPIRES)
-            # 执行事务
-            pip.execute()
-        except Exception as e:
-            current_app.logger.error(e)
     # 返回结果
-    return resp_json
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
-
+    resp = '{"errno":0,"errmsg":"OK","data":{"houses":[%s],"total_page":%s,"current_page":%s}}' \
+           % (','.join(houses_json), total_page, page)
+    return resp
 
 
+def get_houses_cursor_page(list_query, count_key, sort_key, sort_field, descending, cursor,
+                           start_date=None, end_date=None):
+    """
+    房屋列表页的游标分页:
+    1/解析游标,游标中包含排序条件,排序字段的值和房屋编号
+    2/通过带索引的where条件定位到游标之后的数据,多查询一条判断是否还有下一页
+    3/总条数使用缓存的近似值,不再每次count全部数据
+    4/返回房屋数据和下一页的游标,没有下一页时游标为空字符串
+    5/同时传入开始日期和结束日期时,补充每个房屋的总价amount
+    :param list_query: 构造满足过滤条件的房屋查询的函数
+    :param count_key: 缓存总条数的redis键
+    :param sort_key: 排序条件
+    :param sort_field: 排序字段
+    :param descending: 是否倒序
+    :param cursor: 游标参数,空字符串表示第一页
+    :param start_date: 入住日期
+    :param end_date: 离开日期
+    :return:
+    """
+    # 解析游标,空字符串表示第一页
+    cursor_values = None
+    if cursor:
+        try:
+            cursor_sort_key, sort_value, last_id = pagination.decode_cursor(cursor)
+        except Exception as e:
+            current_app.logger.error(e)
+            return jsonify(errno=RET.PARAMERR,errmsg='游标参数错误')
+        # 游标必须和当前的排序条件一致
+        if cursor_sort_key != sort_key:
+            return jsonify(errno=RET.PARAMERR,errmsg='游标参数错误')
+        cursor_values = (sort_value, last_id)
+    try:
+        houses = pagination.seek(list_query(), getattr(House, sort_field), House.id, descending, cursor_values)\
+            .limit(constants.HOUSE_LIST_PAGE_CAPACITY + 1).all()
+        # 多查询出的一条数据说明还有下一页
+        has_next = len(houses) > constants.HOUSE_LIST_PAGE_CAPACITY
+        houses = houses[:constants.HOUSE_LIST_PAGE_CAPACITY]
+        houses_dict_list = House.to_basic_dict_list(houses)
+        if start_date and end_date:
+            add_houses_amount(houses_dict_list, start_date, end_date)
+        # 总条数缓存一段时间,房屋变化时随列表缓存一起删除
+        total_count = cache.read_through(count_key, constants.HOUSE_LIST_COUNT_REDIS_EXPIRES,
+                                         lambda: str(list_query().order_by(None).count()),
+                                         tags=('houses_list',))
+    except Exception as e:
+        current_app.logger.error(e)
+        return jsonify(errno=RET.DBERR,errmsg='查询房屋列表信息失败')
+    # 构造下一页的游标
+    next_cursor = ''
+    if has_next:
+        last_house = houses[-1]
+        next_cursor = pagination.encode_cursor(sort_key, getattr(last_house, sort_field), last_house.id)
+    return jsonify(errno=RET.OK,errmsg='OK',data={'houses':houses_dict_list,'next_cursor':next_cursor,
+                                                   'total_count':int(total_count)})
@@ -0,0 +1,342 @@
+# coding=utf-8
+
+
+# 导入蓝图对象api
+from . import api
+# 导入数据库实例
+from ehome import constants,db
+# 导入flask内置的模块或方法
+from flask import current_app,jsonify,request,g
+# 导入模型类
+from ehome.models import House,HousePriceRule,Order
+# 导入自定义的状态码
+from ehome.utils.response_code import RET
+# 导入登陆验证装饰器
+from ehome.utils.commons import login_required
+# 导入房屋可预订日期索引
+from ehome.utils import availability
+# 导入redis分布式锁
+from ehome.utils import redis_lock
+# 导入游标分页
+from ehome.utils import pagination
+# 导入按天计价的报价
+from ehome.utils import pricing
+
+# 导入sqlalchemy的关联查询
+from sqlalchemy.orm import contains_eager
+# 导入datetime模块,对日期参数进行格式化
+import datetime
+# 导入time模块,等待房屋锁
+import time
+
+
+def wait_lock(lock_key):
+    """
+    获取预订房屋的分布式锁,同一房屋的预订请求依次检查日期冲突和保存订单
+    :return: 锁的令牌,在等待时间内没有获取到锁时返回None
+    """
+    deadline = time.time() + constants.HOUSE_BOOKING_LOCK_WAIT_SECONDS
+    while True:
+        token = redis_lock.acquire(lock_key, constants.HOUSE_BOOKING_LOCK_EXPIRES)
+        if token is not None or time.time() >= deadline:
+            return token
+        time.sleep(constants.HOUSE_BOOKING_LOCK_POLL_INTERVAL)
+
+
+@api.route('/orders',methods=['POST'])
+@login_required
+def save_order():
+    """
+    保存订单:获取参数/校验参数/查询数据/保存数据/返回结果
+    1/获取参数,user_id,house_id,start_date,end_date
+    2/校验参数的完整性,对日期进行格式化,开始日期不能早于今天,并且必须小于等于结束日期,计算预订天数
+    days = (end_date - start_date).days + 1
+    3/查询房屋是否存在,房东不能预订自己的房屋,预订天数需要满足房屋的最少和最多入住天数
+    4/通过房屋可预订日期索引预先判断日期冲突,有冲突直接返回,不需要加锁
+    5/获取房屋的redis分布式锁,同一房屋的预订依次处理,减少对数据库行锁的争用
+    6/结束之前的事务,在新的事务中对房屋加行锁,再通过房屋编号和日期的联合索引判断是否有冲突的订单,
+    redis锁超时后同一房屋的预订仍然由行锁依次处理,保证订单的日期不会重叠
+    7/按房屋的价格规则计算订单总价,保存订单,提交后订单占用的日期同步到可预订日期索引中,再释放锁
+    8/返回结果,需要返回订单id
+    :return:
+    """
+    # 获取参数user_id
+    user_id = g.user_id
+    # 获取post请求的订单参数
+    order_data = request.get_json()
+    # 检验参数的存在
+    if not order_data:
+        return jsonify(errno=RET.PARAMERR,errmsg='参数错误')
+    # 房屋编号
+    house_id = order_data.get('house_id')
+    # 入住日期
+    start_date_str = order_data.get('start_date')
+    # 离开日期
+    end_date_str = order_data.get('end_date')
+    # 校验参数的完整性
+    if not all([house_id,start_date_str,end_date_str]):
+        return jsonify(errno=RET.PARAMERR,errmsg='参数缺失')
+    # 对日期进行格式化
+    try:
+        start_date = datetime.datetime.strptime(start_date_str,'%Y-%m-%d')
+        end_date = datetime.datetime.strptime(end_date_str,'%Y-%m-%d')
+    except Exception as e:
+        current_app.logger.error(e)
+        return jsonify(errno=RET.PARAMERR,errmsg='日期格式错误')
+    # 开始日期必须小于等于结束日期,至少预订1天
+    if start_date > end_date:
+        return jsonify(errno=RET.PARAMERR,errmsg='日期格式错误')
+    # 不能预订今天之前的日期
+    if start_date.date() < datetime.date.today():
+        return jsonify(errno=RET.PARAMERR,errmsg='入住日期不能早于今天')
+    days = (end_date - start_date).days + 1
+    # 查询房屋是否存在
+    try:
+        house = House.query.get(house_id)
+    except Exception as e:
+        current_app.logger.error(e)
+        return jsonify(errno=RET.DBERR,errmsg='查询房屋数据失败')
+    # 校验查询结果
+    if not house:
+        return jsonify(errno=RET.NODATA,errmsg='房屋不存在')
+    # 房东不能预订自己的房屋
+    if house.user_id == user_id:
+        return jsonify(errno=RET.ROLEERR,errmsg='不能预订自己的房屋')
+    # 预订天数需要满足房屋的入住天数要求,最多入住天数为0表示不限制
+    if days < house.min_days or (house.max_days and days > house.max_days):
+        return jsonify(errno=RET.PARAMERR,errmsg='入住天数不符合房屋要求')
+    # 通过可预订日期索引预先判断,已被占用的日期直接返回,不需要加锁和查询订单
+    try:
+        if availability.find_busy_houses([house.id], start_date, end_date):
+            return jsonify(errno=RET.DATAERR,errmsg='房屋已被预订')
+    except Exception as e:
+        current_app.logger.error(e)
+    # 获取房屋的分布式锁
+    lock_key = 'house_booking_lock_%s' % house.id
+    try:
+        token = wait_lock(lock_key)
+    except Exception as e:
+        current_app.logger.error(e)
+        return jsonify(errno=RET.DBERR,errmsg='预订房屋失败')
+    if token is None:
+        return jsonify(errno=RET.REQERR,errmsg='预订的人数过多,请稍后重试')
+    try:
+        # 结束之前查询房屋的事务,新的事务先对房屋加行锁,之后查询订单的快照晚于上一个预订的提交
+        try:
+            db.session.commit()
+            house = House.query.with_for_update().filter_by(id=house_id).first()
+        except Exception as e:
+            current_app.logger.error(e)
+            db.session.rollback()
+            return jsonify(errno=RET.DBERR,errmsg='查询房屋数据失败')
+        if not house:
+            return jsonify(errno=RET.NODATA,errmsg='房屋不存在')
+        # 在行锁内查询数据库,判断日期区间内是否有占用房屋的订单
+        try:
+            conflict_count = Order.query_conflicts(house.id, start_date, end_date).count()
+        except Exception as e:
+            current_app.logger.error(e)
+            db.session.rollback()
+            return jsonify(errno=RET.DBERR,errmsg='查询订单数据失败')
+        if conflict_count > 0:
+            db.session.rollback()
+            return jsonify(errno=RET.DATAERR,errmsg='房屋已被预订')
+        # 按房屋的价格规则计算订单总价
+        try:
+            rules = HousePriceRule.for_houses([house.id])
+        except Exception as e:
+            current_app.logger.error(e)
+            db.session.rollback()
+            return jsonify(errno=RET.DBERR,errmsg='查询价格规则失败')
+        _, _, amount = pricing.quote(house.id, house.price or 0, rules, start_date.date(), end_date.date())
+        # 保存订单数据
+        order = Order()
+        order.user_id = user_id
+        order.house_id = house.id
+        order.landlord_id = house.user_id
+        order.begin_date = start_date
+        order.end_date = end_date
+        order.days = days
+        order.house_price = house.price
+        order.amount = amount
+        order.status = 'WAIT_ACCEPT'
+        # 提交数据到数据库
+        try:
+            db.session.add(order)
+            db.session.commit()
+        except Exception as e:
+            current_app.logger.error(e)
+            # 提交数据发生异常需要进行回滚
+            db.session.rollback()
+            return jsonify(errno=RET.DBERR,errmsg='保存订单失败')
+    finally:
+        # 订单提交或回滚后行锁已经释放,再释放redis锁
+        try:
+            redis_lock.release(lock_key, token)
+        except Exception as e:
+            current_app.logger.error(e)
+    # 返回结果
+    return jsonify(errno=RET.OK,errmsg='OK',data={'order_id':order.id})
+
+
+@api.route('/user/orders',methods=['GET'])
+@login_required
+def get_user_orders():
+    """
+    获取用户的订单信息
+    1/获取参数,user_id,用户的身份role,custom为房客,landlord为房东
+    2/房客查询自己下的订单,房东通过订单中的房屋主人编号查询自己发布的房屋的订单,
+    两者都按(用户编号,下单时间)索引倒序读取,不需要文件排序
+    3/订单按照创建时间倒序排列,房屋的标题和图片在同一个join查询中获取,不再逐个懒加载
+    4/调用模型类的to_dict(),获取订单信息
+    5/返回结果
+    6/使用游标分页,按(下单时间,订单编号)定位,每页constants.ORDER_LIST_PAGE_CAPACITY条,
+    未传入cursor或者为空字符串时返回第一页,返回结果中的next_cursor为空字符串表示没有下一页
+    :return:
+    """
+    # 获取参数
+    user_id = g.user_id
+    role = request.args.get('role','')
+    cursor = request.args.get('cursor','') # 游标参数,默认查询第一页
+    # 校验用户的身份
+    if role not in ('custom','landlord'):
+        return jsonify(errno=RET.PARAMERR,errmsg='用户身份错误')
+    # 解析游标,游标中包含用户身份,下单时间和订单编号
+    cursor_values = None
+    if cursor:
+        try:
+            cursor_role, create_time, last_id = pagination.decode_cursor(cursor)
+        except Exception as e:
+            current_app.logger.error(e)
+            return jsonify(errno=RET.PARAMERR,errmsg='游标参数错误')
+        # 游标必须和当前的用户身份一致
+        if cursor_role != role:
+            return jsonify(errno=RET.PARAMERR,errmsg='游标参数错误')
+        cursor_values = (create_time, last_id)
+    try:
+        # 关联房屋表,只加载订单信息需要的房屋字段
+        orders = Order.query.join(House,Order.house_id == House.id)\
+            .options(contains_eager(Order.house).load_only('title','index_image_url','index_image_card_url'))
+        if role == 'landlord':
+            # 房东查询自己发布的房屋的订单
+            orders = orders.filter(Order.landlord_id == user_id)
+        else:
+            # 房客查询自己下的订单
+            orders = orders.filter(Order.user_id == user_id)
+        # 多查询一条判断是否还有下一页
+        orders = pagination.seek(orders, Order.create_time, Order.id, True, cursor_values)\
+            .limit(constants.ORDER_LIST_PAGE_CAPACITY + 1).all()
+    except Exception as e:
+        current_app.logger.error(e)
+        return jsonify(errno=RET.DBERR,errmsg='查询订单信息失败')
+    # 构造下一页的游标,没有下一页时为空字符串
+    next_cursor = ''
+    if len(orders) > constants.ORDER_LIST_PAGE_CAPACITY:
+        orders = orders[:constants.ORDER_LIST_PAGE_CAPACITY]
+        next_cursor = pagination.encode_cursor(role, orders[-1].create_time, orders[-1].id)
+    # 返回结果
+    return jsonify(errno=RET.OK,errmsg='OK',data={'orders':[order.to_dict() for order in orders],
+                                                   'next_cursor':next_cursor})
+
+
+@api.route('/orders/<int:order_id>/status',methods=['PUT'])
+@login_required
+def accept_reject_order(order_id):
+    """
+    房东接单或拒单
+    1/获取参数,user_id,action为accept接单或reject拒单,拒单时需要reason拒单原因
+    2/查询订单并加行锁,订单必须是待接单状态,并且预订的是当前用户的房屋,
+    行锁保证超时取消订单和接单不会同时修改同一订单,已被取消的订单查询不到
+    3/项目没有支付环节,接单后订单状态直接改为待评价,拒单后订单状态改为已拒单,保存拒单原因,拒单后释放占用的日期
+    4/提交数据到数据库
+    5/返回结果
+    :return:
+    """
+    # 获取参数
+    user_id = g.user_id
+    req_data = request.get_json()
+    if not req_data:
+        return jsonify(errno=RET.PARAMERR,errmsg='参数错误')
+    action = req_data.get('action')
+    # 校验操作类型
+    if action not in ('accept','reject'):
+        return jsonify(errno=RET.PARAMERR,errmsg='参数错误')
+    # 拒单时需要拒单原因
+    reason = req_data.get('reason')
+    if action == 'reject' and not reason:
+        return jsonify(errno=RET.PARAMERR,errmsg='缺少拒单原因')
+    # 查询待接单的订单并加行锁,房屋主人必须是当前用户
+    try:
+        order = Order.query.filter(Order.id == order_id,Order.status == 'WAIT_ACCEPT',Order.landlord_id == user_id)\
+            .with_for_update().first()
+    except Exception as e:
+        current_app.logger.error(e)
+        return jsonify(errno=RET.DBERR,errmsg='查询订单数据失败')
+    # 校验查询结果
+    if not order:
+        return jsonify(errno=RET.NODATA,errmsg='订单不存在')
+    # 修改订单状态
+    if action == 'accept':
+        order.status = 'WAIT_COMMENT'
+    else:
+        order.status = 'REJECTED'
+        order.comment = reason
+    # 提交数据到数据库
+    try:
+        db.session.add(order)
+        db.session.commit()
+    except Exception as e:
+        current_app.logger.error(e)
+        db.session.rollback()
+        return jsonify(errno=RET.DBERR,errmsg='保存订单状态失败')
+    # 返回结果
+    return jsonify(errno=RET.OK,errmsg='OK')
+
+
+@api.route('/orders/<int:order_id>/comment',methods=['PUT'])
+@login_required
+def save_order_comment(order_id):
+    """
+    房客评价订单
+    1/获取参数,user_id,comment评价内容
+    2/查询订单,订单必须是待评价状态,并且是当前用户下的订单
+    3/订单状态改为已完成,保存评价内容,房屋的成交量加1
+    4/提交数据到数据库,成交量变化后同步更新首页房屋排行
+    5/返回结果
+    :return:
+    """
+    # 获取参数
+    user_id = g.user_id
+    req_data = request.get_json()
+    if not req_data:
+        return jsonify(errno=RET.PARAMERR,errmsg='参数错误')
+    comment = req_data.get('comment')
+    if not comment:
+        return jsonify(errno=RET.PARAMERR,errmsg='参数缺失')
+    # 查询待评价的订单
+    try:
+        order = Order.query.filter(Order.id == order_id,Order.user_id == user_id,
+                                   Order.status == 'WAIT_COMMENT').first()
+    except Exception as e:
+        current_app.logger.error(e)
+        return jsonify(errno=RET.DBERR,errmsg='查询订单数据失败')
+    # 校验查询结果
+    if not order:
+        return jsonify(errno=RET.NODATA,errmsg='订单不存在')
+    # 保存评价,订单完成
+    order.status = 'COMPLETE'
+    order.comment = comment
+    # 房屋的成交量加1,在数据库中计算,避免并发评价时丢失更新
+    house = order.house
+    house.order_count = House.order_count + 1
+    # 提交数据到数据库
+    try:
+        db.session.add(order)
+        db.session.add(house)
+        db.session.commit()
+    except Exception as e:
+        current_app.logger.error(e)
+        db.session.rollback()
+        return jsonify(errno=RET.DBERR,errmsg='保存订单评价失败')
+    # 返回结果
+    return jsonify(errno=RET.OK,errmsg='OK')
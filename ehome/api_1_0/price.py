@@ -0,0 +1,162 @@
+# coding=utf-8
+
+
+# 导入蓝图对象api
+from . import api
+# 导入数据库实例
+from ehome import constants,db
+# 导入flask内置的模块或方法
+from flask import current_app,jsonify,request,g
+# 导入模型类
+from ehome.models import House,HousePriceRule
+# 导入自定义的状态码
+from ehome.utils.response_code import RET
+# 导入登陆验证装饰器
+from ehome.utils.commons import login_required
+# 导入按天计价的报价
+from ehome.utils import pricing
+
+# 导入datetime模块,对日期参数进行格式化
+import datetime
+# 导入re模块,校验星期几的格式
+import re
+
+
+def parse_price_rule(rule_data):
+    """
+    校验一条价格规则的参数,构造价格规则对象,价格与房屋单价一致,前端使用元为单位,数据库中存储的是分
+    :return: 价格规则对象,参数错误时抛出ValueError
+    """
+    rule = HousePriceRule()
+    rule.kind = rule_data.get('kind')
+    if rule.kind not in pricing.RULE_KINDS:
+        raise ValueError('unknown price rule kind: %r' % rule.kind)
+    if rule.kind == 'WEEKDAY':
+        rule.weekdays = rule_data.get('weekdays')
+        # 7位只包含0和1的字符串,至少适用一天
+        if not re.match(r'^[01]{7}$', rule.weekdays or '') or '1' not in rule.weekdays:
+            raise ValueError('invalid weekdays: %r' % rule.weekdays)
+        rule.price = int(float(rule_data.get('price'))*100)
+    elif rule.kind == 'SEASON':
+        rule.begin_date = datetime.datetime.strptime(rule_data.get('begin_date'),'%Y-%m-%d').date()
+        rule.end_date = datetime.datetime.strptime(rule_data.get('end_date'),'%Y-%m-%d').date()
+        if rule.begin_date > rule.end_date:
+            raise ValueError('begin_date is after end_date')
+        rule.price = int(float(rule_data.get('price'))*100)
+    else:
+        rule.min_days = int(rule_data.get('min_days'))
+        rule.discount = int(rule_data.get('discount'))
+        if rule.min_days < 1 or not 1 <= rule.discount <= 100:
+            raise ValueError('invalid long stay rule: %s days, %s%%' % (rule.min_days, rule.discount))
+    if rule.price is not None and rule.price < 0:
+        raise ValueError('negative price: %s' % rule.price)
+    return rule
+
+
+@api.route('/houses/<int:house_id>/price_rules',methods=['GET'])
+def get_house_price_rules(house_id):
+    """
+    获取房屋的价格规则
+    1/查询房屋的价格规则,按设置的先后顺序排列
+    2/调用模型类的to_dict(),返回结果
+    :return:
+    """
+    try:
+        rules = HousePriceRule.for_houses([house_id])
+    except Exception as e:
+        current_app.logger.error(e)
+        return jsonify(errno=RET.DBERR,errmsg='查询价格规则失败')
+    return jsonify(errno=RET.OK,errmsg='OK',data={'rules':[rule.to_dict() for rule in rules]})
+
+
+@api.route('/houses/<int:house_id>/price_rules',methods=['PUT'])
+@login_required
+def save_house_price_rules(house_id):
+    """
+    设置房屋的价格规则
+    1/获取参数,user_id,rules价格规则列表,列表中靠后的规则优先
+    2/校验参数,规则数量不能超过constants.HOUSE_PRICE_RULE_MAX_COUNT,逐条校验规则
+    3/查询房屋是否存在,只有房屋主人可以设置
+    4/删除房屋原有的规则,按顺序保存新的规则,在同一个事务中提交
+    5/返回结果
+    :return:
+    """
+    # 获取参数
+    user_id = g.user_id
+    rules_data = request.get_json()
+    # 检验参数的存在
+    if not rules_data or not isinstance(rules_data.get('rules'), list):
+        return jsonify(errno=RET.PARAMERR,errmsg='参数错误')
+    if len(rules_data['rules']) > constants.HOUSE_PRICE_RULE_MAX_COUNT:
+        return jsonify(errno=RET.PARAMERR,errmsg='价格规则过多')
+    # 逐条校验价格规则
+    try:
+        rules = [parse_price_rule(rule_data) for rule_data in rules_data['rules']]
+    except Exception as e:
+        current_app.logger.error(e)
+        return jsonify(errno=RET.PARAMERR,errmsg='价格规则参数错误')
+    # 查询房屋是否存在
+    try:
+        house = House.query.get(house_id)
+    except Exception as e:
+        current_app.logger.error(e)
+        return jsonify(errno=RET.DBERR,errmsg='查询房屋数据失败')
+    if not house:
+        return jsonify(errno=RET.NODATA,errmsg='房屋不存在')
+    # 只有房屋主人可以设置价格规则
+    if house.user_id != user_id:
+        return jsonify(errno=RET.ROLEERR,errmsg='只能设置自己房屋的价格')
+    # 替换房屋原有的价格规则
+    try:
+        HousePriceRule.query.filter(HousePriceRule.house_id == house_id).delete(synchronize_session=False)
+        for rule in rules:
+            rule.house_id = house_id
+            db.session.add(rule)
+        db.session.commit()
+    except Exception as e:
+        current_app.logger.error(e)
+        # 提交数据发生异常需要进行回滚
+        db.session.rollback()
+        return jsonify(errno=RET.DBERR,errmsg='保存价格规则失败')
+    # 返回结果
+    return jsonify(errno=RET.OK,errmsg='OK',data={'rules':[rule.to_dict() for rule in rules]})
+
+
+@api.route('/houses/<int:house_id>/quote',methods=['GET'])
+def get_house_quote(house_id):
+    """
+    获取房屋在日期区间的报价
+    1/获取参数,sd入住日期,ed离开日期,格式为YYYY-MM-DD
+    2/校验参数,开始日期必须小于等于结束日期,天数不能超过constants.HOUSE_QUOTE_MAX_DAYS
+    3/查询房屋和房屋的价格规则
+    4/调用pricing.quote()计算每日单价,长租折扣和总价
+    5/返回结果,价格的单位为分
+    :return:
+    """
+    # 获取参数
+    start_date_str = request.args.get('sd','')
+    end_date_str = request.args.get('ed','')
+    # 对日期进行格式化
+    try:
+        start_date = datetime.datetime.strptime(start_date_str,'%Y-%m-%d').date()
+        end_date = datetime.datetime.strptime(end_date_str,'%Y-%m-%d').date()
+    except Exception as e:
+        current_app.logger.error(e)
+        return jsonify(errno=RET.PARAMERR,errmsg='日期格式错误')
+    # 开始日期必须小于等于结束日期,天数不能超过constants.HOUSE_QUOTE_MAX_DAYS
+    days = (end_date - start_date).days + 1
+    if not 1 <= days <= constants.HOUSE_QUOTE_MAX_DAYS:
+        return jsonify(errno=RET.PARAMERR,errmsg='日期格式错误')
+    # 查询房屋和房屋的价格规则
+    try:
+        house = House.query.get(house_id)
+        rules = HousePriceRule.for_houses([house_id]) if house else []
+    except Exception as e:
+        current_app.logger.error(e)
+        return jsonify(errno=RET.DBERR,errmsg='查询房屋数据失败')
+    if not house:
+        return jsonify(errno=RET.NODATA,errmsg='房屋不存在')
+    # 计算报价
+    prices, discount, amount = pricing.quote(house.id, house.price or 0, rules, start_date, end_date)
+    # 返回结果
+    return jsonify(errno=RET.OK,errmsg='OK',data={'days':days,'prices':prices,'discount':discount,'amount':amount})
@@ -13,8 +13,8 @@ from ehome.utils.commons import  login_required
 from . import api
 # 导入正则模块
 import re
-# 导入七牛云接口
-from ehome.utils.image_storage import storage
+# 导入图片存储和图片处理
+from ehome.utils import image_storage, image_processing
 # 导入数据库实例
 from ehome import db, constants
 
@@ -102,7 +102,7 @@ def set_avatar_url():
     设置用户头像信息
     1. 获取参数，avatar, user_id,request.filter.get('avatar')
     2. 检验参数存在
-    3. 读取图片数据，data= avatar.read()
+    3. 上传的图片在解析请求数据时写入临时文件并限制大小，在进程池中生成各尺寸的头像
     4. 调用七牛云接口，上传用户头像
     5. 保存用户头像信息到数据库
     6. 拼接用户头像图片的完整路径，七牛云外链域名+图片文件名
@@ -115,18 +115,28 @@ def set_avatar_url():
     # 校验参数不存在
     if not avatar:
         return jsonify(errno=RET.PARAMERR, errmsg='图片未上传')
-    # 读取图片数据
-    avatar_data = avatar.read()
+    # 在进程池中生成各尺寸的头像
+    try:
+        variants = image_processing.make_variants(avatar)
+    except IOError as e:
+        current_app.logger.error(e)
+        return jsonify(errno=RET.PARAMERR, errmsg='图片格式错误')
+    except Exception as e:
+        current_app.logger.error(e)
+        return jsonify(errno=RET.SERVERERR, errmsg='图片处理失败')
+    # 头像不需要最大尺寸的版本
+    variants.pop('full', None)
     # 调用七牛云接口，上传用户头像
     try:
-        image_name = storage(avatar_data)
+        image_names = image_processing.store_variants(variants)
     except Exception as e:
         current_app.logger.error(e)
         return jsonify(errno=RET.THIRDERR, errmsg='上传头像失败')
+    image_name = image_names['card']
     # 保存用户头像数据
     try:
         # 使用update更新用户信息
-        User.query.filter_by(id=user_id).update({'avatar_url':image_name})
+        User.query.filter_by(id=user_id).update({'avatar_url': image_name, 'avatar_thumb_url': image_names['thumb']})
         # 提交数据
         db.session.commit()
     except Exception as e:
@@ -136,7 +146,7 @@ def set_avatar_url():
         return jsonify(errno=RET.DBERR, errmsg='保存用户头像数据异常')
 
     # 拼接头像的完整路径
-    image_url = constants.QINIU_DOMIN_PREFIX + image_name
+    image_url = image_storage.image_url(image_name)
     # 返回数据
     return  jsonify(errno=RET.OK, errmsg='OK', data={'avatar_url':image_url})
 
@@ -4,14 +4,14 @@
 from flask import current_app, jsonify, make_response, request,session
 # 导入蓝图api
 from . import api
-# 导入captcha扩展包，生成图片验证码
-from ehome.utils.captcha.captcha import captcha
+# 导入预先生成的图片验证码池
+from ehome.utils.captcha import pool as captcha_pool
 # 导入redis数据库实例
 from ehome import redis_store, constants, db
 # 导入自定义的状态码
 from ehome.utils.response_code import RET
-# 导入云通讯接口，实现发送短信
-from ehome.utils import sms
+# 导入短信发送队列，由后台进程调用云通讯接口发送短信
+from ehome.utils import sms_queue
 # 导入数据库模型类
 from ehome.models import User
 
@@ -26,14 +26,14 @@ import random
 def generate_image_code(image_code_id):
     """
     生成图片验证码
-    1. 调用captcha 扩展包生成图片验证码，name,text, image
+    1. 从预先生成的验证码池中取出图片验证码，text, image，验证码池由后台进程补充
     2. 在服务器保存图片验证码内容，在缓存redis数据库中存储
     3. 使用响应对象返回前端图片验证码
     :param image_code_id:
     :return:
     """
-    # 生成图片验证码，调用captcha 扩展包
-    name, text, image = captcha.generate_captcha()
+    # 从验证码池中取出图片验证码，池为空时当场生成
+    text, image = captcha_pool.pop()
     # 在服务器redis缓存中存储图片验证码的内容，指定过期时间
     try:
         redis_store.setex('ImageCode_'+ image_code_id, constants.IMAGE_CODE_REDIS_EXPIRES, text)
@@ -66,9 +66,8 @@ def send_sms_code(mobile):
     7. 比较图片验证码：统一转成小写比较图片验证码内容是否一致
     8. 生成短信码： 使用random 模块随机数
     9. 在本地保存短信验证码内容，判断用户是否已注册
-    10. 调用云通讯发送信息： 使用异常进行处理
-    11. 保存云通讯的发送结果，判断是否发送成功
-    12. 返回前端结果
+    10. 提交发送短信的任务到短信发送队列，由后台进程调用云通讯发送，失败时自动重试
+    11. 返回前端结果
 
     :param modile: 
     :return: 
@@ -120,22 +119,13 @@ def send_sms_code(mobile):
     #     if user is not None:
     #         return jsonify(errno=RET.DATAEXIST, errmsg='手机号已注册')
 
-    # 发送短信，调用云通讯接口
+    # 发送短信，提交到短信发送队列，由后台进程调用云通讯接口，不在请求中等待云通讯的响应
     try:
-        # 实例化对象
-        ccp = sms.CCP()
-        # 调用云通讯发送短信方法
-        result = ccp.send_template_sms(mobile,[sms_code,constants.SMS_CODE_REDIS_EXPIRES/60],1)
+        sms_queue.enqueue(mobile, [sms_code, constants.SMS_CODE_REDIS_EXPIRES/60], 1)
     except Exception as e:
         current_app.logger.error(e)
-        return jsonify(errno=RET.THIRDERR, errmsg='发送短信异常')
-    # 判断发送结果
-    # if result ==0:
-    # 表达式判断，变量写在后面
-    if 0 == result:
-        return jsonify(errno=RET.OK, errmsg= '发送成功')
-    else:
-        return jsonify(errno=RET.THIRDERR, errmsg='发送失败')
+        return jsonify(errno=RET.DBERR, errmsg='提交短信任务失败')
+    return jsonify(errno=RET.OK, errmsg= '发送成功')
 
 
 # 注册
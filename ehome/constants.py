@@ -1,5 +1,7 @@
 # -*- coding:utf-8 -*-
 
+import datetime
+
 
 # 图片验证码Redis有效期， 单位：秒
 IMAGE_CODE_REDIS_EXPIRES = 300
@@ -16,8 +18,14 @@ AREA_INFO_REDIS_EXPIRES = 7200
 # 首页展示最多的房屋数量
 HOME_PAGE_MAX_HOUSES = 5
 
-# 首页房屋数据的Redis缓存时间，单位：秒
-HOME_PAGE_DATA_REDIS_EXPIRES = 7200
+# 重建首页房屋排行的分布式锁有效期，单位：毫秒
+HOUSE_RANK_LOCK_EXPIRES = 10000
+
+# 没有设置主图片的房屋时，空排行标记的有效期，期间首页不再查询mysql重建排行，单位：秒
+HOUSE_RANK_EMPTY_EXPIRES = 60
+
+# 房屋基本信息片段的Redis缓存时间，单位：秒
+HOUSE_BASIC_REDIS_EXPIRES = 7200
 
 # 房屋详情页展示的评论最大数
 HOUSE_DETAIL_COMMENT_DISPLAY_COUNTS = 30
@@ -25,8 +33,125 @@ HOUSE_DETAIL_COMMENT_DISPLAY_COUNTS = 30
 # 房屋详情页面数据Redis缓存时间，单位：秒
 HOUSE_DETAIL_REDIS_EXPIRE_SECOND = 7200
 
+# 房屋不存在时房屋详情的Redis缓存时间，单位：秒
+HOUSE_DETAIL_NODATA_REDIS_EXPIRES = 60
+
+# 已存在房屋编号的布隆过滤器的位数，1M字节，约87万个房屋时误判率为1%
+HOUSE_BLOOM_BITS = 1 << 23
+
+# 布隆过滤器中每个房屋编号对应的位数
+HOUSE_BLOOM_HASHES = 7
+
+# 重建布隆过滤器的分布式锁和重建标记的有效期，单位：毫秒
+HOUSE_BLOOM_LOCK_EXPIRES = 60000
+
 # 房屋列表页面每页显示条目数
 HOUSE_LIST_PAGE_CAPACITY = 2
 
+# 订单列表游标分页每页显示条目数
+ORDER_LIST_PAGE_CAPACITY = 10
+
 # 房屋列表页面Redis缓存时间，单位：秒
 HOUSE_LIST_REDIS_EXPIRES = 7200
+
+# 房屋可预订日期索引的起始日期，位图的第0位对应这一天
+HOUSE_CALENDAR_EPOCH = datetime.date(2017, 1, 1)
+
+# 房屋日历接口一次最多查询的月数
+HOUSE_CALENDAR_MAX_MONTHS = 12
+
+# 缓存过期后仍可作为旧数据返回的时间，单位：秒
+CACHE_STALE_SECONDS = 300
+
+# 重建缓存的分布式锁有效期，单位：毫秒
+CACHE_LOCK_EXPIRES = 10000
+
+# 未抢到锁且没有旧数据时，等待其他进程重建缓存的最长时间，单位：秒
+CACHE_LOCK_WAIT_SECONDS = 1
+
+# 等待缓存重建时轮询的间隔，单位：秒
+CACHE_LOCK_POLL_INTERVAL = 0.05
+
+# 缓存命中统计写入redis的间隔，单位：秒
+CACHE_STATS_FLUSH_INTERVAL = 10
+
+# 写入缓存列表时每条RPUSH命令包含的元素个数
+CACHE_LIST_PUSH_BATCH = 1000
+
+# 房屋列表游标分页的总条数Redis缓存时间，单位：秒
+HOUSE_LIST_COUNT_REDIS_EXPIRES = 600
+
+# 预先生成的图片验证码池的容量
+CAPTCHA_POOL_SIZE = 500
+
+# 补充图片验证码池的间隔，单位：秒
+CAPTCHA_POOL_REFILL_INTERVAL = 1
+
+# 发送短信任务的最大尝试次数
+SMS_SEND_MAX_ATTEMPTS = 5
+
+# 发送短信失败后重试的初始等待时间，之后每次翻倍，单位：秒
+SMS_SEND_RETRY_DELAY = 2
+
+# 发送短信失败后重试的最长等待时间，单位：秒
+SMS_SEND_RETRY_MAX_DELAY = 60
+
+# 短信发送进程等待任务的超时时间，超时后检查到期的重试任务，单位：秒
+SMS_QUEUE_POLL_TIMEOUT = 1
+
+# 发送进程取出任务后必须在这段时间内确认，否则认为进程已退出，任务重新进入队列，单位：秒
+SMS_QUEUE_CLAIM_SECONDS = 120
+
+# 七牛上传凭证的有效期，单位：秒
+QINIU_UPLOAD_TOKEN_EXPIRES = 3600
+
+# 七牛上传凭证在过期前多久重新签发，单位：秒
+QINIU_UPLOAD_TOKEN_MARGIN = 300
+
+# 上传文件到七牛的超时时间，单位：秒
+QINIU_UPLOAD_TIMEOUT = 30
+
+# 本地存储图片的浏览器缓存时间，文件名即内容哈希，内容不会变化，单位：秒
+IMAGE_CACHE_MAX_AGE = 31536000
+
+# 上传图片生成的各尺寸版本，(名称, 最大宽度, 最大高度)，full用于详情页，card用于列表和首页，thumb用于头像等小图
+IMAGE_VARIANTS = (("full", 1600, 1200), ("card", 640, 480), ("thumb", 160, 160))
+
+# 图片版本的编码格式，Pillow不支持时使用JPEG
+IMAGE_VARIANT_FORMAT = "WEBP"
+
+# 图片版本的编码质量
+IMAGE_VARIANT_QUALITY = 80
+
+# 处理上传图片的进程数
+IMAGE_PROCESS_POOL_SIZE = 2
+
+# 等待图片处理结果的最长时间，单位：秒
+IMAGE_PROCESS_TIMEOUT = 30
+
+# 预订房屋时房屋分布式锁的有效期，单位：毫秒
+HOUSE_BOOKING_LOCK_EXPIRES = 5000
+
+# 预订房屋时等待其他请求释放房屋锁的最长时间，单位：秒
+HOUSE_BOOKING_LOCK_WAIT_SECONDS = 3
+
+# 等待房屋锁时轮询的间隔，单位：秒
+HOUSE_BOOKING_LOCK_POLL_INTERVAL = 0.01
+
+# 订单等待房东接单的超时时间，超时后自动取消，单位：秒
+ORDER_WAIT_ACCEPT_EXPIRES = 86400
+
+# 每批取消的超时订单数
+ORDER_EXPIRY_BATCH = 100
+
+# 检查超时订单的间隔，单位：秒
+ORDER_EXPIRY_POLL_INTERVAL = 1
+
+# 取出的超时订单在处理失败后重新被取出的等待时间，单位：秒
+ORDER_EXPIRY_CLAIM_SECONDS = 60
+
+# 每个房屋最多可以设置的价格规则数
+HOUSE_PRICE_RULE_MAX_COUNT = 20
+
+# 报价的最多天数，列表页的日期区间超过该天数时不计算总价
+HOUSE_QUOTE_MAX_DAYS = 366
@@ -15,13 +15,103 @@
 import md5
 import base64
 import datetime
-import urllib2
+import httplib
 import json
+import socket
+import threading
+import Queue
 from xmltojson import xmltojson
-from xml.dom import minidom 
+from xml.dom import minidom
+
+
+# 没有收到状态行时BadStatusLine.line的值，不同的python 2.7版本不同
+_NO_STATUS_LINE = ("''", "No status line received - the server has closed the connection")
+
+
+class ConnectionPool:
+    """同一服务器的keep-alive连接池，线程安全，连接用完后放回池中供下一次请求复用"""
+
+    def __init__(self, protocol, host, port, timeout, size):
+        self.protocol = protocol
+        self.host = host
+        self.port = int(port)
+        self.timeout = timeout
+        self._idle = Queue.LifoQueue(size)
+
+    def _connect(self):
+        if self.protocol == 'https':
+            return httplib.HTTPSConnection(self.host, self.port, timeout=self.timeout)
+        return httplib.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def request(self, method, url, body, headers):
+        """
+        发送请求，返回(状态码, 响应包体)
+        复用的空闲连接在服务器响应前被关闭时，换一个新连接重试一次；
+        其他异常不重试，避免服务器已处理的请求(例如发送短信)被重复提交
+        """
+        # httplib只会把str类型的包体和包头合并发送，unicode包体会分两次发送，在keep-alive连接上触发延迟确认
+        if isinstance(body, unicode):
+            body = body.encode('utf-8')
+        try:
+            conn = self._idle.get_nowait()
+        except Queue.Empty:
+            return self._send(self._connect(), method, url, body, headers, False)
+        return self._send(conn, method, url, body, headers, True)
+
+    def _send(self, conn, method, url, body, headers, reused):
+        """
+        在一个连接上发送请求，成功后把可复用的连接放回池中
+        :param reused: 是否为复用的空闲连接，只有复用的连接出错时才换新连接重试
+        """
+        try:
+            conn.request(method, url, body, headers)
+        except socket.error as error:
+            conn.close()
+            # 请求没有发出去，服务器不会处理
+            if reused and not isinstance(error, socket.timeout):
+                return self._send(self._connect(), method, url, body, headers, False)
+            raise
+        except httplib.HTTPException:
+            conn.close()
+            raise
+        try:
+            res = conn.getresponse()
+            data = res.read()
+        except httplib.BadStatusLine as error:
+            conn.close()
+            # 没有收到任何响应数据连接就断开，是服务器关闭了空闲连接
+            if reused and error.line in _NO_STATUS_LINE:
+                return self._send(self._connect(), method, url, body, headers, False)
+            raise
+        except (httplib.HTTPException, socket.error):
+            conn.close()
+            raise
+        if res.will_close:
+            conn.close()
+        else:
+            try:
+                self._idle.put_nowait(conn)
+            except Queue.Full:
+                conn.close()
+        return res.status, data
+
+
+# 所有REST实例共用的连接池，键为(协议, 地址, 端口, 超时时间)
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(protocol, host, port, timeout, size):
+    key = (protocol, host, str(port), timeout)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(protocol, host, port, timeout, size)
+        return pool
+
 
 class REST:
-    
+
     AccountSid=''
     AccountToken=''
     AppId=''
@@ -31,11 +121,14 @@ class REST:
     VoIPPassword=''
     ServerIP=''
     ServerPort=''
+    Protocol='https' #请求协议，对接本地测试服务器时可设为http
     SoftVersion=''
     Iflog=True #是否打印日志
     Batch=''  #时间戳
     BodyType = 'xml'#包体格式，可填值：json 、xml
-    
+    Timeout=10 #连接和读取响应的超时时间，单位：秒
+    PoolSize=10 #每个服务器保持的空闲连接数
+
      # 初始化
      # @param serverIP       必选参数    服务器地址
      # @param serverPort     必选参数    服务器端口
@@ -45,33 +138,41 @@ class REST:
         self.ServerIP = ServerIP;
         self.ServerPort = ServerPort;
         self.SoftVersion = SoftVersion;
-    
-    
+        self._signed = None
+
+
     # 设置主帐号
     # @param AccountSid  必选参数    主帐号
     # @param AccountToken  必选参数    主帐号Token
-    
+
     def setAccount(self,AccountSid,AccountToken):
       self.AccountSid = AccountSid;
-      self.AccountToken = AccountToken;   
-    
+      self.AccountToken = AccountToken;
+
 
     # 设置子帐号
-    # 
+    #
     # @param SubAccountSid  必选参数    子帐号
     # @param SubAccountToken  必选参数    子帐号Token
- 
+
     def setSubAccount(self,SubAccountSid,SubAccountToken):
       self.SubAccountSid = SubAccountSid;
-      self.SubAccountToken = SubAccountToken;    
+      self.SubAccountToken = SubAccountToken;
 
     # 设置应用ID
-    # 
+    #
     # @param AppId  必选参数    应用ID
 
     def setAppId(self,AppId):
-       self.AppId = AppId; 
-    
+       self.AppId = AppId;
+
+    # 设置超时时间
+    #
+    # @param Timeout  必选参数    连接和读取响应的超时时间，单位：秒
+
+    def setTimeout(self,Timeout):
+       self.Timeout = Timeout;
+
     def log(self,url,body,data):
         print('这是请求的URL：')
         print (url);
@@ -80,106 +181,99 @@ class REST:
         print('这是响应包体:')
         print (data);
         print('********************************')
-    
 
-    # 创建子账号
-    # @param friendlyName   必选参数      子帐号名称
-    def CreateSubAccount(self, friendlyName):
-        
-        self.accAuth()
-        nowdate = datetime.datetime.now()
-        self.Batch = nowdate.strftime("%Y%m%d%H%M%S")
-        #生成sig
-        signature = self.AccountSid + self.AccountToken + self.Batch;
-        sig = md5.new(signature).hexdigest().upper()
+    # 生成签名
+    # 同一秒内使用同一帐号的请求时间戳相同，直接复用上一次计算的sig和auth
+    # @param sid  必选参数    主帐号或子帐号
+    # @param token  必选参数    帐号对应的Token
+    def sign(self, sid, token):
+        batch = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+        signed = self._signed
+        if signed is None or signed[0] != (sid, token, batch):
+            #生成sig
+            sig = md5.new(sid + token + batch).hexdigest().upper()
+            #生成auth
+            auth = base64.encodestring(sid + ":" + batch).strip()
+            signed = self._signed = ((sid, token, batch), sig, auth)
+        self.Batch = batch
+        return signed[1], signed[2]
+
+    # 发送请求，所有接口共用的请求和响应处理
+    # @param path  必选参数    帐号之后的接口路径
+    # @param body  可选参数    包体，为None时发送GET请求
+    # @param sub  可选参数    是否使用子帐号签名
+    # @param query  可选参数    sig之后的查询参数
+    # @param bodyType  可选参数    包体格式，默认为BodyType
+    # @param contentType  可选参数    包体类型，默认根据包体格式设置
+    # @param parser  可选参数    解析xml响应使用的xmltojson方法名
+    def request(self, path, body=None, sub=False, query='', bodyType=None, contentType=None, parser='main'):
+        if sub:
+            sid, token, account = self.SubAccountSid, self.SubAccountToken, "/SubAccounts/"
+        else:
+            sid, token, account = self.AccountSid, self.AccountToken, "/Accounts/"
+        sig, auth = self.sign(sid, token)
         #拼接URL
-        url = "https://"+self.ServerIP + ":" + self.ServerPort + "/" + self.SoftVersion + "/Accounts/" + self.AccountSid + "/SubAccounts?sig=" + sig
-        #生成auth
-        src = self.AccountSid + ":" + self.Batch;
-        auth = base64.encodestring(src).strip()
-        req = urllib2.Request(url)
-        self.setHttpHeader(req)
-        req.add_header("Authorization", auth)
-        #xml格式
-        body ='''<?xml version="1.0" encoding="utf-8"?><SubAccount><appId>%s</appId>\
-            <friendlyName>%s</friendlyName>\
-            </SubAccount>\
-            '''%(self.AppId, friendlyName)
-        
-        if self.BodyType == 'json': 
-            #json格式
-            body = '''{"friendlyName": "%s", "appId": "%s"}'''%(friendlyName,self.AppId)
+        uri = "/" + self.SoftVersion + account + sid + path + "?sig=" + sig + query
+        url = self.Protocol + "://" + self.ServerIP + ":" + self.ServerPort + uri
+        bodyType = bodyType or self.BodyType
+        headers = self.httpHeaders(bodyType)
+        headers["Authorization"] = auth
+        if contentType:
+            headers["Content-Type"] = contentType
         data=''
-        req.add_data(body)
         try:
-            res = urllib2.urlopen(req);
-            data = res.read()
-            res.close()
-        
-            if self.BodyType=='json':
+            pool = get_pool(self.Protocol, self.ServerIP, self.ServerPort, self.Timeout, self.PoolSize)
+            status, data = pool.request("GET" if body is None else "POST", uri, body, headers)
+            if status >= 400:
+                raise httplib.HTTPException("HTTP Error %s" % status)
+            if bodyType=='json':
                 #json格式
                 locations = json.loads(data)
             else:
                 #xml格式
                 xtj=xmltojson()
-                locations=xtj.main(data)
+                locations=getattr(xtj, parser)(data)
             if self.Iflog:
                 self.log(url,body,data)
             return locations
-        except Exception, error:
+        except Exception as error:
             if self.Iflog:
                 self.log(url,body,data)
             return {'172001':'网络错误'}
-    
+
+
+    # 创建子账号
+    # @param friendlyName   必选参数      子帐号名称
+    def CreateSubAccount(self, friendlyName):
+
+        self.accAuth()
+        #xml格式
+        body ='''<?xml version="1.0" encoding="utf-8"?><SubAccount><appId>%s</appId>\
+            <friendlyName>%s</friendlyName>\
+            </SubAccount>\
+            '''%(self.AppId, friendlyName)
+
+        if self.BodyType == 'json':
+            #json格式
+            body = '''{"friendlyName": "%s", "appId": "%s"}'''%(friendlyName,self.AppId)
+        return self.request("/SubAccounts", body)
+
     #  获取子帐号
     # @param startNo  可选参数    开始的序号，默认从0开始
     # @param offset 可选参数     一次查询的最大条数，最小是1条，最大是100条
     def getSubAccounts(self, startNo,offset):
 
         self.accAuth()
-        nowdate = datetime.datetime.now()
-        self.Batch = nowdate.strftime("%Y%m%d%H%M%S")
-        #生成sig
-        signature = self.AccountSid + self.AccountToken + self.Batch;
-        sig = md5.new(signature).hexdigest().upper()
-        #拼接URL
-        url = "https://"+self.ServerIP + ":" + self.ServerPort + "/" + self.SoftVersion + "/Accounts/" + self.AccountSid + "/GetSubAccounts?sig=" + sig
-        #生成auth
-        src = self.AccountSid + ":" + self.Batch;
-        auth = base64.encodestring(src).strip()
-        req = urllib2.Request(url)
-        self.setHttpHeader(req)
-        req.add_header("Authorization", auth)
         #xml格式
         body ='''<?xml version="1.0" encoding="utf-8"?><SubAccount><appId>%s</appId>\
             <startNo>%s</startNo><offset>%s</offset>\
             </SubAccount>\
             '''%(self.AppId, startNo, offset)
-        
-        if self.BodyType == 'json':   
-            #json格式 
+
+        if self.BodyType == 'json':
+            #json格式
             body = '''{"appId": "%s", "startNo": "%s", "offset": "%s"}'''%(self.AppId,startNo,offset)
-        data=''
-        req.add_data(body)
-        try:
-            res = urllib2.urlopen(req);
-            data = res.read()
-            res.close()
-        
-            if self.BodyType=='json':
-                #json格式
-                locations = json.loads(data)
-            else:
-                #xml格式
-                xtj=xmltojson()
-                locations=xtj.main(data)
-            if self.Iflog:
-                self.log(url,body,data)
-            return locations
-        except Exception, error:
-            if self.Iflog:
-                self.log(url,body,data)
-            return {'172001':'网络错误'}
+        return self.request("/GetSubAccounts", body)
 
     # 子帐号信息查询
     # @param friendlyName 必选参数   子帐号名称
@@ -187,51 +281,16 @@ class REST:
     def querySubAccount(self, friendlyName):
 
         self.accAuth()
-        nowdate = datetime.datetime.now()
-        self.Batch = nowdate.strftime("%Y%m%d%H%M%S")
-        #生成sig
-        signature = self.AccountSid + self.AccountToken + self.Batch;
-        sig = md5.new(signature).hexdigest().upper()
-        #拼接URL
-        url = "https://"+self.ServerIP + ":" + self.ServerPort + "/" + self.SoftVersion + "/Accounts/" + self.AccountSid + "/QuerySubAccountByName?sig=" + sig
-        #生成auth
-        src = self.AccountSid + ":" + self.Batch;
-        auth = base64.encodestring(src).strip()
-        req = urllib2.Request(url)
-        self.setHttpHeader(req)
-        
-        req.add_header("Authorization", auth)
-        
         #创建包体
         body ='''<?xml version="1.0" encoding="utf-8"?><SubAccount><appId>%s</appId>\
             <friendlyName>%s</friendlyName>\
             </SubAccount>\
             '''%(self.AppId, friendlyName)
-        if self.BodyType == 'json':   
-            
+        if self.BodyType == 'json':
+
             body = '''{"friendlyName": "%s", "appId": "%s"}'''%(friendlyName,self.AppId)
-        data=''
-        req.add_data(body)
-        try:
-            res = urllib2.urlopen(req);
-            data = res.read()
-            res.close()
-        
-            if self.BodyType=='json':
-                #json格式
-                locations = json.loads(data)
-            else:
-                #xml格式
-                xtj=xmltojson()
-                locations=xtj.main(data)
-            if self.Iflog:
-                self.log(url,body,data)
-            return locations
-        except Exception, error:
-            if self.Iflog:
-                self.log(url,body,data)
-            return {'172001':'网络错误'}
-        
+        return self.request("/QuerySubAccountByName", body)
+
     # 发送模板短信
     # @param to  必选参数     短信接收彿手机号码集合,用英文逗号分开
     # @param datas 可选参数    内容数据
@@ -239,67 +298,34 @@ class REST:
     def sendTemplateSMS(self, to,datas,tempId):
 
         self.accAuth()
-        nowdate = datetime.datetime.now()
-        self.Batch = nowdate.strftime("%Y%m%d%H%M%S")
-        #生成sig
-        signature = self.AccountSid + self.AccountToken + self.Batch;
-        sig = md5.new(signature).hexdigest().upper()
-        #拼接URL
-        url = "https://"+self.ServerIP + ":" + self.ServerPort + "/" + self.SoftVersion + "/Accounts/" + self.AccountSid + "/SMS/TemplateSMS?sig=" + sig
-        #生成auth
-        src = self.AccountSid + ":" + self.Batch;
-        auth = base64.encodestring(src).strip()
-        req = urllib2.Request(url)
-        self.setHttpHeader(req)
-        req.add_header("Authorization", auth)
         #创建包体
         b=''
         for a in datas:
             b+='<data>%s</data>'%(a)
-        
+
         body ='<?xml version="1.0" encoding="utf-8"?><TemplateSMS><datas>'+b+'</datas><to>%s</to><templateId>%s</templateId><appId>%s</appId>\
             </TemplateSMS>\
             '%(to, tempId,self.AppId)
-        if self.BodyType == 'json':   
+        if self.BodyType == 'json':
             # if this model is Json ..then do next code
             b='['
             for a in datas:
-                b+='"%s",'%(a) 
+                b+='"%s",'%(a)
             b+=']'
             body = '''{"to": "%s", "datas": %s, "templateId": "%s", "appId": "%s"}'''%(to,b,tempId,self.AppId)
-        req.add_data(body)
-        data=''
-        try:
-            res = urllib2.urlopen(req);
-            data = res.read()
-            res.close()
-        
-            if self.BodyType=='json':
-                #json格式
-                locations = json.loads(data)
-            else:
-                #xml格式
-                xtj=xmltojson()
-                locations=xtj.main(data)
-            if self.Iflog:
-                self.log(url,body,data)
-            return locations
-        except Exception, error:
-            if self.Iflog:
-                self.log(url,body,data)
-            return {'172001':'网络错误'}
+        return self.request("/SMS/TemplateSMS", body)
 
     # 双向回呼
     # @param fromPhone  必选参数   主叫电话号码
     # @param to 必选参数    被叫电话号码
-    # @param customerSerNum 可选参数    被叫侧显示的客服号码  
+    # @param customerSerNum 可选参数    被叫侧显示的客服号码
     # @param fromSerNum 可选参数    主叫侧显示的号码
-    # @param promptTone 可选参数    第三方自定义回拨提示音  
+    # @param promptTone 可选参数    第三方自定义回拨提示音
     # @param alwaysPlay 可选参数 是否一直播放提示音
     # @param terminalDtmf 可选参数 用于终止播放提示音的按键
-    # @param userData 可选参数    第三方私有数据  
+    # @param userData 可选参数    第三方私有数据
     # @param maxCallTime 可选参数    最大通话时长
-    # @param hangupCdrUrl 可选参数    实时话单通知地址	
+    # @param hangupCdrUrl 可选参数    实时话单通知地址
     # @param needBothCdr 可选参数 是否给主被叫发送话单
     # @param needRecord 可选参数 是否录音
     # @param countDownTime 可选参数 设置倒计时时间
@@ -308,49 +334,16 @@ class REST:
     def callBack(self,fromPhone,to,customerSerNum,fromSerNum,promptTone,alwaysPlay,terminalDtmf,userData,maxCallTime,hangupCdrUrl,needBothCdr,needRecord,countDownTime,countDownPrompt):
 
         self.subAuth()
-        nowdate = datetime.datetime.now()
-        self.Batch = nowdate.strftime("%Y%m%d%H%M%S")
-        #生成sig
-        signature = self.SubAccountSid + self.SubAccountToken + self.Batch;
-        sig = md5.new(signature).hexdigest().upper()
-        #拼接URL
-        url = "https://"+self.ServerIP + ":" + self.ServerPort + "/" + self.SoftVersion + "/SubAccounts/" + self.SubAccountSid + "/Calls/Callback?sig=" + sig
-        #生成auth
-        src = self.SubAccountSid + ":" + self.Batch;
-        auth = base64.encodestring(src).strip()
-        req = urllib2.Request(url)
-        self.setHttpHeader(req)
-        
-        req.add_header("Authorization", auth)
-        
         #创建包体
         body ='''<?xml version="1.0" encoding="utf-8"?><CallBack>\
             <from>%s</from><to>%s</to><customerSerNum>%s</customerSerNum><fromSerNum>%s</fromSerNum><promptTone>%s</promptTone><userData>%s</userData><maxCallTime>%s</maxCallTime><hangupCdrUrl>%s</hangupCdrUrl>\
             <alwaysPlay>%s</alwaysPlay><terminalDtmf>%s</terminalDtmf><needBothCdr>%s</needBothCdr><needRecord>%s</needRecord><countDownTime>%s</countDownTime><countDownPrompt>%s</countDownPrompt>\
             </CallBack>\
             '''%(fromPhone,to,customerSerNum,fromSerNum,promptTone,userData,maxCallTime,hangupCdrUrl,alwaysPlay,terminalDtmf,needBothCdr,needRecord,countDownTime,countDownPrompt)
-        if self.BodyType == 'json':   
+        if self.BodyType == 'json':
             body = '''{"from": "%s", "to": "%s","customerSerNum": "%s","fromSerNum": "%s","promptTone": "%s","userData": "%s","maxCallTime": "%s","hangupCdrUrl": "%s","alwaysPlay": "%s","terminalDtmf": "%s","needBothCdr": "%s","needRecord": "%s","countDownTime": "%s","countDownPrompt": "%s"}'''%(fromPhone,to,customerSerNum,fromSerNum,promptTone,userData,maxCallTime,hangupCdrUrl,alwaysPlay,terminalDtmf,needBothCdr,needRecord,countDownTime,countDownPrompt)
-        req.add_data(body)
-        data=''
-        try:
-            res = urllib2.urlopen(req);
-            data = res.read()
-            res.close()
-            if self.BodyType=='json':
-                #json格式
-                locations = json.loads(data)
-            else:
-                #xml格式
-                xtj=xmltojson()
-                locations=xtj.main(data)
-            if self.Iflog:
-                self.log(url,body,data)
-            return locations
-        except Exception, error:
-            if self.Iflog:
-                self.log(url,body,data)
-            return {'172001':'网络错误'}       
+        return self.request("/Calls/Callback", body, sub=True)
+
     # 外呼通知
     # @param to 必选参数    被叫号码
     # @param mediaName 可选参数    语音文件名称，格式 wav。与mediaTxt不能同时为空。当不为空时mediaTxt属性失效。
@@ -368,50 +361,16 @@ class REST:
     def landingCall(self,to,mediaName,mediaTxt,displayNum,playTimes,respUrl,userData,maxCallTime,speed,volume,pitch,bgsound):
 
         self.accAuth()
-        nowdate = datetime.datetime.now()
-        self.Batch = nowdate.strftime("%Y%m%d%H%M%S")
-        #生成sig
-        signature = self.AccountSid + self.AccountToken + self.Batch;
-        sig = md5.new(signature).hexdigest().upper()
-        #拼接URL
-        url = "https://"+self.ServerIP + ":" + self.ServerPort + "/" + self.SoftVersion + "/Accounts/" + self.AccountSid + "/Calls/LandingCalls?sig=" + sig
-        #生成auth
-        src = self.AccountSid + ":" + self.Batch;
-        auth = base64.encodestring(src).strip()
-        req = urllib2.Request(url)
-        self.setHttpHeader(req)
-        req.add_header("Authorization", auth)
-        
         #创建包体
         body ='''<?xml version="1.0" encoding="utf-8"?><LandingCall>\
             <to>%s</to><mediaName>%s</mediaName><mediaTxt>%s</mediaTxt><appId>%s</appId><displayNum>%s</displayNum>\
             <playTimes>%s</playTimes><respUrl>%s</respUrl><userData>%s</userData><maxCallTime>%s</maxCallTime><speed>%s</speed>
             <volume>%s</volume><pitch>%s</pitch><bgsound>%s</bgsound></LandingCall>\
             '''%(to, mediaName,mediaTxt,self.AppId,displayNum,playTimes,respUrl,userData,maxCallTime,speed,volume,pitch,bgsound)
-        if self.BodyType == 'json':   
+        if self.BodyType == 'json':
             body = '''{"to": "%s", "mediaName": "%s","mediaTxt": "%s","appId": "%s","displayNum": "%s","playTimes": "%s","respUrl": "%s","userData": "%s","maxCallTime": "%s","speed": "%s","volume": "%s","pitch": "%s","bgsound": "%s"}'''%(to, mediaName,mediaTxt,self.AppId,displayNum,playTimes,respUrl,userData,maxCallTime,speed,volume,pitch,bgsound)
-        req.add_data(body)
-        data=''
-        try:
-            res = urllib2.urlopen(req);
-            data = res.read()
-            res.close()
-        
-            if self.BodyType=='json':
-                #json格式
-                locations = json.loads(data)
-            else:
-                #xml格式
-                xtj=xmltojson()
-                locations=xtj.main(data)
-            if self.Iflog:
-                self.log(url,body,data)
-            return locations
-        except Exception, error:
-            if self.Iflog:
-                self.log(url,body,data)
-            return {'172001':'网络错误'}
-    
+        return self.request("/Calls/LandingCalls", body)
+
     # 语音验证码
     # @param verifyCode  必选参数   验证码内容，为数字和英文字母，不区分大小写，长度4-8位
     # @param playTimes  可选参数   播放次数，1－3次
@@ -424,51 +383,16 @@ class REST:
     def voiceVerify(self,verifyCode,playTimes,to,displayNum,respUrl,lang,userData):
 
         self.accAuth()
-        nowdate = datetime.datetime.now()
-        self.Batch = nowdate.strftime("%Y%m%d%H%M%S")
-        #生成sig
-        signature = self.AccountSid + self.AccountToken + self.Batch;
-        sig = md5.new(signature).hexdigest().upper()
-        #拼接URL
-        url = "https://"+self.ServerIP + ":" + self.ServerPort + "/" + self.SoftVersion + "/Accounts/" + self.AccountSid + "/Calls/VoiceVerify?sig=" + sig
-        #生成auth
-        src = self.AccountSid + ":" + self.Batch;
-        auth = base64.encodestring(src).strip()
-        req = urllib2.Request(url)
-        self.setHttpHeader(req)
-        
-        req.add_header("Authorization", auth)
-        
         #创建包体
         body ='''<?xml version="1.0" encoding="utf-8"?><VoiceVerify>\
             <appId>%s</appId><verifyCode>%s</verifyCode><playTimes>%s</playTimes><to>%s</to><respUrl>%s</respUrl>\
             <displayNum>%s</displayNum><lang>%s</lang><userData>%s</userData></VoiceVerify>\
             '''%(self.AppId,verifyCode,playTimes,to,respUrl,displayNum,lang,userData)
-        if self.BodyType == 'json':   
-            # if this model is Json ..then do next code 
+        if self.BodyType == 'json':
+            # if this model is Json ..then do next code
             body = '''{"appId": "%s", "verifyCode": "%s","playTimes": "%s","to": "%s","respUrl": "%s","displayNum": "%s","lang": "%s","userData": "%s"}'''%(self.AppId,verifyCode,playTimes,to,respUrl,displayNum,lang,userData)
-        req.add_data(body)
-        data=''
-        try:
-            res = urllib2.urlopen(req);
-            data = res.read()
-            res.close()
-        
-            if self.BodyType=='json':
-                #json格式
-                locations = json.loads(data)
-            else:
-                #xml格式
-                xtj=xmltojson()
-                locations=xtj.main(data)
-            if self.Iflog:
-                self.log(url,body,data)
-            return locations
-        except Exception, error:
-            if self.Iflog:
-                self.log(url,body,data)
-            return {'172001':'网络错误'}
-    
+        return self.request("/Calls/VoiceVerify", body)
+
     # IVR外呼
     # @param number  必选参数     待呼叫号码，为Dial节点的属性
     # @param userdata 可选参数    用户数据，在<startservice>通知中返回，只允许填写数字字符，为Dial节点的属性
@@ -477,21 +401,6 @@ class REST:
     def ivrDial(self,number,userdata,record):
 
         self.accAuth()
-        nowdate = datetime.datetime.now()
-        self.Batch = nowdate.strftime("%Y%m%d%H%M%S")
-        #生成sig
-        signature = self.AccountSid + self.AccountToken + self.Batch;
-        sig = md5.new(signature).hexdigest().upper()
-        #拼接URL
-        url = "https://"+self.ServerIP + ":" + self.ServerPort + "/" + self.SoftVersion + "/Accounts/" + self.AccountSid + "/ivr/dial?sig=" + sig
-        #生成auth
-        src = self.AccountSid + ":" + self.Batch;
-        auth = base64.encodestring(src).strip()
-        req = urllib2.Request(url)
-        req.add_header("Accept", "application/xml")
-        req.add_header("Content-Type", "application/xml;charset=utf-8")
-        req.add_header("Authorization", auth)
-        
         #创建包体
         body ='''<?xml version="1.0" encoding="utf-8"?>
                 <Request>
@@ -499,358 +408,96 @@ class REST:
                     <Dial number="%s"  userdata="%s" record="%s"></Dial>
                 </Request>
             '''%(self.AppId,number,userdata,record)
-        req.add_data(body)
-        data=''
-        try:
-            res = urllib2.urlopen(req);
-            data = res.read()
-            res.close()
-            xtj=xmltojson()
-            locations=xtj.main(data)
-            if self.Iflog:
-                self.log(url,body,data)
-            return locations
-        except Exception, error:
-            if self.Iflog:
-                self.log(url,body,data)
-            return {'172001':'网络错误'}
-        
-    
+        #IVR接口只支持xml格式
+        return self.request("/ivr/dial", body, bodyType='xml')
+
+
     # 话单下载
     # @param date   必选参数    day 代表前一天的数据（从00:00 – 23:59），目前只支持按天查询
     # @param keywords  可选参数     客户的查询条件，由客户自行定义并提供给云通讯平台。默认不填忽略此参数
     def billRecords(self,date,keywords):
 
         self.accAuth()
-        nowdate = datetime.datetime.now()
-        self.Batch = nowdate.strftime("%Y%m%d%H%M%S")
-        #生成sig
-        signature = self.AccountSid + self.AccountToken + self.Batch;
-        sig = md5.new(signature).hexdigest().upper()
-        #拼接URL
-        url = "https://"+self.ServerIP + ":" + self.ServerPort + "/" + self.SoftVersion + "/Accounts/" + self.AccountSid + "/BillRecords?sig=" + sig
-        #生成auth
-        src = self.AccountSid + ":" + self.Batch;
-        auth = base64.encodestring(src).strip()
-        req = urllib2.Request(url)
-        self.setHttpHeader(req)
-        req.add_header("Authorization", auth)
-        
         #创建包体
         body ='''<?xml version="1.0" encoding="utf-8"?><BillRecords>\
             <appId>%s</appId><date>%s</date><keywords>%s</keywords>\
             </BillRecords>\
             '''%(self.AppId,date,keywords)
-        if self.BodyType == 'json':   
-            # if this model is Json ..then do next code 
+        if self.BodyType == 'json':
+            # if this model is Json ..then do next code
             body = '''{"appId": "%s", "date": "%s","keywords": "%s"}'''%(self.AppId,date,keywords)
-        req.add_data(body)
-        data=''
-        try:
-            res = urllib2.urlopen(req);
-            data = res.read()
-            
-            res.close()
-        
-            if self.BodyType=='json':
-                #json格式
-                locations = json.loads(data)
-            else:
-                #xml格式
-                xtj=xmltojson()
-                locations=xtj.main(data)
-            if self.Iflog:
-                self.log(url,body,data)
-            return locations
-        except Exception, error:
-            if self.Iflog:
-                self.log(url,body,data)
-            return {'172001':'网络错误'}
-    
+        return self.request("/BillRecords", body)
+
     # 主帐号信息查询
 
     def queryAccountInfo(self):
 
         self.accAuth()
-        nowdate = datetime.datetime.now()
-        self.Batch = nowdate.strftime("%Y%m%d%H%M%S")
-        #生成sig
-        signature = self.AccountSid + self.AccountToken + self.Batch;
-        sig = md5.new(signature).hexdigest().upper()
-        #拼接URL
-        url = "https://"+self.ServerIP + ":" + self.ServerPort + "/" + self.SoftVersion + "/Accounts/" + self.AccountSid + "/AccountInfo?sig=" + sig
-        #生成auth
-        src = self.AccountSid + ":" + self.Batch;
-        auth = base64.encodestring(src).strip()
-        req = urllib2.Request(url)
-        self.setHttpHeader(req)
-        body=''
-        req.add_header("Authorization", auth)
-        data=''
-        try:
-            res = urllib2.urlopen(req);
-            data = res.read()
-            res.close()
-        
-            if self.BodyType=='json':
-                #json格式
-                locations = json.loads(data)
-            else:
-                #xml格式
-                xtj=xmltojson()
-                locations=xtj.main(data)
-            if self.Iflog:
-                self.log(url,body,data)
-            return locations
-        except Exception, error:
-            if self.Iflog:
-                self.log(url,body,data)
-            return {'172001':'网络错误'}
-        
+        return self.request("/AccountInfo")
+
     # 短信模板查询
-    # @param templateId  必选参数   模板Id，不带此参数查询全部可用模板 
+    # @param templateId  必选参数   模板Id，不带此参数查询全部可用模板
 
     def QuerySMSTemplate(self,templateId):
 
         self.accAuth()
-        nowdate = datetime.datetime.now()
-        self.Batch = nowdate.strftime("%Y%m%d%H%M%S")
-        #生成sig
-        signature = self.AccountSid + self.AccountToken + self.Batch;
-        sig = md5.new(signature).hexdigest().upper()
-        #拼接URL
-        url = "https://"+self.ServerIP + ":" + self.ServerPort + "/" + self.SoftVersion + "/Accounts/" + self.AccountSid + "/SMS/QuerySMSTemplate?sig=" + sig
-        #生成auth
-        src = self.AccountSid + ":" + self.Batch;
-        auth = base64.encodestring(src).strip()
-        req = urllib2.Request(url)
-        self.setHttpHeader(req)
-        
-        req.add_header("Authorization", auth)
-        
         #创建包体
         body ='''<?xml version="1.0" encoding="utf-8"?><Request>\
             <appId>%s</appId><templateId>%s</templateId></Request>
             '''%(self.AppId,templateId)
-        if self.BodyType == 'json':   
-            # if this model is Json ..then do next code 
+        if self.BodyType == 'json':
+            # if this model is Json ..then do next code
             body = '''{"appId": "%s", "templateId": "%s"}'''%(self.AppId,templateId)
-        req.add_data(body)
-        data=''
-        try:
-            res = urllib2.urlopen(req);
-            data = res.read()
-            res.close()
-        
-            if self.BodyType=='json':
-                #json格式
-                locations = json.loads(data)
-            else:
-                #xml格式
-                xtj=xmltojson()
-                locations=xtj.main2(data)
-            if self.Iflog:
-                self.log(url,body,data)
-            return locations
-        except Exception, error:
-            if self.Iflog:
-                self.log(url,body,data)
-            return {'172001':'网络错误'}
-        
+        return self.request("/SMS/QuerySMSTemplate", body, parser='main2')
+
     # 取消回拨
     # @param callSid   必选参数    一个由32个字符组成的电话唯一标识符
     # @param type      可选参数     0： 任意时间都可以挂断电话；1 ：被叫应答前可以挂断电话，其他时段返回错误代码；2： 主叫应答前可以挂断电话，其他时段返回错误代码；默认值为0。
     def CallCancel(self,callSid,type):
 
         self.accAuth()
-        nowdate = datetime.datetime.now()
-        self.Batch = nowdate.strftime("%Y%m%d%H%M%S")
-        #生成sig
-        signature = self.SubAccountSid + self.SubAccountToken + self.Batch;
-        sig = md5.new(signature).hexdigest().upper()
-        #拼接URL
-        url = "https://"+self.ServerIP + ":" + self.ServerPort + "/" + self.SoftVersion + "/SubAccounts/" + self.SubAccountSid + "/Calls/CallCancel?sig=" + sig
-        #生成auth
-        src = self.SubAccountSid + ":" + self.Batch;
-        auth = base64.encodestring(src).strip()
-        req = urllib2.Request(url)
-        self.setHttpHeader(req)
-        req.add_header("Authorization", auth)
-        
         #创建包体
         body ='''<?xml version="1.0" encoding="utf-8"?><CallCancel>\
             <appId>%s</appId><callSid>%s</callSid><type>%s</type>\
             </CallCancel>\
             '''%(self.AppId,callSid,type)
-        if self.BodyType == 'json':   
-            # if this model is Json ..then do next code 
+        if self.BodyType == 'json':
+            # if this model is Json ..then do next code
             body = '''{"appId": "%s", "callSid": "%s","type": "%s"}'''%(self.AppId,callSid,type)
-        req.add_data(body)
-        data=''
-        try:
-            res = urllib2.urlopen(req);
-            data = res.read()
-            
-            res.close()
-        
-            if self.BodyType=='json':
-                #json格式
-                locations = json.loads(data)
-            else:
-                #xml格式
-                xtj=xmltojson()
-                locations=xtj.main(data)
-            if self.Iflog:
-                self.log(url,body,data)
-            return locations
-        except Exception, error:
-            if self.Iflog:
-                self.log(url,body,data)
-            return {'172001':'网络错误'}
-    
+        return self.request("/Calls/CallCancel", body, sub=True)
+
     # 呼叫结果查询
     # @param callsid   必选参数    呼叫ID
 
     def CallResult(self,callSid):
 
         self.accAuth()
-        nowdate = datetime.datetime.now()
-        self.Batch = nowdate.strftime("%Y%m%d%H%M%S")
-        #生成sig
-        signature = self.AccountSid + self.AccountToken + self.Batch;
-        sig = md5.new(signature).hexdigest().upper()
-        #拼接URL
-        url = "https://"+self.ServerIP + ":" + self.ServerPort + "/" + self.SoftVersion + "/Accounts/" + self.AccountSid + "/CallResult?sig=" + sig + "&callsid=" + callSid
-        #生成auth
-        src = self.AccountSid + ":" + self.Batch;
-        auth = base64.encodestring(src).strip()
-        req = urllib2.Request(url)
-        self.setHttpHeader(req)
-        body=''
-        req.add_header("Authorization", auth)
-        data=''
-        try:
-            res = urllib2.urlopen(req);
-            data = res.read()
-            res.close()
-        
-            if self.BodyType=='json':
-                #json格式
-                locations = json.loads(data)
-            else:
-                #xml格式
-                xtj=xmltojson()
-                locations=xtj.main(data)
-            if self.Iflog:
-                self.log(url,body,data)
-            return locations
-        except Exception, error:
-            if self.Iflog:
-                self.log(url,body,data)
-            return {'172001':'网络错误'}
-        
+        return self.request("/CallResult", query="&callsid=" + callSid)
+
     # 呼叫状态查询
     # @param callid   必选参数    一个由32个字符组成的电话唯一标识符
-    # @param action      可选参数     查询结果通知的回调url地址 
+    # @param action      可选参数     查询结果通知的回调url地址
     def QueryCallState (self,callid,action):
 
         self.accAuth()
-        nowdate = datetime.datetime.now()
-        self.Batch = nowdate.strftime("%Y%m%d%H%M%S")
-        #生成sig
-        signature = self.AccountSid + self.AccountToken + self.Batch;
-        sig = md5.new(signature).hexdigest().upper()
-        #拼接URL
-        url = "https://"+self.ServerIP + ":" + self.ServerPort + "/" + self.SoftVersion + "/Accounts/" + self.AccountSid + "/ivr/call?sig=" + sig + "&callid=" + callid
-        #生成auth
-        src = self.AccountSid + ":" + self.Batch;
-        auth = base64.encodestring(src).strip()
-        req = urllib2.Request(url)
-        self.setHttpHeader(req)
-        req.add_header("Authorization", auth)
-        
         #创建包体
         body ='''<?xml version="1.0" encoding="utf-8"?><Request>\
             <Appid>%s</Appid><QueryCallState callid="%s" action="%s"/>\
             </Request>\
             '''%(self.AppId,callid,action)
-        if self.BodyType == 'json':   
-            # if this model is Json ..then do next code 
+        if self.BodyType == 'json':
+            # if this model is Json ..then do next code
             body = '''{"Appid":"%s","QueryCallState":{"callid":"%s","action":"%s"}}'''%(self.AppId,callid,action)
-        req.add_data(body)
-        data=''
-        try:
-            res = urllib2.urlopen(req);
-            data = res.read()
-            
-            res.close()
-        
-            if self.BodyType=='json':
-                #json格式
-                locations = json.loads(data)
-            else:
-                #xml格式
-                xtj=xmltojson()
-                locations=xtj.main(data)
-            if self.Iflog:
-                self.log(url,body,data)
-            return locations
-        except Exception, error:
-            if self.Iflog:
-                self.log(url,body,data)
-            return {'172001':'网络错误'}
-    
+        return self.request("/ivr/call", body, query="&callid=" + callid)
+
     # 语音文件上传
     # @param filename   必选参数    文件名
     # @param body      必选参数     二进制串
     def MediaFileUpload (self,filename,body):
 
         self.accAuth()
-        nowdate = datetime.datetime.now()
-        self.Batch = nowdate.strftime("%Y%m%d%H%M%S")
-        #生成sig
-        signature = self.AccountSid + self.AccountToken + self.Batch;
-        sig = md5.new(signature).hexdigest().upper()
-        #拼接URL
-        url = "https://"+self.ServerIP + ":" + self.ServerPort + "/" + self.SoftVersion + "/Accounts/" + self.AccountSid + "/Calls/MediaFileUpload?sig=" + sig + "&appid=" + self.AppId + "&filename=" + filename
-        #生成auth
-        src = self.AccountSid + ":" + self.Batch;
-        auth = base64.encodestring(src).strip()
-        req = urllib2.Request(url)
-        req.add_header("Authorization", auth)
-        if self.BodyType == 'json':
-            req.add_header("Accept", "application/json")
-            req.add_header("Content-Type", "application/octet-stream")
-            
-        else:
-            req.add_header("Accept", "application/xml")
-            req.add_header("Content-Type", "application/octet-stream")
-
-        
-        #创建包体        
-        req.add_data(body)
-
-
-        try:
-            res = urllib2.urlopen(req);
-            data = res.read()
-            
-            res.close()
-        
-            if self.BodyType=='json':
-                #json格式
-                locations = json.loads(data)
-            else:
-                #xml格式
-                xtj=xmltojson()
-                locations=xtj.main(data)
-            if self.Iflog:
-                self.log(url,body,data)
-            return locations
-        except Exception, error:
-            if self.Iflog:
-                self.log(url,body,data)
-            return {'172001':'网络错误'}
+        return self.request("/Calls/MediaFileUpload", body, query="&appid=" + self.AppId + "&filename=" + filename,
+                            contentType="application/octet-stream")
     
     #子帐号鉴权
     def subAuth(self):
@@ -907,12 +554,8 @@ class REST:
 
 
     #设置包头
-    def setHttpHeader(self,req):
-        if self.BodyType == 'json':
-            req.add_header("Accept", "application/json")
-            req.add_header("Content-Type", "application/json;charset=utf-8")
-            
+    def httpHeaders(self,bodyType):
+        if bodyType == 'json':
+            return {"Accept": "application/json", "Content-Type": "application/json;charset=utf-8"}
         else:
-            req.add_header("Accept", "application/xml")
-            req.add_header("Content-Type", "application/xml;charset=utf-8")
-    
\ No newline at end of file
+            return {"Accept": "application/xml", "Content-Type": "application/xml;charset=utf-8"}
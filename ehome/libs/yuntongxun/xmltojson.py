@@ -1,174 +1,70 @@
 # -*- coding: utf-8 -*-
 
-# python xml.etree.ElementTree
+# 把云通讯的xml响应转换为字典
+# 转换过程不保存任何状态，每次调用都返回新的字典，可以在多个线程中同时使用
 
-import os
-import xml.etree.ElementTree as ET
-from xml.dom import minidom
+try:
+    import xml.etree.cElementTree as ET
+except ImportError:
+    import xml.etree.ElementTree as ET
 
 
-class xmltojson:
-    # global var
-    # show log
-    SHOW_LOG = True
-    # XML file
-    XML_PATH = None
-    a={}
-    m=[]
-    
-    def get_root(self,path):
-        '''parse the XML file,and get the tree of the XML file
-        finally,return the root element of the tree.
-        if the XML file dose not exist,then print the information'''
-        #if os.path.exists(path):
-            #if SHOW_LOG:
-                #print('start to parse the file : [{}]'.format(path))
-        tree = ET.fromstring(path)
-        return tree
-        # else:
-            # print('the path [{}] dose not exist!'.format(path))
-    
-    def get_element_tag(self,element):
-        '''return the element tag if the element is not None.'''
-        if element is not None:
-            
-            return element.tag
-        else:
-            print('the element is None!')
-    
-    def get_element_attrib(self,element):
-        '''return the element attrib if the element is not None.'''
-        if element is not None:
-            
-            return element.attrib
-        else:
-            print('the element is None!')
-    
-    def get_element_text(self,element):
-        '''return the text of the element.'''
-        if element is not None:
-            return element.text
-        else:
-            print('the element is None!')
-    
-    def get_element_children(self,element):
-        '''return the element children if the element is not None.'''
-        if element is not None:
-            
-            return [c for c in element]
-        else:
-            print('the element is None!')
-    
-    def get_elements_tag(self,elements):
-        '''return the list of tags of element's tag'''
-        if elements is not None:
-            tags = []
-            for e in elements:
-                tags.append(e.tag)
-            return tags
-        else:
-            print('the elements is None!')
-    
-    def get_elements_attrib(self,elements):
-        '''return the list of attribs of element's attrib'''
-        if elements is not None:
-            attribs = []
-            for a in elements:
-                attribs.append(a.attrib)
-            return attribs
-        else:
-            print('the elements is None!')
-    
-    def get_elements_text(self,elements):
-        '''return the dict of element'''
-        if elements is not None:
-            text = []
-            for t in elements:
-                text.append(t.text)
-            return dict(zip(self.get_elements_tag(elements), text))
+def convert(xml, list_tag, renames=None):
+    '''parse the XML response in a single pass over the children of the root.
+    a child without sub elements becomes {tag: text}, a child with sub elements
+    becomes {tag: {sub tag: sub text}}. when the response has a totalCount,
+    every list_tag child is collected into a list.'''
+    root = ET.fromstring(xml)
+    has_total = root.find('totalCount') is not None
+    result = {}
+    for child in root:
+        fields = dict((element.tag, element.text) for element in child)
+        if not fields:
+            result[child.tag] = child.text
+        elif has_total and child.tag == list_tag:
+            result.setdefault(list_tag, []).append(fields)
+        elif renames and child.tag in renames:
+            result[renames[child.tag]] = fields
         else:
-            print('the elements is None!')
-    
-    
-    
-    def main(self,xml):
-        #root
-        root = self.get_root(xml)
-    
-        #children
-        children = self.get_element_children(root)
-
-        children_tags = self.get_elements_tag(children)
+            result[child.tag] = fields
+    return result
 
-        children_attribs = self.get_elements_attrib(children)
 
-        i=0
+class xmltojson:
 
-        #获取二级元素的每一个子节点的名称和值
-        for c in children:
-            p=0
-            c_children = self.get_element_children(c)
-            dict_text = self.get_elements_text(c_children)
-            if dict_text :
-                #print (children_tags[i])
-                if children_tags[i] =='TemplateSMS':
-                    self.a['templateSMS']=dict_text
-                else :
-                    if children_tags[i]=='SubAccount':
-                        k=0
-                        
-                        for x in children:
-                            if children_tags[k]=='totalCount':   
-                                self.m.append(dict_text)
-                                self.a['SubAccount']=self.m
-                                p=1
-                            k=k+1
-                        if p==0:
-                            self.a[children_tags[i]]=dict_text
-                    else:
-                        self.a[children_tags[i]]=dict_text
+    def main(self,xml):
+        # 模板短信的结果保存在templateSMS中，子帐号列表保存在SubAccount中
+        return convert(xml, 'SubAccount', {'TemplateSMS': 'templateSMS'})
 
-                
-            else:
-                self.a[children_tags[i]]=c.text
-            i=i+1
-        return self.a
-    
     def main2(self,xml):
-        #root
-        root = self.get_root(xml)
-    
-        #children
-        children = self.get_element_children(root)
-
-        children_tags = self.get_elements_tag(children)
-
-        children_attribs = self.get_elements_attrib(children)
+        # 短信模板列表保存在TemplateSMS中
+        return convert(xml, 'TemplateSMS')
 
-        i=0
 
-        #获取二级元素的每一个子节点的名称和值
-        for c in children:
-            p=0
-            c_children = self.get_element_children(c)
-            dict_text = self.get_elements_text(c_children)
-            if dict_text :
-                if children_tags[i] =='TemplateSMS':
-                    k=0
-                        
-                    for x in children:
-                        if children_tags[k]=='totalCount':   
-                            self.m.append(dict_text)
-                            self.a['TemplateSMS']=self.m
-                            p=1
-                        k=k+1
-                    if p==0:
-                        self.a[children_tags[i]]=dict_text
-                else:
-                    self.a[children_tags[i]]=dict_text
-                    
-            else:
-                self.a[children_tags[i]]=c.text
-            i=i+1
-        return self.a
+if __name__ == '__main__':
+    import timeit
 
+    # 发送模板短信、获取子帐号、查询短信模板的响应
+    payloads = [
+        ('main', '<?xml version="1.0" encoding="UTF-8"?><Response><statusCode>000000</statusCode>'
+                 '<TemplateSMS><dateCreated>20171105120000</dateCreated>'
+                 '<smsMessageSid>ff8080813c373cab013c94b0f0512345</smsMessageSid></TemplateSMS></Response>'),
+        ('main', '<?xml version="1.0" encoding="UTF-8"?><Response><statusCode>000000</statusCode>'
+                 '<totalCount>3</totalCount>' +
+                 ''.join('<SubAccount><subAccountSid>%032d</subAccountSid><subToken>%032d</subToken>'
+                         '<dateCreated>2017-11-05 12:00:00</dateCreated><voipAccount>8000000%d</voipAccount>'
+                         '<voipPwd>abcdefgh</voipPwd></SubAccount>' % (i, i, i) for i in range(3)) +
+                 '</Response>'),
+        ('main2', '<?xml version="1.0" encoding="UTF-8"?><Response><statusCode>000000</statusCode>'
+                  '<totalCount>2</totalCount>' +
+                  ''.join('<TemplateSMS><id>%d</id><dateCreated>2017-11-05 12:00:00</dateCreated>'
+                          '<dateUpdated>2017-11-05 12:00:00</dateUpdated><status>1</status>'
+                          '<title>template</title><body>code {1}, {2} minutes</body></TemplateSMS>' % i
+                          for i in range(2)) +
+                  '</Response>'),
+    ]
+    converter = xmltojson()
+    for method, payload in payloads:
+        parse = getattr(converter, method)
+        seconds = min(timeit.repeat(lambda: parse(payload), number=10000, repeat=3)) / 10000
+        print('%s %d bytes: %.1f us' % (method, len(payload), seconds * 1e6))
@@ -1,9 +1,17 @@
 # -*- coding:utf-8 -*-
 
 
+import json
+import logging
+import time
+
 from datetime import datetime
+from sqlalchemy import event
+from sqlalchemy.orm import Query, joinedload
+from sqlalchemy.orm.attributes import get_history
 from werkzeug.security import generate_password_hash, check_password_hash
-from ehome import constants
+from ehome import constants, redis_store
+from ehome.utils import availability, cache, house_bloom, house_rank, image_storage, order_expiry, pricing
 from . import db
 
 
@@ -26,8 +34,9 @@ class User(BaseModel, db.Model):
     real_name = db.Column(db.String(32))  # 真实姓名
     id_card = db.Column(db.String(20))  # 身份证号
     avatar_url = db.Column(db.String(128))  # 用户头像路径
+    avatar_thumb_url = db.Column(db.String(128))  # 用户头像缩略图路径
     houses = db.relationship("House", backref="user")  # 用户发布的房屋
-    orders = db.relationship("Order", backref="user")  # 用户下的订单
+    orders = db.relationship("Order", backref="user", foreign_keys="Order.user_id")  # 用户下的订单
 
     #通过装饰器property，把password方法提升为属性
     @property
@@ -51,7 +60,7 @@ class User(BaseModel, db.Model):
             "user_id": self.id,
             "name": self.name,
             "mobile": self.mobile,
-            "avatar": constants.QINIU_DOMIN_PREFIX + self.avatar_url if self.avatar_url else "",
+            "avatar": image_storage.image_url(self.avatar_url),
             "create_time": self.create_time.strftime("%Y-%m-%d %H:%M:%S")
         }
         return user_dict
@@ -96,12 +105,20 @@ class House(BaseModel, db.Model):
     """房屋信息"""
 
     __tablename__ = "ih_house_info"
+    __table_args__ = (
+        # 列表页默认按发布时间排序，发布时间字段来自模型基类
+        db.Index("ix_ih_house_info_create_time", "create_time"),
+        # 列表页按区域过滤后按发布时间、价格、成交量排序
+        db.Index("ix_ih_house_info_area_id_create_time", "area_id", "create_time"),
+        db.Index("ix_ih_house_info_area_id_price", "area_id", "price"),
+        db.Index("ix_ih_house_info_area_id_order_count", "area_id", "order_count"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)  # 房屋编号
     user_id = db.Column(db.Integer, db.ForeignKey("ih_user_profile.id"), nullable=False)  # 房屋主人的用户编号
     area_id = db.Column(db.Integer, db.ForeignKey("ih_area_info.id"), nullable=False)  # 归属地的区域编号
     title = db.Column(db.String(64), nullable=False)  # 标题
-    price = db.Column(db.Integer, default=0)  # 单价，单位：分
+    price = db.Column(db.Integer, default=0, index=True)  # 单价，单位：分
     address = db.Column(db.String(512), default="")  # 地址
     room_count = db.Column(db.Integer, default=1)  # 房间数目
     acreage = db.Column(db.Integer, default=0)  # 房屋面积
@@ -111,8 +128,9 @@ class House(BaseModel, db.Model):
     deposit = db.Column(db.Integer, default=0)  # 房屋押金
     min_days = db.Column(db.Integer, default=1)  # 最少入住天数
     max_days = db.Column(db.Integer, default=0)  # 最多入住天数，0表示不限制
-    order_count = db.Column(db.Integer, default=0)  # 预订完成的该房屋的订单数
+    order_count = db.Column(db.Integer, default=0, index=True)  # 预订完成的该房屋的订单数
     index_image_url = db.Column(db.String(256), default="")  # 房屋主图片的路径
+    index_image_card_url = db.Column(db.String(256), default="")  # 房屋主图片列表尺寸版本的路径
     facilities = db.relationship("Facility", secondary=house_facility)  # 房屋的设施
     images = db.relationship("HouseImage")  # 房屋的图片
     orders = db.relationship("Order", backref="house")  # 房屋的订单
@@ -124,22 +142,89 @@ class House(BaseModel, db.Model):
             "title": self.title,
             "price": self.price,
             "area_name": self.area.name,
-            "img_url": constants.QINIU_DOMIN_PREFIX + self.index_image_url if self.index_image_url else "",
+            "img_url": image_storage.image_url(self.index_image_card_url or self.index_image_url),
             "room_count": self.room_count,
             "order_count": self.order_count,
             "address": self.address,
-            "user_avatar": constants.QINIU_DOMIN_PREFIX + self.user.avatar_url if self.user.avatar_url else "",
+            "user_avatar": image_storage.image_url(self.user.avatar_thumb_url or self.user.avatar_url),
             "ctime": self.create_time.strftime("%Y-%m-%d")
         }
         return house_dict
 
+    @classmethod
+    def to_basic_dict_list(cls, houses):
+        """
+        批量将房屋基本信息转换为字典数据
+        区域和房屋主人随房屋一起查询，避免每个房屋单独懒加载，查询次数与房屋数量无关
+        :param houses: 房屋的查询对象或者房屋列表
+        """
+        if isinstance(houses, Query):
+            houses = houses.options(joinedload(cls.area), joinedload(cls.user)).all()
+            return [house.to_basic_dict() for house in houses]
+        # 已经查询出的房屋列表，一次性查出所有用到的区域和用户，放入会话的对象映射中，
+        # 之后访问house.area和house.user直接从映射中获取，不再发出查询
+        area_ids = set(house.area_id for house in houses)
+        user_ids = set(house.user_id for house in houses)
+        # 查询结果保存在局部变量中，序列化完成前不会被会话的弱引用映射回收
+        areas = Area.query.filter(Area.id.in_(area_ids)).all() if area_ids else []
+        users = User.query.filter(User.id.in_(user_ids)).all() if user_ids else []
+        return [house.to_basic_dict() for house in houses]
+
+    @classmethod
+    def cached_basic_json_list(cls, house_ids):
+        """
+        批量获取房屋基本信息的json字符串
+        优先从redis中的house_basic_<house_id>片段缓存一次读取，缓存中没有的房屋一起查询mysql后写回缓存
+        :param house_ids: 房屋编号列表
+        :return: 按house_ids顺序排列的json字符串列表，不存在的房屋不包含在内
+        """
+        if not house_ids:
+            return []
+        keys = ["house_basic_%s" % house_id for house_id in house_ids]
+        try:
+            values = redis_store.mget(keys)
+        except Exception as e:
+            logging.error(e)
+            values = [None] * len(keys)
+        missing_ids = [house_id for house_id, value in zip(house_ids, values) if value is None]
+        if missing_ids:
+            # 查询前读取片段的版本号，查询期间房屋被修改时不写回缓存
+            try:
+                read_versions = cache.versions(["house_basic_%s" % house_id for house_id in missing_ids],
+                                               ("house_basic",))
+            except Exception as e:
+                logging.error(e)
+                read_versions = None
+            built = {}
+            for house_dict in cls.to_basic_dict_list(cls.query.filter(cls.id.in_(missing_ids))):
+                built[house_dict["house_id"]] = json.dumps(house_dict)
+            try:
+                if read_versions is not None:
+                    cache.store_many((("house_basic_%s" % house_id, value) for house_id, value in built.items()),
+                                     constants.HOUSE_BASIC_REDIS_EXPIRES, tags=("house_basic",),
+                                     read_versions=read_versions)
+            except Exception as e:
+                logging.error(e)
+            values = [built.get(house_id) if value is None else value for house_id, value in zip(house_ids, values)]
+        return [value for value in values if value is not None]
+
+    @classmethod
+    def all_ids(cls):
+        """所有房屋编号，用于重建布隆过滤器"""
+        return [house_id for house_id, in db.session.query(cls.id)]
+
+    @classmethod
+    def query_full(cls, house_id):
+        """查询房屋详情需要的数据，房屋主人和房屋图片随房屋一起查出"""
+        return cls.query.options(joinedload(cls.user), joinedload(cls.images)).filter(cls.id == house_id).first()
+
     def to_full_dict(self):
-        """将详细信息转换为字典数据"""
+        """将详细信息转换为字典数据，房屋通过query_full()查询时，总共只需要3次查询"""
         house_dict = {
             "hid": self.id,
             "user_id": self.user_id,
             "user_name": self.user.name,
-            "user_avatar": constants.QINIU_DOMIN_PREFIX + self.user.avatar_url if self.user.avatar_url else "",
+            "user_avatar": image_storage.image_url(self.user.avatar_thumb_url or self.user.avatar_url),
             "title": self.title,
             "price": self.price,
             "address": self.address,
@@ -156,20 +241,17 @@ class House(BaseModel, db.Model):
         # 房屋图片
         img_urls = []
         for image in self.images:
-            img_urls.append(constants.QINIU_DOMIN_PREFIX + image.url)
+            img_urls.append(image_storage.image_url(image.url))
         house_dict["img_urls"] = img_urls
 
-        # 房屋设施
-        facilities = []
-        for facility in self.facilities:
-            facilities.append(facility.id)
+        # 房屋设施，只需要设施编号，直接查询关系表
+        facilities = [facility_id for facility_id, in db.session.query(house_facility.c.facility_id)
+                      .filter(house_facility.c.house_id == self.id)]
         house_dict["facilities"] = facilities
 
-        # 评论信息
+        # 评论信息，评论的用户随订单一起查询
         comments = []
-        orders = Order.query.filter(Order.house_id == self.id, Order.status == "COMPLETE", Order.comment != None)\
-            .order_by(Order.update_time.desc()).limit(constants.HOUSE_DETAIL_COMMENT_DISPLAY_COUNTS)
-        for order in orders:
+        for order in Order.query_comments(self.id):
             comment = {
                 "comment": order.comment,  # 评论的内容
                 "user_name": order.user.name if order.user.name != order.user.mobile else "匿名用户",  # 发表评论的用户
@@ -197,16 +279,71 @@ class HouseImage(BaseModel, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     house_id = db.Column(db.Integer, db.ForeignKey("ih_house_info.id"), nullable=False)  # 房屋编号
     url = db.Column(db.String(256), nullable=False)  # 图片的路径
+    card_url = db.Column(db.String(256))  # 列表尺寸版本的路径
+    thumb_url = db.Column(db.String(256))  # 缩略图版本的路径
+
+
+class HousePriceRule(BaseModel, db.Model):
+    """房屋价格规则，计算方式见ehome.utils.pricing"""
+
+    __tablename__ = "ih_house_price_rule"
+
+    id = db.Column(db.Integer, primary_key=True)  # 规则编号，编号越大的规则越后设置
+    house_id = db.Column(db.Integer, db.ForeignKey("ih_house_info.id"), nullable=False, index=True)  # 房屋编号
+    kind = db.Column(db.Enum(*pricing.RULE_KINDS), nullable=False)  # 规则的类型
+    weekdays = db.Column(db.String(7))  # WEEKDAY规则适用的星期几，从周一到周日，"1"表示适用
+    begin_date = db.Column(db.Date)  # SEASON规则的起始日期
+    end_date = db.Column(db.Date)  # SEASON规则的结束日期，包含在规则内
+    price = db.Column(db.Integer)  # WEEKDAY和SEASON规则适用日期的单价，单位：分
+    min_days = db.Column(db.Integer)  # LONG_STAY规则要求的最少入住天数
+    discount = db.Column(db.Integer)  # LONG_STAY规则的折扣百分比，如90表示九折
+
+    def to_dict(self):
+        """将价格规则转换为字典数据，只包含该类型规则用到的字段"""
+        rule_dict = {"kind": self.kind}
+        if self.kind == "WEEKDAY":
+            rule_dict.update(weekdays=self.weekdays, price=self.price)
+        elif self.kind == "SEASON":
+            rule_dict.update(begin_date=self.begin_date.strftime("%Y-%m-%d"),
+                             end_date=self.end_date.strftime("%Y-%m-%d"), price=self.price)
+        else:
+            rule_dict.update(min_days=self.min_days, discount=self.discount)
+        return rule_dict
+
+    @classmethod
+    def for_houses(cls, house_ids):
+        """一次查询多个房屋的价格规则，按设置的先后顺序排列"""
+        if not house_ids:
+            return []
+        return cls.query.filter(cls.house_id.in_(house_ids)).order_by(cls.id).all()
 
 
 class Order(BaseModel, db.Model):
-    """订单"""
+    """
+    订单
+    项目没有接入支付，房东接单后订单直接进入待评价，订单状态的变化：
+    WAIT_ACCEPT --房东接单--> WAIT_COMMENT --房客评价--> COMPLETE
+    WAIT_ACCEPT --房东拒单--> REJECTED
+    WAIT_ACCEPT --超时未接单--> CANCELED
+    WAIT_PAYMENT和PAID保留给以后接入支付时使用，目前没有订单会进入这两个状态
+    """
 
     __tablename__ = "ih_order_info"
+    __table_args__ = (
+        # 查询房屋在日期区间内有冲突的订单
+        db.Index("ix_ih_order_info_house_id_begin_date_end_date", "house_id", "begin_date", "end_date"),
+        # 房屋详情页查询已完成订单的评论，按评论时间排序
+        db.Index("ix_ih_order_info_house_id_status_update_time", "house_id", "status", "update_time"),
+        # 房客和房东的订单列表按下单时间游标分页，InnoDB二级索引中包含主键，编号不需要单独列出
+        db.Index("ix_ih_order_info_user_id_create_time", "user_id", "create_time"),
+        db.Index("ix_ih_order_info_landlord_id_create_time", "landlord_id", "create_time"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)  # 订单编号
     user_id = db.Column(db.Integer, db.ForeignKey("ih_user_profile.id"), nullable=False)  # 下订单的用户编号
     house_id = db.Column(db.Integer, db.ForeignKey("ih_house_info.id"), nullable=False)  # 预订的房间编号
+    # 房屋主人的编号，从房屋表复制，房东的订单列表不需要关联房屋表过滤
+    landlord_id = db.Column(db.Integer, db.ForeignKey("ih_user_profile.id"), nullable=False)
     begin_date = db.Column(db.DateTime, nullable=False)  # 预订的起始时间
     end_date = db.Column(db.DateTime, nullable=False)  # 预订的结束时间
     days = db.Column(db.Integer, nullable=False)  # 预订的总天数
@@ -230,7 +367,7 @@ class Order(BaseModel, db.Model):
         order_dict = {
             "order_id": self.id,
             "title": self.house.title,
-            "img_url": constants.QINIU_DOMIN_PREFIX + self.house.index_image_url if self.house.index_image_url else "",
+            "img_url": image_storage.image_url(self.house.index_image_card_url or self.house.index_image_url),
             "start_date": self.begin_date.strftime("%Y-%m-%d"),
             "end_date": self.end_date.strftime("%Y-%m-%d"),
             "ctime": self.create_time.strftime("%Y-%m-%d %H:%M:%S"),
@@ -241,3 +378,332 @@ class Order(BaseModel, db.Model):
         }
         return order_dict
 
+    @classmethod
+    def query_comments(cls, house_id):
+        """房屋详情展示的评论，评论的用户随订单一起查询"""
+        return cls.query.options(joinedload(cls.user))\
+            .filter(cls.house_id == house_id, cls.status == "COMPLETE", cls.comment != None)\
+            .order_by(cls.update_time.desc()).limit(constants.HOUSE_DETAIL_COMMENT_DISPLAY_COUNTS)
+
+    @classmethod
+    def query_conflicts(cls, house_id, start_date, end_date):
+        """房屋在日期区间内占用日期的订单"""
+        return db.session.query(cls.id).filter(cls.house_id == house_id, cls.begin_date <= end_date,
+                                               cls.end_date >= start_date,
+                                               cls.status.in_(availability.OCCUPYING_STATUS))
+
+    @classmethod
+    def cancel_expired(cls, order_ids):
+        """
+        取消已超时的等待接单的订单
+        订单加行锁后再判断状态，避免与房东接单同时修改；提交后由事务钩子释放订单占用的日期并删除相关缓存
+        :return: {订单编号: 超时时间}，超时时间为None表示订单已取消或者已不在等待状态
+        """
+        results = dict((order_id, None) for order_id in order_ids)
+        now = time.time()
+        try:
+            orders = cls.query.filter(cls.id.in_(order_ids), cls.status.in_(list(order_expiry.WAITING_EXPIRES)))\
+                .with_for_update().all()
+            for order in orders:
+                order_deadline = order_expiry.deadline(order.status, order.update_time)
+                if order_deadline > now:
+                    # 订单重新进入了等待状态，还没有超时
+                    results[order.id] = order_deadline
+                else:
+                    order.status = "CANCELED"
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return results
+
+
+@event.listens_for(Order.status, "set", active_history=True)
+@event.listens_for(Order.begin_date, "set", active_history=True)
+@event.listens_for(Order.end_date, "set", active_history=True)
+def load_order_previous_value(target, value, oldvalue, initiator):
+    """修改订单状态和日期时先加载原来的值，订单提交后已过期时get_history也能取到修改前的值"""
+
+
+@event.listens_for(db.session, "after_flush")
+def collect_order_calendar_changes(session, flush_context):
+    """
+    收集本次事务中订单占用日期的变化，提交后再同步到房屋可预订日期索引
+    只记录占用状态真正发生变化的日期区间，保证每个订单对每天的占用计数只增减一次
+    """
+    changes = session.info.setdefault("calendar_changes", [])
+    for order in session.new:
+        if isinstance(order, Order) and (order.status or "WAIT_ACCEPT") in availability.OCCUPYING_STATUS:
+            changes.append((order.house_id, order.begin_date, order.end_date, 1))
+    for order in session.dirty:
+        if not isinstance(order, Order):
+            continue
+        status = get_history(order, "status")
+        begin_date = get_history(order, "begin_date")
+        end_date = get_history(order, "end_date")
+        if not (status.has_changes() or begin_date.has_changes() or end_date.has_changes()):
+            continue
+        was_occupying = (status.deleted or [order.status])[0] in availability.OCCUPYING_STATUS
+        is_occupying = order.status in availability.OCCUPYING_STATUS
+        # 释放原来占用的日期，再占用现在的日期
+        if was_occupying:
+            changes.append((order.house_id,
+                            (begin_date.deleted or [order.begin_date])[0],
+                            (end_date.deleted or [order.end_date])[0],
+                            -1))
+        if is_occupying:
+            changes.append((order.house_id, order.begin_date, order.end_date, 1))
+    for order in session.deleted:
+        if isinstance(order, Order) and order.status in availability.OCCUPYING_STATUS:
+            changes.append((order.house_id, order.begin_date, order.end_date, -1))
+
+
+@event.listens_for(db.session, "after_commit")
+def apply_order_calendar_changes(session):
+    """事务提交后，把订单占用日期的变化写入redis"""
+    changes = session.info.pop("calendar_changes", None)
+    if not changes:
+        return
+    pipeline = redis_store.pipeline()
+    for house_id, begin_date, end_date, delta in changes:
+        availability.mark(pipeline, house_id, begin_date, end_date, delta)
+    try:
+        pipeline.execute()
+    except Exception as e:
+        # 同步失败不影响订单数据，可通过manage.py rebuild_calendar重建索引
+        logging.error(e)
+
+
+@event.listens_for(db.session, "after_soft_rollback")
+def discard_order_calendar_changes(session, previous_transaction):
+    """事务回滚时丢弃未提交的订单日期变化"""
+    session.info.pop("calendar_changes", None)
+
+
+@event.listens_for(db.session, "after_flush")
+def collect_order_expiry_changes(session, flush_context):
+    """收集本次事务中订单状态的变化，提交后再同步订单的超时时间"""
+    changes = session.info.setdefault("expiry_changes", {})
+    for order in session.new:
+        if isinstance(order, Order):
+            changes[order.id] = (order.status or "WAIT_ACCEPT", order.update_time or datetime.now())
+    for order in session.dirty:
+        if isinstance(order, Order) and get_history(order, "status").has_changes():
+            changes[order.id] = (order.status, order.update_time or datetime.now())
+    for order in session.deleted:
+        if isinstance(order, Order):
+            changes[order.id] = (None, None)
+
+
+@event.listens_for(db.session, "after_commit")
+def apply_order_expiry_changes(session):
+    """事务提交后，把订单超时时间的变化写入redis"""
+    changes = session.info.pop("expiry_changes", None)
+    if not changes:
+        return
+    pipeline = redis_store.pipeline()
+    for order_id, (status, since) in changes.items():
+        order_expiry.schedule(pipeline, order_id, status, since)
+    try:
+        pipeline.execute()
+    except Exception as e:
+        # 同步失败可通过重启manage.py order_expiry_worker补充等待中订单的超时时间
+        logging.error(e)
+
+
+@event.listens_for(db.session, "after_soft_rollback")
+def discard_order_expiry_changes(session, previous_transaction):
+    """事务回滚时丢弃未提交的订单状态变化"""
+    session.info.pop("expiry_changes", None)
+
+
+# 房屋列表页过滤和排序用到的房屋字段
+_HOUSE_LIST_FIELDS = ("area_id", "price", "order_count", "create_time")
+
+# 出现在房屋详情和房屋基本信息中的用户字段
+_USER_CACHE_FIELDS = ("name", "avatar_url", "avatar_thumb_url")
+
+# 影响首页房屋排行的房屋字段
+_HOUSE_RANK_FIELDS = ("order_count", "index_image_url")
+
+
+@event.listens_for(db.session, "before_flush")
+def collect_house_field_changes(session, flush_context, instances):
+    """
+    在flush之前记录房屋被修改的字段
+    字段被赋值为SQL表达式时（如House.order_count + 1），flush之后会重新读取计算结果，
+    after_flush中的修改历史已经为空，需要提前记录
+    """
+    field_changes = {}
+    for house in session.dirty:
+        if isinstance(house, House):
+            fields = set(field for field in _HOUSE_LIST_FIELDS + _HOUSE_RANK_FIELDS
+                         if get_history(house, field).has_changes())
+            if fields:
+                field_changes[house] = fields
+    session.info["house_field_changes"] = field_changes
+
+
+@event.listens_for(db.session, "after_flush")
+def collect_house_rank_changes(session, flush_context):
+    """收集本次事务中房屋成交量和主图片的变化，提交后再同步到首页房屋排行"""
+    changes = session.info.setdefault("rank_changes", {})
+    for house in session.new:
+        if isinstance(house, House):
+            changes[house.id] = (house.order_count, bool(house.index_image_url))
+    for house, fields in session.info.get("house_field_changes", {}).items():
+        if fields.intersection(_HOUSE_RANK_FIELDS) and house not in session.deleted:
+            changes[house.id] = (house.order_count, bool(house.index_image_url))
+    for house in session.deleted:
+        if isinstance(house, House):
+            changes[house.id] = (None, False)
+
+
+@event.listens_for(db.session, "after_commit")
+def apply_house_rank_changes(session):
+    """事务提交后，把房屋排行的变化写入redis"""
+    session.info.pop("house_field_changes", None)
+    changes = session.info.pop("rank_changes", None)
+    if not changes:
+        return
+    pipeline = redis_store.pipeline()
+    for house_id, (order_count, ranked) in changes.items():
+        house_rank.update(pipeline, house_id, order_count, ranked)
+    try:
+        pipeline.execute()
+    except Exception as e:
+        # 同步失败可通过manage.py rebuild_house_rank重建排行
+        logging.error(e)
+
+
+@event.listens_for(db.session, "after_soft_rollback")
+def discard_house_rank_changes(session, previous_transaction):
+    """事务回滚时丢弃未提交的房屋排行变化"""
+    session.info.pop("house_field_changes", None)
+    session.info.pop("rank_changes", None)
+
+
+@event.listens_for(db.session, "after_flush")
+def collect_new_houses(session, flush_context):
+    """收集本次事务中新增的房屋，提交后再加入布隆过滤器"""
+    new_ids = [house.id for house in session.new if isinstance(house, House)]
+    if new_ids:
+        session.info.setdefault("new_house_ids", []).extend(new_ids)
+
+
+@event.listens_for(db.session, "after_commit")
+def apply_new_houses(session):
+    """事务提交后，把新增的房屋编号加入布隆过滤器"""
+    new_ids = session.info.pop("new_house_ids", None)
+    if not new_ids:
+        return
+    try:
+        house_bloom.add(new_ids)
+    except Exception as e:
+        # 加入失败时新房屋的详情会被误判为不存在，删除过滤器，由manage.py rebuild_house_bloom重建
+        logging.error(e)
+        try:
+            house_bloom.discard()
+        except Exception as e:
+            logging.error(e)
+
+
+@event.listens_for(db.session, "after_soft_rollback")
+def discard_new_houses(session, previous_transaction):
+    """事务回滚时丢弃未提交的新增房屋"""
+    session.info.pop("new_house_ids", None)
+
+
+def _cache_invalidations(session, obj):
+    """
+    计算对象变化后需要删除的缓存键和标签
+    :return: (缓存键列表, 标签列表)
+    """
+    if isinstance(obj, House):
+        keys = ["house_info_%s" % obj.id, "house_basic_%s" % obj.id]
+        # 列表页缓存的是房屋编号，只有新增、删除房屋或者修改了过滤和排序字段时才需要删除
+        fields = session.info.get("house_field_changes", {}).get(obj, frozenset())
+        if obj in session.dirty and not fields.intersection(_HOUSE_LIST_FIELDS):
+            return keys, []
+        return keys, ["houses_list"]
+    if isinstance(obj, HouseImage):
+        return ["house_info_%s" % obj.house_id], []
+    if isinstance(obj, Order):
+        # 订单影响房屋详情中的评论，以及列表页的日期过滤和成交量排序
+        return ["house_info_%s" % obj.house_id], ["houses_list"]
+    if isinstance(obj, User):
+        # 用户昵称和头像出现在所有房屋详情和房屋基本信息中，新注册的用户还没有房屋，不影响缓存
+        if obj in session.dirty and any(get_history(obj, field).has_changes() for field in _USER_CACHE_FIELDS):
+            return [], ["house_info", "house_basic"]
+        return [], []
+    if isinstance(obj, Area):
+        return ["area_info"], ["house_basic"]
+    return [], []
+
+
+# 批量更新和删除时不知道具体的对象，按模型删除可能受影响的所有缓存
+# 批量更新房屋的成交量或主图片后，需要通过manage.py rebuild_house_rank重建首页房屋排行
+_BULK_INVALIDATIONS = {
+    House: ([], ["house_info", "house_basic", "houses_list"]),
+    HouseImage: ([], ["house_info"]),
+    Order: ([], ["house_info", "houses_list"]),
+    User: ([], ["house_info", "house_basic"]),
+    Area: (["area_info"], ["house_basic"]),
+}
+
+
+def _add_cache_invalidations(session, keys, tags):
+    """记录本次事务中需要删除的缓存，事务提交后统一删除"""
+    invalidations = session.info.setdefault("cache_invalidations", (set(), set()))
+    invalidations[0].update(keys)
+    invalidations[1].update(tags)
+
+
+@event.listens_for(db.session, "after_flush")
+def collect_cache_invalidations(session, flush_context):
+    """收集本次事务中数据变化影响的缓存"""
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        keys, tags = _cache_invalidations(session, obj)
+        if keys or tags:
+            _add_cache_invalidations(session, keys, tags)
+
+
+@event.listens_for(db.session, "after_bulk_update")
+def collect_bulk_update_invalidations(update_context):
+    """收集query.update()批量更新影响的缓存"""
+    cls = update_context.mapper.class_
+    # 批量更新用户时只有修改了昵称或头像才影响缓存，例如实名认证只修改real_name
+    if cls is User:
+        fields = set(getattr(field, "key", field) for field in update_context.values)
+        if not fields.intersection(_USER_CACHE_FIELDS):
+            return
+    keys, tags = _BULK_INVALIDATIONS.get(cls, ([], []))
+    if keys or tags:
+        _add_cache_invalidations(update_context.session, keys, tags)
+
+
+@event.listens_for(db.session, "after_bulk_delete")
+def collect_bulk_delete_invalidations(delete_context):
+    """收集query.delete()批量删除影响的缓存"""
+    keys, tags = _BULK_INVALIDATIONS.get(delete_context.mapper.class_, ([], []))
+    if keys or tags:
+        _add_cache_invalidations(delete_context.session, keys, tags)
+
+
+@event.listens_for(db.session, "after_commit")
+def apply_cache_invalidations(session):
+    """事务提交后，在redis中一次删除所有受影响的缓存"""
+    invalidations = session.info.pop("cache_invalidations", None)
+    if not invalidations:
+        return
+    keys, tags = invalidations
+    try:
+        cache.invalidate(keys, tags)
+    except Exception as e:
+        logging.error(e)
+
+
+@event.listens_for(db.session, "after_soft_rollback")
+def discard_cache_invalidations(session, previous_transaction):
+    """事务回滚时数据没有变化，丢弃收集的缓存"""
+    session.info.pop("cache_invalidations", None)
@@ -31,12 +31,34 @@ $(document).ready(function(){
             location.href = "/login.html";
         }
     }, "json");
-    $(".input-daterange").datepicker({
-        format: "yyyy-mm-dd",
-        startDate: "today",
-        language: "zh-CN",
-        autoclose: true
+    var queryData = decodeQuery();
+    var houseId = queryData["hid"];
+
+    // 获取房屋未来6个月的日历，已被预订的日期不可选择
+    $.get("/api/v1.0/houses/" + houseId + "/calendar?months=6", function(resp){
+        var datesDisabled = [];
+        if (0 == resp.errno) {
+            $.each(resp.data.calendar, function(i, month){
+                for (var day = 0; day < month.days.length; day++) {
+                    if ("1" == month.days.charAt(day)) {
+                        datesDisabled.push(month.month + "-" + (day < 9 ? "0" : "") + (day + 1));
+                    }
+                }
+            });
+        }
+        initDatepicker(datesDisabled);
+    }, "json").fail(function(){
+        initDatepicker([]);
     });
+    function initDatepicker(datesDisabled) {
+        $(".input-daterange").datepicker({
+            format: "yyyy-mm-dd",
+            startDate: "today",
+            datesDisabled: datesDisabled,
+            language: "zh-CN",
+            autoclose: true
+        });
+    }
     $(".input-daterange").on("changeDate", function(){
         var startDate = $("#start-date").val();
         var endDate = $("#end-date").val();
@@ -50,11 +72,14 @@ $(document).ready(function(){
             var price = $(".house-text>p>span").html();
             var amount = days * parseFloat(price);
             $(".order-amount>span").html(amount.toFixed(2) + "(共"+ days +"晚)");
+            // 按房屋的价格规则获取实际总价
+            $.get("/api/v1.0/houses/" + houseId + "/quote?sd=" + startDate + "&ed=" + endDate, function(resp){
+                if (0 == resp.errno) {
+                    $(".order-amount>span").html((resp.data.amount/100.0).toFixed(2) + "(共"+ resp.data.days +"晚)");
+                }
+            }, "json");
         }
     });
-    var queryData = decodeQuery();
-    var houseId = queryData["hid"];
-
     // 获取房屋的基本信息
     $.get("/api/v1.0/houses/" + houseId, function(resp){
         if (0 == resp.errno) {
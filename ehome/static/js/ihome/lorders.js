@@ -14,73 +14,96 @@ function getCookie(name) {
     return r ? r[1] : undefined;
 }
 
+var next_cursor = ""; // 下一页的游标,为空字符串表示没有下一页
+var orders_querying = true;   // 是否正在向后台获取数据
+
+// 查询房东的订单,cursor为空字符串时查询第一页,之后的页追加到列表后面
+function updateOrdersData(cursor) {
+    $.get("/api/v1.0/user/orders", {role:"landlord", cursor:cursor}, function(resp){
+        orders_querying = false;
+        if ("0" == resp.errno) {
+            next_cursor = resp.data.next_cursor;
+            $(".orders-list").append(template("orders-list-tmpl", {orders:resp.data.orders}));
+        }
+    });
+}
+
 $(document).ready(function(){
     $('.modal').on('show.bs.modal', centerModals);      //当模态框出现的时候
     $(window).on('resize', centerModals);
     // 查询房东的订单
-    $.get("/api/v1.0/user/orders?role=landlord", function(resp){
-        if ("0" == resp.errno) {
-            $(".orders-list").html(template("orders-list-tmpl", {orders:resp.data.orders}));
-            $(".order-accept").on("click", function(){
-                var orderId = $(this).parents("li").attr("order-id");
-                $(".modal-accept").attr("order-id", orderId);
-            });
-            // 接单处理
-            $(".modal-accept").on("click", function(){
-                var orderId = $(this).attr("order-id");
-                $.ajax({
-                    url:"/api/v1.0/orders/"+orderId+"/status",
-                    type:"PUT",
-                    data:'{"action":"accept"}',
-                    contentType:"application/json",
-                    dataType:"json",
-                    headers:{
-                        "X-CSRFTOKEN":getCookie("csrf_token"),
-                    },
-                    success:function (resp) {
-                        if ("4101" == resp.errno) {
-                            location.href = "/login.html";
-                        } else if ("0" == resp.errno) {
-                            $(".orders-list>li[order-id="+ orderId +"]>div.order-content>div.order-text>ul li:eq(4)>span").html("已接单");
-                            $("ul.orders-list>li[order-id="+ orderId +"]>div.order-title>div.order-operate").hide();
-                            $("#accept-modal").modal("hide");
-                        }
-                    }
-                })
-            });
-            $(".order-reject").on("click", function(){
-                var orderId = $(this).parents("li").attr("order-id");
-                $(".modal-reject").attr("order-id", orderId);
-            });
-            // 处理拒单
-            $(".modal-reject").on("click", function(){
-                var orderId = $(this).attr("order-id");
-                var reject_reason = $("#reject-reason").val();
-                if (!reject_reason) return;
-                var data = {
-                    action: "reject",
-                    reason:reject_reason
-                };
-                $.ajax({
-                    url:"/api/v1.0/orders/"+orderId+"/status",
-                    type:"PUT",
-                    data:JSON.stringify(data),
-                    contentType:"application/json",
-                    headers: {
-                        "X-CSRFTOKEN":getCookie("csrf_token")
-                    },
-                    dataType:"json",
-                    success:function (resp) {
-                        if ("4101" == resp.errno) {
-                            location.href = "/login.html";
-                        } else if ("0" == resp.errno) {
-                            $(".orders-list>li[order-id="+ orderId +"]>div.order-content>div.order-text>ul li:eq(4)>span").html("已拒单");
-                            $("ul.orders-list>li[order-id="+ orderId +"]>div.order-title>div.order-operate").hide();
-                            $("#reject-modal").modal("hide");
-                        }
-                    }
-                });
-            })
+    updateOrdersData("");
+    // 滚动到页面底部时加载下一页
+    var windowHeight = $(window).height();
+    window.onscroll=function(){
+        var b = document.documentElement.scrollTop==0? document.body.scrollTop : document.documentElement.scrollTop;
+        var c = document.documentElement.scrollTop==0? document.body.scrollHeight : document.documentElement.scrollHeight;
+        if(c-b<windowHeight+50){
+            if (!orders_querying && next_cursor) {
+                orders_querying = true;
+                updateOrdersData(next_cursor);
+            }
         }
+    };
+    // 订单分页加载,通过事件委托绑定后加载的订单
+    $(".orders-list").on("click", ".order-accept", function(){
+        var orderId = $(this).parents("li").attr("order-id");
+        $(".modal-accept").attr("order-id", orderId);
+    });
+    // 接单处理
+    $(".modal-accept").on("click", function(){
+        var orderId = $(this).attr("order-id");
+        $.ajax({
+            url:"/api/v1.0/orders/"+orderId+"/status",
+            type:"PUT",
+            data:'{"action":"accept"}',
+            contentType:"application/json",
+            dataType:"json",
+            headers:{
+                "X-CSRFTOKEN":getCookie("csrf_token"),
+            },
+            success:function (resp) {
+                if ("4101" == resp.errno) {
+                    location.href = "/login.html";
+                } else if ("0" == resp.errno) {
+                    $(".orders-list>li[order-id="+ orderId +"]>div.order-content>div.order-text>ul li:eq(4)>span").html("已接单");
+                    $("ul.orders-list>li[order-id="+ orderId +"]>div.order-title>div.order-operate").hide();
+                    $("#accept-modal").modal("hide");
+                }
+            }
+        })
+    });
+    $(".orders-list").on("click", ".order-reject", function(){
+        var orderId = $(this).parents("li").attr("order-id");
+        $(".modal-reject").attr("order-id", orderId);
     });
+    // 处理拒单
+    $(".modal-reject").on("click", function(){
+        var orderId = $(this).attr("order-id");
+        var reject_reason = $("#reject-reason").val();
+        if (!reject_reason) return;
+        var data = {
+            action: "reject",
+            reason:reject_reason
+        };
+        $.ajax({
+            url:"/api/v1.0/orders/"+orderId+"/status",
+            type:"PUT",
+            data:JSON.stringify(data),
+            contentType:"application/json",
+            headers: {
+                "X-CSRFTOKEN":getCookie("csrf_token")
+            },
+            dataType:"json",
+            success:function (resp) {
+                if ("4101" == resp.errno) {
+                    location.href = "/login.html";
+                } else if ("0" == resp.errno) {
+                    $(".orders-list>li[order-id="+ orderId +"]>div.order-content>div.order-text>ul li:eq(4)>span").html("已拒单");
+                    $("ul.orders-list>li[order-id="+ orderId +"]>div.order-title>div.order-operate").hide();
+                    $("#reject-modal").modal("hide");
+                }
+            }
+        });
+    })
 });
\ No newline at end of file
@@ -14,46 +14,69 @@ function getCookie(name) {
     return r ? r[1] : undefined;
 }
 
+var next_cursor = ""; // 下一页的游标,为空字符串表示没有下一页
+var orders_querying = true;   // 是否正在向后台获取数据
+
+// 查询房客订单,cursor为空字符串时查询第一页,之后的页追加到列表后面
+function updateOrdersData(cursor) {
+    $.get("/api/v1.0/user/orders", {role:"custom", cursor:cursor}, function(resp){
+        orders_querying = false;
+        if ("0" == resp.errno) {
+            next_cursor = resp.data.next_cursor;
+            $(".orders-list").append(template("orders-list-tmpl", {orders:resp.data.orders}));
+        }
+    });
+}
+
 $(document).ready(function(){
     $('.modal').on('show.bs.modal', centerModals);      //当模态框出现的时候
     $(window).on('resize', centerModals);
     // 查询房客订单//arttemplate
-    $.get("/api/v1.0/user/orders?role=custom", function(resp){
-        if ("0" == resp.errno) {
-            $(".orders-list").html(template("orders-list-tmpl", {orders:resp.data.orders}));
-            $(".order-comment").on("click", function(){
-                var orderId = $(this).parents("li").attr("order-id");
-                $(".modal-comment").attr("order-id", orderId);
-            });
-            $(".modal-comment").on("click", function(){
-                var orderId = $(this).attr("order-id");
-                var comment = $("#comment").val()
-                if (!comment) return;
-                var data = {
-                    order_id:orderId,
-                    comment:comment
-                };
-                // 处理评论
-                $.ajax({
-                    url:"/api/v1.0/orders/"+orderId+"/comment",
-                    type:"PUT",
-                    data:JSON.stringify(data),
-                    contentType:"application/json",
-                    dataType:"json",
-                    headers:{
-                        "X-CSRFTOKEN":getCookie("csrf_token"),
-                    },
-                    success:function (resp) {
-                        if ("4101" == resp.errno) {
-                            location.href = "/login.html";
-                        } else if ("0" == resp.errno) {
-                            $(".orders-list>li[order-id="+ orderId +"]>div.order-content>div.order-text>ul li:eq(4)>span").html("已完成");
-                            $("ul.orders-list>li[order-id="+ orderId +"]>div.order-title>div.order-operate").hide();
-                            $("#comment-modal").modal("hide");
-                        }
-                    }
-                });
-            });
+    updateOrdersData("");
+    // 滚动到页面底部时加载下一页
+    var windowHeight = $(window).height();
+    window.onscroll=function(){
+        var b = document.documentElement.scrollTop==0? document.body.scrollTop : document.documentElement.scrollTop;
+        var c = document.documentElement.scrollTop==0? document.body.scrollHeight : document.documentElement.scrollHeight;
+        if(c-b<windowHeight+50){
+            if (!orders_querying && next_cursor) {
+                orders_querying = true;
+                updateOrdersData(next_cursor);
+            }
         }
+    };
+    // 订单分页加载,通过事件委托绑定后加载的订单
+    $(".orders-list").on("click", ".order-comment", function(){
+        var orderId = $(this).parents("li").attr("order-id");
+        $(".modal-comment").attr("order-id", orderId);
+    });
+    $(".modal-comment").on("click", function(){
+        var orderId = $(this).attr("order-id");
+        var comment = $("#comment").val()
+        if (!comment) return;
+        var data = {
+            order_id:orderId,
+            comment:comment
+        };
+        // 处理评论
+        $.ajax({
+            url:"/api/v1.0/orders/"+orderId+"/comment",
+            type:"PUT",
+            data:JSON.stringify(data),
+            contentType:"application/json",
+            dataType:"json",
+            headers:{
+                "X-CSRFTOKEN":getCookie("csrf_token"),
+            },
+            success:function (resp) {
+                if ("4101" == resp.errno) {
+                    location.href = "/login.html";
+                } else if ("0" == resp.errno) {
+                    $(".orders-list>li[order-id="+ orderId +"]>div.order-content>div.order-text>ul li:eq(4)>span").html("已完成");
+                    $("ul.orders-list>li[order-id="+ orderId +"]>div.order-title>div.order-operate").hide();
+                    $("#comment-modal").modal("hide");
+                }
+            }
+        });
     });
 });
\ No newline at end of file
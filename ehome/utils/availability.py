@@ -0,0 +1,164 @@
+# -*- coding:utf-8 -*-
+
+"""
+房屋可预订日期索引
+每个房屋在redis中维护一个位图，键为house_calendar_<house_id>，
+第n位为1表示从constants.HOUSE_CALENDAR_EPOCH起的第n天已被订单占用；
+同时在hash house_calendar_count_<house_id>中记录每天被几个订单占用，
+订单释放日期时只减少计数，计数减到0的日期才清除位图中的位，
+其他仍占用该日期的订单不受影响
+"""
+
+import datetime
+
+from ehome import redis_store, constants
+
+
+# 占用房屋日期的订单状态，已取消和已拒单的订单不再占用日期
+OCCUPYING_STATUS = ("WAIT_ACCEPT", "WAIT_PAYMENT", "PAID", "WAIT_COMMENT", "COMPLETE")
+
+
+# 增减日期的占用计数，并按计数是否大于0设置位图中的位，KEYS[1]为位图，KEYS[2]为计数，
+# ARGV[1]为计数的变化量，其余为日期的位置；计数不会小于0，减到0时删除该日期的计数
+_MARK_SCRIPT = """
+local delta = tonumber(ARGV[1])
+for i = 2, #ARGV do
+    local count = redis.call("hincrby", KEYS[2], ARGV[i], delta)
+    if count > 0 then
+        redis.call("setbit", KEYS[1], ARGV[i], 1)
+    else
+        redis.call("hdel", KEYS[2], ARGV[i])
+        redis.call("setbit", KEYS[1], ARGV[i], 0)
+    end
+end
+return #ARGV - 1
+"""
+
+
+def calendar_key(house_id):
+    """房屋日期位图在redis中的键"""
+    return "house_calendar_%s" % house_id
+
+
+def count_key(house_id):
+    """房屋每天被占用次数在redis中的键，hash类型，字段为日期的位置"""
+    return "house_calendar_count_%s" % house_id
+
+
+def day_offset(date):
+    """日期相对于索引起始日期的天数，早于起始日期的按第0天处理"""
+    if isinstance(date, datetime.datetime):
+        date = date.date()
+    return max((date - constants.HOUSE_CALENDAR_EPOCH).days, 0)
+
+
+def mark(pipeline, house_id, begin_date, end_date, delta):
+    """
+    在redis管道中增减房屋从开始日期到结束日期（包含）的占用计数
+    :param delta: 1表示订单开始占用这些日期，-1表示订单释放这些日期
+    """
+    offsets = range(day_offset(begin_date), day_offset(end_date) + 1)
+    pipeline.eval(_MARK_SCRIPT, 2, calendar_key(house_id), count_key(house_id), delta, *offsets)
+
+
+def _has_occupied(data, first, last):
+    """判断位图数据中第first位到第last位（包含）是否有被占用的日期，last为None表示直到位图末尾"""
+    data = bytearray(data or b"")
+    if last is None or last >= len(data) * 8:
+        last = len(data) * 8 - 1
+    if first > last:
+        return False
+    first_byte, last_byte = first // 8, last // 8
+    for index in range(first_byte, last_byte + 1):
+        byte = data[index]
+        # redis位图中每个字节的最高位在前，屏蔽掉区间之外的位
+        if index == first_byte:
+            byte &= 0xFF >> (first % 8)
+        if index == last_byte:
+            byte &= (0xFF << (7 - last % 8)) & 0xFF
+        if byte:
+            return True
+    return False
+
+
+def find_busy_houses(house_ids, start_date=None, end_date=None):
+    """
+    查询在日期区间内已被占用的房屋
+    开始日期为None表示结束日期之前的所有日期，结束日期为None表示开始日期之后的所有日期
+    每个房屋只读取区间对应的几个字节，使用管道一次往返完成
+    :return: 有冲突的房屋编号集合
+    """
+    first = day_offset(start_date) if start_date else 0
+    last = day_offset(end_date) if end_date else None
+    first_byte = first // 8
+    last_byte = -1 if last is None else last // 8
+
+    pipeline = redis_store.pipeline(transaction=False)
+    for house_id in house_ids:
+        pipeline.getrange(calendar_key(house_id), first_byte, last_byte)
+    bitmaps = pipeline.execute()
+
+    # 读取的数据从first_byte开始，位置需要相应平移
+    shift = first_byte * 8
+    busy = set()
+    for house_id, data in zip(house_ids, bitmaps):
+        if _has_occupied(data, first - shift, None if last is None else last - shift):
+            busy.add(house_id)
+    return busy
+
+
+def occupied_days(house_id, first_date, days):
+    """
+    读取房屋从first_date起连续days天的占用情况，只读取对应的几个字节
+    :return: 每天一个字符的字符串，"1"表示已被占用，"0"表示可以预订，早于索引起始日期的按可预订处理
+    """
+    first = (first_date - constants.HOUSE_CALENDAR_EPOCH).days
+    last = first + days - 1
+    if last < 0:
+        return "0" * days
+    first_byte = max(first, 0) // 8
+    data = bytearray(redis_store.getrange(calendar_key(house_id), first_byte, last // 8) or b"")
+    flags = []
+    for offset in range(first, last + 1):
+        index = offset // 8 - first_byte
+        occupied = offset >= 0 and index < len(data) and data[index] & (0x80 >> (offset % 8))
+        flags.append("1" if occupied else "0")
+    return "".join(flags)
+
+
+def build_bitmap(date_ranges):
+    """
+    根据若干(开始日期, 结束日期)区间构造位图数据和每天的占用计数
+    :return: (位图数据, {日期的位置: 占用计数})
+    """
+    data = bytearray()
+    counts = {}
+    for begin_date, end_date in date_ranges:
+        for offset in range(day_offset(begin_date), day_offset(end_date) + 1):
+            index = offset // 8
+            if index >= len(data):
+                data.extend(b"\x00" * (index + 1 - len(data)))
+            data[index] |= 0x80 >> (offset % 8)
+            counts[offset] = counts.get(offset, 0) + 1
+    return bytes(data), counts
+
+
+def rebuild(house_ids, order_ranges):
+    """
+    重建房屋日期索引
+    :param house_ids: 所有房屋编号，没有占用订单的房屋会清除其位图
+    :param order_ranges: 可迭代的(房屋编号, 开始日期, 结束日期)，只包含占用日期的订单
+    """
+    ranges = {}
+    for house_id, begin_date, end_date in order_ranges:
+        ranges.setdefault(house_id, []).append((begin_date, end_date))
+    pipeline = redis_store.pipeline()
+    for house_id in set(house_ids) | set(ranges):
+        pipeline.delete(count_key(house_id))
+        if house_id in ranges:
+            data, counts = build_bitmap(ranges[house_id])
+            pipeline.set(calendar_key(house_id), data)
+            pipeline.hmset(count_key(house_id), counts)
+        else:
+            pipeline.delete(calendar_key(house_id))
+    pipeline.execute()
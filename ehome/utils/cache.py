@@ -0,0 +1,358 @@
+# -*- coding:utf-8 -*-
+
+"""
+redis读穿缓存
+缓存数据的有效期比新鲜期多出constants.CACHE_STALE_SECONDS，过了新鲜期的数据仍可作为旧数据返回；
+缓存失效时只有抢到分布式锁的进程查询mysql重建缓存，其他进程返回旧数据或者短暂等待重建结果；
+每个被删除过的键和标签都有一个版本号，删除时版本号加1，重建前读取版本号，写入时版本号已变化说明
+重建期间数据被修改过，放弃写入，避免把修改前查询到的数据写回缓存
+"""
+
+import logging
+import threading
+import time
+
+from redis import WatchError
+
+from ehome import redis_store, constants
+from ehome.utils import redis_lock
+
+
+# 删除指定的键以及标签集合中记录的所有键，并把它们的版本号加1，
+# KEYS中前ARGV[1]个是普通的键，其余是标签集合，ARGV[2]开始依次是每个键的版本号的键
+_INVALIDATE_SCRIPT = """
+local count = tonumber(ARGV[1])
+for i = 1, #KEYS do
+    if i > count then
+        local members = redis.call("smembers", KEYS[i])
+        for _, member in ipairs(members) do
+            redis.call("del", member)
+        end
+    end
+    redis.call("del", KEYS[i])
+    redis.call("incr", ARGV[i + 1])
+end
+return #KEYS
+"""
+
+# 把缓存键加入标签集合，集合的有效期只延长不缩短，保证不早于其中任何一个键过期，
+# 否则集合过期后按标签删除时找不到仍然有效的键；KEYS[1]是标签集合，ARGV[1]是有效期，其余是缓存键
+_TAG_SCRIPT = """
+local expires = tonumber(ARGV[1])
+local ttl = redis.call("ttl", KEYS[1])
+for i = 2, #ARGV do
+    redis.call("sadd", KEYS[1], ARGV[i])
+end
+if ttl == -2 or (ttl >= 0 and ttl < expires) then
+    redis.call("expire", KEYS[1], expires)
+end
+return ttl
+"""
+
+# 缓存统计数据在redis中的键，hash类型，字段为统计的事件
+CACHE_STATS_KEY = "cache_stats"
+
+# 进程内累计的统计数据，定期批量写入redis
+_stats = {}
+_stats_lock = threading.Lock()
+_stats_flush_time = [time.time()]
+
+
+def _record(event):
+    """
+    记录一次缓存事件
+    hit: 命中新鲜数据  build: 抢到锁重建缓存  stale: 其他进程重建中，返回旧数据
+    coalesced: 等到了其他进程重建的结果  timeout: 等待超时，自行查询  error: redis异常
+    conflict: 重建期间缓存被删除，放弃写入
+    """
+    with _stats_lock:
+        _stats[event] = _stats.get(event, 0) + 1
+        if time.time() - _stats_flush_time[0] < constants.CACHE_STATS_FLUSH_INTERVAL:
+            return
+        counts = dict(_stats)
+        _stats.clear()
+        _stats_flush_time[0] = time.time()
+    try:
+        pipeline = redis_store.pipeline(transaction=False)
+        for name, count in counts.items():
+            pipeline.hincrby(CACHE_STATS_KEY, name, count)
+        pipeline.execute()
+    except Exception as e:
+        logging.error(e)
+
+
+def stats():
+    """获取所有进程累计的缓存统计数据"""
+    return dict((name, int(count)) for name, count in redis_store.hgetall(CACHE_STATS_KEY).items())
+
+
+def _names(key, field):
+    """缓存数据对应的新鲜期标记和重建锁的键"""
+    name = key if field is None else "%s_%s" % (key, field)
+    return name + "_fresh", name + "_lock"
+
+
+def _read(key, field, fresh_key):
+    """读取缓存数据以及是否仍在新鲜期"""
+    pipeline = redis_store.pipeline(transaction=False)
+    if field is None:
+        pipeline.get(key)
+    else:
+        pipeline.hget(key, field)
+    pipeline.exists(fresh_key)
+    value, fresh = pipeline.execute()
+    return value, fresh
+
+
+def _read_range(key, fresh_key, offset, limit):
+    """
+    读取缓存列表中的一段、列表长度以及是否仍在新鲜期，列表的第一个元素是占位符，不计入数据
+    :return: ((这一段元素, 元素总数), 是否新鲜)，列表不存在时第一项为None
+    """
+    pipeline = redis_store.pipeline(transaction=False)
+    pipeline.lrange(key, offset + 1, offset + limit)
+    pipeline.llen(key)
+    pipeline.exists(fresh_key)
+    items, length, fresh = pipeline.execute()
+    if not length:
+        return None, fresh
+    return (items, length - 1), fresh
+
+
+def tag_key(tag):
+    """标签集合在redis中的键，集合中记录了打上该标签的缓存键"""
+    return "cache_tag_%s" % tag
+
+
+def _version_key(name):
+    """缓存键或标签集合的版本号在redis中的键"""
+    return "cache_version_%s" % name
+
+
+def _tag(pipeline, tag, keys, expires):
+    """向管道中添加把缓存键加入标签集合的命令，集合的有效期只会延长"""
+    pipeline.eval(_TAG_SCRIPT, 1, tag_key(tag), expires, *keys)
+
+
+def versions(keys=(), tags=()):
+    """
+    读取缓存键和标签的版本号，在查询数据之前调用，结果传给store()或store_many()
+    :return: (版本号的键列表, 版本号列表)
+    """
+    version_keys = [_version_key(key) for key in keys] + [_version_key(tag_key(tag)) for tag in tags]
+    if not version_keys:
+        return [], []
+    return version_keys, redis_store.mget(version_keys)
+
+
+def _write(fill, read_versions):
+    """
+    在redis事务中写入缓存数据，fill向管道中添加写入命令
+    :param read_versions: versions()的结果，写入前版本号有变化时放弃写入，为None时直接写入
+    :return: 是否写入
+    """
+    with redis_store.pipeline() as pipeline:
+        if read_versions is not None and read_versions[0]:
+            version_keys, values = read_versions
+            pipeline.watch(*version_keys)
+            if pipeline.mget(version_keys) != values:
+                _record("conflict")
+                return False
+            pipeline.multi()
+        fill(pipeline)
+        try:
+            pipeline.execute()
+        except WatchError:
+            # 检查版本号之后数据又被删除
+            _record("conflict")
+            return False
+    return True
+
+
+def store(key, value, expires, field=None, tags=None, read_versions=None):
+    """
+    写入缓存数据，field不为None时存储到hash中，tags为缓存打上标签，便于按标签批量删除
+    :param read_versions: 查询数据前通过versions()读取的键和标签的版本号，版本号有变化时不写入
+    :return: 是否写入
+    """
+    fresh_key, _ = _names(key, field)
+
+    def fill(pipeline):
+        if field is None:
+            pipeline.setex(key, expires + constants.CACHE_STALE_SECONDS, value)
+        else:
+            pipeline.hset(key, field, value)
+            pipeline.expire(key, expires + constants.CACHE_STALE_SECONDS)
+        pipeline.setex(fresh_key, expires, 1)
+        for tag in tags or ():
+            _tag(pipeline, tag, [key], expires + constants.CACHE_STALE_SECONDS)
+
+    return _write(fill, read_versions)
+
+
+def store_many(items, expires, tags=None, read_versions=None):
+    """
+    批量写入缓存片段，片段没有新鲜期，过期或被删除后由调用方重新查询
+    :param items: 可迭代的(缓存的键, 缓存数据)
+    :param read_versions: 查询数据前通过versions()读取的键和标签的版本号，版本号有变化时全部不写入
+    :return: 是否写入
+    """
+    items = list(items)
+    if not items:
+        return False
+
+    def fill(pipeline):
+        for key, value in items:
+            pipeline.setex(key, expires, value)
+        for tag in tags or ():
+            _tag(pipeline, tag, [key for key, _ in items], expires)
+
+    return _write(fill, read_versions)
+
+
+def store_list(key, values, expires, tags=None, read_versions=None):
+    """
+    把字符串列表写入redis列表，列表的第一个元素是空字符串占位，没有数据时也能缓存空列表
+    :param read_versions: 查询数据前通过versions()读取的键和标签的版本号，版本号有变化时不写入
+    :return: 是否写入
+    """
+    values = list(values)
+    fresh_key, _ = _names(key, None)
+
+    def fill(pipeline):
+        pipeline.delete(key)
+        pipeline.rpush(key, "")
+        for i in range(0, len(values), constants.CACHE_LIST_PUSH_BATCH):
+            pipeline.rpush(key, *values[i:i + constants.CACHE_LIST_PUSH_BATCH])
+        pipeline.expire(key, expires + constants.CACHE_STALE_SECONDS)
+        pipeline.setex(fresh_key, expires, 1)
+        for tag in tags or ():
+            _tag(pipeline, tag, [key], expires + constants.CACHE_STALE_SECONDS)
+
+    return _write(fill, read_versions)
+
+
+def invalidate(keys=(), tags=()):
+    """删除缓存的键以及标签下的所有缓存，并增加它们的版本号，在redis中一次执行完成"""
+    keys = list(keys)
+    tag_keys = [tag_key(tag) for tag in tags]
+    if not keys and not tag_keys:
+        return
+    version_keys = [_version_key(key) for key in keys + tag_keys]
+    redis_store.eval(_INVALIDATE_SCRIPT, len(keys) + len(tag_keys), *(keys + tag_keys + [len(keys)] + version_keys))
+
+
+def _read_through(key, lock_key, tags, read, build, write, present):
+    """
+    读穿缓存的公共流程，缓存失效时保证同一时间只有一个进程调用build重建
+    :param key: 缓存的键，用于读取版本号
+    :param lock_key: 重建锁的键
+    :param read: 读取缓存的函数，返回(缓存数据, 是否仍在新鲜期)，缓存不存在时缓存数据为None
+    :param build: 查询数据的函数
+    :param write: 写入build结果的函数，参数为build的结果和versions()读取的版本号
+    :param present: 把build的结果转换为与缓存数据相同形式的函数
+    :return: 缓存数据或者转换后的build结果，build的异常会直接抛出
+    """
+    try:
+        value, fresh = read()
+    except Exception as e:
+        logging.error(e)
+        _record("error")
+        return present(build())
+    if value is not None and fresh:
+        _record("hit")
+        return value
+
+    try:
+        token = redis_lock.acquire(lock_key, constants.CACHE_LOCK_EXPIRES)
+    except Exception as e:
+        logging.error(e)
+        _record("error")
+        return present(build())
+
+    if token is None:
+        # 其他进程正在重建，有旧数据时直接返回旧数据
+        if value is not None:
+            _record("stale")
+            return value
+        # 没有旧数据，短暂等待其他进程的重建结果
+        deadline = time.time() + constants.CACHE_LOCK_WAIT_SECONDS
+        while time.time() < deadline:
+            time.sleep(constants.CACHE_LOCK_POLL_INTERVAL)
+            try:
+                value, _ = read()
+            except Exception as e:
+                logging.error(e)
+                break
+            if value is not None:
+                _record("coalesced")
+                return value
+        _record("timeout")
+        return present(build())
+
+    _record("build")
+    try:
+        # 查询数据前读取版本号，查询期间缓存被删除时不写入查询结果
+        try:
+            read_versions = versions([key], tags or ())
+        except Exception as e:
+            logging.error(e)
+            read_versions = None
+        built = build()
+        if read_versions is not None:
+            try:
+                write(built, read_versions)
+            except Exception as e:
+                logging.error(e)
+        return present(built)
+    finally:
+        try:
+            redis_lock.release(lock_key, token)
+        except Exception as e:
+            logging.error(e)
+
+
+def read_through(key, expires, build, field=None, should_cache=None, tags=None, empty_expires=None):
+    """
+    读穿缓存：优先返回缓存数据，缓存失效时保证同一时间只有一个进程调用build重建
+    :param key: 缓存的键
+    :param expires: 缓存的新鲜期，单位：秒
+    :param build: 查询数据的函数，返回需要缓存的字符串，返回None表示没有数据，不进行缓存
+    :param field: 缓存存储在hash中时的字段
+    :param should_cache: 判断build的结果是否需要缓存的函数，默认都缓存
+    :param tags: 缓存的标签，数据变化时可以通过invalidate按标签删除
+    :param empty_expires: build返回空字符串时的新鲜期，用于短时间缓存不存在的数据，默认与expires相同
+    :return: 缓存数据或者build的结果，build的异常会直接抛出
+    """
+    fresh_key, lock_key = _names(key, field)
+
+    def write(value, read_versions):
+        if value is None or (should_cache is not None and not should_cache(value)):
+            return
+        if value == "" and empty_expires is not None:
+            store(key, value, empty_expires, field, tags, read_versions)
+        else:
+            store(key, value, expires, field, tags, read_versions)
+
+    return _read_through(key, lock_key, tags, lambda: _read(key, field, fresh_key), build, write, lambda value: value)
+
+
+def read_through_range(key, expires, build, offset, limit, tags=None):
+    """
+    读穿缓存，缓存数据是redis列表，每次只读取其中一段，读取的数据量与列表的长度无关
+    :param build: 查询数据的函数，返回需要缓存的字符串列表
+    :param offset: 读取的第一个元素的位置
+    :param limit: 最多读取的元素个数
+    :return: (这一段元素, 元素总数)
+    """
+    fresh_key, lock_key = _names(key, None)
+
+    def write(values, read_versions):
+        store_list(key, values, expires, tags, read_versions)
+
+    def present(values):
+        values = list(values)
+        return values[offset:offset + limit], len(values)
+
+    return _read_through(key, lock_key, tags, lambda: _read_range(key, fresh_key, offset, limit), build, write,
+                         present)
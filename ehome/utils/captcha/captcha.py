@@ -6,6 +6,8 @@
 import random
 import string
 import os.path
+import threading
+from collections import OrderedDict
 from cStringIO import StringIO
 
 from PIL import Image
@@ -13,6 +15,12 @@ from PIL import ImageFilter
 from PIL.ImageDraw import Draw
 from PIL.ImageFont import truetype
 
+try:
+    import numpy
+except ImportError:
+    # fall back to the pure PIL drawing path
+    numpy = None
+
 
 class Bezier:
     def __init__(self):
@@ -54,11 +62,24 @@ class Bezier:
             return result
 
 
+# luminance -> mask lookup table used by Captcha.mask()
+_MASK_LUT = numpy.minimum(numpy.round(numpy.arange(256) * 1.97), 255).astype(numpy.uint8) \
+    if numpy is not None else None
+
+
 class Captcha(object):
-    def __init__(self):
+    def __init__(self, glyph_cache_size=512):
         self._bezier = Bezier()
         self._dir = os.path.dirname(__file__)
         # self._captcha_path = os.path.join(self._dir, '..', 'static', 'captcha')
+        # loaded fonts keyed by (name, size) and LRU of cropped glyph masks
+        # keyed by (name, size, char); a size of 0 disables both caches.
+        # The shared instance is used from request threads when the pool is
+        # empty, so both caches are only touched while holding the lock
+        self._fonts = {}
+        self._glyphs = OrderedDict()
+        self._glyph_cache_size = glyph_cache_size
+        self._cache_lock = threading.Lock()
 
     @staticmethod
     def instance():
@@ -100,10 +121,15 @@ class Captcha(object):
         path = [(dx * i, random.randint(0, height))
                 for i in xrange(1, number)]
         bcoefs = self._bezier.make_bezier(number - 1)
-        points = []
-        for coefs in bcoefs:
-            points.append(tuple(sum([coef * p for coef, p in zip(coefs, ps)])
-                                for ps in zip(*path)))
+        if numpy is not None:
+            # all curve points in one (steps x n) . (n x 2) product
+            points = [tuple(point) for point in
+                      numpy.dot(numpy.array(bcoefs), numpy.array(path, dtype=float)).tolist()]
+        else:
+            points = []
+            for coefs in bcoefs:
+                points.append(tuple(sum([coef * p for coef, p in zip(coefs, ps)])
+                                    for ps in zip(*path)))
         Draw(image).line(points, fill=color if color else self._color, width=width)
         return image
 
@@ -120,20 +146,74 @@ class Captcha(object):
             draw.line(((x, y), (x + level, y)), fill=color if color else self._color, width=level)
         return image
 
+    @staticmethod
+    def mask(image):
+        """ Returns the paste mask of a character image, its luminance
+            scaled by 1.97
+        """
+        if numpy is not None:
+            return Image.fromarray(_MASK_LUT[numpy.asarray(image.convert('L'))])
+        return image.convert('L').point(lambda i: i * 1.97)
+
+    def font(self, name, size):
+        """ Returns the truetype font, loading each (name, size) only once
+        """
+        key = (name, size)
+        with self._cache_lock:
+            font = self._fonts.get(key)
+        if font is None:
+            font = truetype(name, size)
+            if self._glyph_cache_size:
+                with self._cache_lock:
+                    font = self._fonts.setdefault(key, font)
+        return font
+
+    @staticmethod
+    def text_size(c, font):
+        """ Returns the size of a character drawn at (0, 0), textsize was
+            removed in Pillow 10, newer versions provide textbbox instead
+        """
+        draw = Draw(Image.new('L', (1, 1)))
+        if hasattr(draw, 'textbbox'):
+            return draw.textbbox((0, 0), c, font=font)[2:]
+        return draw.textsize(c, font=font)
+
+    def glyph(self, name, size, c):
+        """ Returns the cropped 'L' mask of a rasterized character,
+            served from a bounded LRU cache
+        """
+        key = (name, size, c)
+        with self._cache_lock:
+            mask = self._glyphs.pop(key, None)
+            if mask is not None:
+                self._glyphs[key] = mask
+                return mask
+        # rasterize outside the lock, other threads keep using the cache
+        font = self.font(name, size)
+        mask = Image.new('L', self.text_size(c, font), 0)
+        Draw(mask).text((0, 0), c, font=font, fill=255)
+        mask = mask.crop(mask.getbbox())
+        if self._glyph_cache_size:
+            with self._cache_lock:
+                self._glyphs.pop(key, None)
+                while len(self._glyphs) >= self._glyph_cache_size:
+                    self._glyphs.popitem(last=False)
+                self._glyphs[key] = mask
+        return mask
+
     def text(self, image, fonts, font_sizes=None, drawings=None, squeeze_factor=0.75, color=None):
         color = color if color else self._color
-        fonts = tuple([truetype(name, size)
+        fonts = tuple([(name, size)
                        for name in fonts
                        for size in font_sizes or (65, 70, 75)])
-        draw = Draw(image)
         char_images = []
         for c in self._text:
-            font = random.choice(fonts)
-            c_width, c_height = draw.textsize(c, font=font)
-            char_image = Image.new('RGB', (c_width, c_height), (0, 0, 0))
-            char_draw = Draw(char_image)
-            char_draw.text((0, 0), c, font=font, fill=color)
-            char_image = char_image.crop(char_image.getbbox())
+            name, size = random.choice(fonts)
+            mask = self.glyph(name, size, c)
+            # colorize the cached glyph, antialiased edges blend into black
+            # exactly as when drawing the character in color
+            char_image = Image.new('RGB', mask.size, (0, 0, 0))
+            char_image.paste(color[:3], (0, 0) + mask.size, mask)
             for drawing in drawings:
                 d = getattr(self, drawing)
                 char_image = d(char_image)
@@ -144,7 +224,7 @@ class Captcha(object):
                       char_images[-1].size[0]) / 2)
         for char_image in char_images:
             c_width, c_height = char_image.size
-            mask = char_image.convert('L').point(lambda i: i * 1.97)
+            mask = self.mask(char_image)
             image.paste(char_image,
                         (offset, int((height - c_height) / 2)),
                         mask)
@@ -220,4 +300,11 @@ class Captcha(object):
 captcha = Captcha.instance()
 
 if __name__ == '__main__':
-    print captcha.generate_captcha()
+    import timeit
+    # micro-benchmark: captchas/sec without and with the font and glyph cache
+    for label, cache_size in (('no cache', 0), ('glyph cache', 512)):
+        engine = Captcha(glyph_cache_size=cache_size)
+        engine.generate_captcha()
+        number = 200
+        seconds = timeit.timeit(engine.generate_captcha, number=number)
+        print '%s: %.1f captchas/sec' % (label, number / seconds)
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+"""
+预先生成的图片验证码池
+验证码保存在redis列表中，每一项为"验证码文字:JPEG图片数据"，由manage.py captcha_pool在后台进程中补充，
+请求图片验证码时只需要从列表中取出一项
+"""
+
+import logging
+import multiprocessing
+import random
+import time
+
+from ehome import redis_store, constants
+from ehome.utils.captcha.captcha import captcha
+
+
+# 验证码池在redis中的键
+CAPTCHA_POOL_KEY = "captcha_pool"
+
+
+def _reseed():
+    """进程池的子进程复制了父进程的随机数状态，需要重新设置种子，否则各进程会生成相同的验证码"""
+    random.seed()
+
+
+def _generate(_=None):
+    """生成一个验证码，返回redis列表中保存的数据"""
+    name, text, image = captcha.generate_captcha()
+    return text.encode("ascii") + b":" + image
+
+
+def pop():
+    """
+    从验证码池中取出一个验证码，池为空或者redis异常时当场生成
+    :return: (验证码文字, JPEG图片数据)
+    """
+    try:
+        entry = redis_store.lpop(CAPTCHA_POOL_KEY)
+    except Exception as e:
+        logging.error(e)
+        entry = None
+    if entry is None:
+        entry = _generate()
+    text, image = entry.split(b":", 1)
+    return text.decode("ascii"), image
+
+
+def refill(pool, size):
+    """
+    把验证码池补充到指定数量
+    :param pool: 生成验证码的进程池
+    :return: 本次补充的数量
+    """
+    missing = size - redis_store.llen(CAPTCHA_POOL_KEY)
+    if missing <= 0:
+        return 0
+    # 每生成一批就写入redis，尽快让请求能取到
+    pipeline = redis_store.pipeline(transaction=False)
+    for count, entry in enumerate(pool.imap_unordered(_generate, range(missing), chunksize=10), 1):
+        pipeline.rpush(CAPTCHA_POOL_KEY, entry)
+        if count % 50 == 0:
+            pipeline.execute()
+    pipeline.execute()
+    return missing
+
+
+def run_refill_worker(size=constants.CAPTCHA_POOL_SIZE, processes=None,
+                      interval=constants.CAPTCHA_POOL_REFILL_INTERVAL):
+    """持续补充验证码池，processes为生成验证码的进程数，默认为cpu核数"""
+    pool = multiprocessing.Pool(processes, initializer=_reseed)
+    try:
+        while True:
+            try:
+                count = refill(pool, size)
+                if count:
+                    logging.info("captcha pool refilled: %s" % count)
+            except Exception as e:
+                logging.error(e)
+            time.sleep(interval)
+    finally:
+        pool.terminate()
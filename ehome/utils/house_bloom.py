@@ -0,0 +1,133 @@
+# -*- coding:utf-8 -*-
+
+"""
+已存在房屋编号的布隆过滤器
+过滤器保存在redis的位图house_bloom中，长度为constants.HOUSE_BLOOM_BITS位，每个房屋编号对应其中
+constants.HOUSE_BLOOM_HASHES个位。对应的位有一个为0时房屋一定不存在，房屋详情不需要查询mysql；
+过滤器只由manage.py rebuild_house_bloom建立，部署后需要先执行一次，之后定期执行清除已删除房屋的位，
+过滤器不存在时请求直接查询mysql，不在请求中建立过滤器
+"""
+
+import hashlib
+import logging
+import struct
+import uuid
+
+from ehome import redis_store, constants
+from ehome.utils import redis_lock
+
+
+# 布隆过滤器在redis中的键
+BLOOM_KEY = "house_bloom"
+
+# 正在重建过滤器的标记，值为本次重建的令牌
+BUILDING_KEY = "house_bloom_building"
+
+# 重建期间新增房屋对应的位，列表类型，重建完成时补充到新的过滤器中
+BUILDING_OFFSETS_KEY = "house_bloom_building_offsets"
+
+# 重建过滤器的分布式锁
+_LOCK_KEY = "house_bloom_lock"
+
+# 在过滤器中设置新房屋的位，过滤器不存在时不设置，避免只包含新房屋的位图被当成完整的过滤器；
+# 正在重建时同时记录这些位，重建查询的快照中可能没有这个房屋
+_ADD_SCRIPT = """
+local building = redis.call("exists", KEYS[2]) == 1
+local exists = redis.call("exists", KEYS[1]) == 1
+for i = 1, #ARGV do
+    if building then
+        redis.call("rpush", KEYS[3], ARGV[i])
+    end
+    if exists then
+        redis.call("setbit", KEYS[1], ARGV[i], 1)
+    end
+end
+return exists and 1 or 0
+"""
+
+# 用重建的位图替换过滤器，并补充重建期间新增房屋的位；
+# 重建标记已经不是本次的令牌时(过滤器被删除或者标记过期)放弃本次重建
+_REPLACE_SCRIPT = """
+local offsets = redis.call("lrange", KEYS[3], 0, -1)
+redis.call("del", KEYS[3])
+if redis.call("get", KEYS[2]) ~= ARGV[2] then
+    return 0
+end
+redis.call("del", KEYS[2])
+redis.call("set", KEYS[1], ARGV[1])
+for _, offset in ipairs(offsets) do
+    redis.call("setbit", KEYS[1], offset, 1)
+end
+return 1
+"""
+
+
+def offsets(house_id):
+    """房屋编号在位图中对应的位，由md5的两段哈希值组合出多个哈希函数"""
+    h1, h2 = struct.unpack(">QQ", hashlib.md5(str(house_id)).digest())
+    h2 |= 1
+    return [(h1 + i * h2) % constants.HOUSE_BLOOM_BITS for i in range(constants.HOUSE_BLOOM_HASHES)]
+
+
+def add(house_ids):
+    """把新增的房屋编号加入过滤器，过滤器不存在时不做处理，等待重建"""
+    pipeline = redis_store.pipeline(transaction=False)
+    for house_id in house_ids:
+        pipeline.eval(_ADD_SCRIPT, 3, BLOOM_KEY, BUILDING_KEY, BUILDING_OFFSETS_KEY, *offsets(house_id))
+    pipeline.execute()
+
+
+def discard():
+    """删除过滤器并放弃正在进行的重建，新房屋加入过滤器失败时调用，之后请求直接查询mysql，直到下次重建"""
+    redis_store.delete(BLOOM_KEY, BUILDING_KEY)
+
+
+def might_exist(house_id):
+    """
+    判断房屋是否可能存在
+    :return: False表示一定不存在，True表示可能存在，None表示过滤器还没有建立
+    """
+    pipeline = redis_store.pipeline(transaction=False)
+    pipeline.exists(BLOOM_KEY)
+    for offset in offsets(house_id):
+        pipeline.getbit(BLOOM_KEY, offset)
+    results = pipeline.execute()
+    if not results[0]:
+        return None
+    return all(results[1:])
+
+
+def build_bitmap(house_ids):
+    """根据房屋编号构造过滤器的位图数据"""
+    data = bytearray(constants.HOUSE_BLOOM_BITS // 8)
+    for house_id in house_ids:
+        for offset in offsets(house_id):
+            # 与redis位图一致，每个字节的最高位在前
+            data[offset // 8] |= 0x80 >> (offset % 8)
+    return bytes(data)
+
+
+def rebuild(load_ids):
+    """
+    重建过滤器，重建过程中旧的过滤器一直可用，多个进程同时重建时只有抢到锁的进程执行
+    先设置重建标记再查询房屋编号，查询快照之后提交的房屋由add()记录，替换过滤器时一起写入
+    :param load_ids: 查询所有房屋编号的函数，必须在新的事务中查询，快照晚于重建标记的设置
+    :return: 是否完成了重建，其他进程正在重建或者重建期间过滤器被删除时返回False
+    """
+    token = redis_lock.acquire(_LOCK_KEY, constants.HOUSE_BLOOM_LOCK_EXPIRES)
+    if token is None:
+        return False
+    try:
+        build_token = uuid.uuid4().hex
+        pipeline = redis_store.pipeline()
+        pipeline.delete(BUILDING_OFFSETS_KEY)
+        pipeline.set(BUILDING_KEY, build_token, px=constants.HOUSE_BLOOM_LOCK_EXPIRES)
+        pipeline.execute()
+        bitmap = build_bitmap(load_ids())
+        return bool(redis_store.eval(_REPLACE_SCRIPT, 3, BLOOM_KEY, BUILDING_KEY, BUILDING_OFFSETS_KEY,
+                                     bitmap, build_token))
+    finally:
+        try:
+            redis_lock.release(_LOCK_KEY, token)
+        except Exception as e:
+            logging.error(e)
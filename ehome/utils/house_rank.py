@@ -0,0 +1,84 @@
+# -*- coding:utf-8 -*-
+
+"""
+首页房屋排行
+redis有序集合house_rank中保存设置了主图片的房屋编号，分数为房屋的成交量，
+房屋的成交量或主图片变化时，在事务提交后增量更新，首页直接取分数最高的几个房屋
+"""
+
+import logging
+
+from ehome import redis_store, constants
+from ehome.utils import redis_lock
+
+
+# 房屋排行在redis中的键
+RANK_KEY = "house_rank"
+
+# 重建后排行为空时的标记，有效期内不再重建
+EMPTY_KEY = "house_rank_empty"
+
+# 重建排行的分布式锁
+_LOCK_KEY = "house_rank_lock"
+
+# 重建排行时每条ZADD命令写入的房屋数
+_REBUILD_BATCH = 1000
+
+
+def update(pipeline, house_id, order_count, ranked):
+    """在redis管道中更新房屋的排行，ranked为False表示房屋没有主图片或已删除，从排行中移除"""
+    if ranked:
+        pipeline.zadd(RANK_KEY, order_count or 0, house_id)
+    else:
+        pipeline.zrem(RANK_KEY, house_id)
+
+
+def top(count):
+    """成交量最高的count个房屋编号，排行不存在时返回空列表"""
+    return [int(house_id) for house_id in redis_store.zrevrange(RANK_KEY, 0, count - 1)]
+
+
+def rebuild(house_scores):
+    """
+    重建房屋排行
+    :param house_scores: 可迭代的(房屋编号, 成交量)，只包含设置了主图片的房屋
+    :return: 排行中的房屋数
+    """
+    pipeline = redis_store.pipeline()
+    pipeline.delete(RANK_KEY)
+    batch = []
+    count = 0
+    for house_id, order_count in house_scores:
+        batch.extend((order_count or 0, house_id))
+        count += 1
+        if len(batch) >= _REBUILD_BATCH * 2:
+            pipeline.zadd(RANK_KEY, *batch)
+            batch = []
+    if batch:
+        pipeline.zadd(RANK_KEY, *batch)
+    pipeline.execute()
+    return count
+
+
+def ensure(load_scores):
+    """
+    排行不存在时重建，多个进程同时调用时只有抢到锁的进程查询mysql，其他进程不等待
+    重建后排行为空时设置空标记，有效期内不再重建，避免没有房屋设置主图片时每个请求都查询mysql
+    :param load_scores: 查询设置了主图片的房屋的函数，返回可迭代的(房屋编号, 成交量)
+    """
+    pipeline = redis_store.pipeline(transaction=False)
+    pipeline.exists(RANK_KEY)
+    pipeline.exists(EMPTY_KEY)
+    if any(pipeline.execute()):
+        return
+    token = redis_lock.acquire(_LOCK_KEY, constants.HOUSE_RANK_LOCK_EXPIRES)
+    if token is None:
+        return
+    try:
+        if not rebuild(load_scores()):
+            redis_store.set(EMPTY_KEY, 1, ex=constants.HOUSE_RANK_EMPTY_EXPIRES)
+    finally:
+        try:
+            redis_lock.release(_LOCK_KEY, token)
+        except Exception as e:
+            logging.error(e)
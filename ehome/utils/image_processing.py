@@ -0,0 +1,179 @@
+# -*- coding:utf-8 -*-
+
+"""
+上传图片的处理
+werkzeug解析上传数据时把文件直接写入有大小限制的临时文件，超过IMAGE_UPLOAD_MAX_SIZE时立即停止解析，
+没有Content-Length的分块上传也同样受限，web进程不在内存中保留整个文件，进程池按文件名读取这个临时文件，
+在进程池中只解码一次原图，按EXIF方向摆正后去掉元数据，生成constants.IMAGE_VARIANTS中的各尺寸版本，
+列表、首页和头像使用小尺寸的版本，不再下发用户上传的原图
+
+进程池的子进程由fork创建，会继承父进程打开的数据库和redis连接，因此进程池必须在web进程
+打开任何连接之前创建：manage.py runserver启动时调用init_pool()，使用gunicorn等多进程的
+WSGI服务器部署时，在每个worker进程启动后、处理第一个请求之前调用init_pool()，
+例如gunicorn的post_fork钩子，不能在master进程中创建(preload_app)。
+没有调用init_pool()的进程不会在请求中创建进程池，而是在当前进程中生成图片版本
+"""
+
+import io
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+
+from flask import Request, current_app
+from PIL import Image
+from werkzeug.exceptions import RequestEntityTooLarge
+
+from ehome import constants
+from ehome.utils import image_storage
+
+
+# EXIF方向对应的图片变换
+_ORIENTATION_TRANSPOSE = {
+    2: Image.FLIP_LEFT_RIGHT,
+    3: Image.ROTATE_180,
+    4: Image.FLIP_TOP_BOTTOM,
+    5: Image.TRANSPOSE,
+    6: Image.ROTATE_270,
+    7: Image.TRANSVERSE,
+    8: Image.ROTATE_90,
+}
+
+# 处理图片的进程池，由init_pool()创建，保存(创建进程池的进程号, 进程池)
+_pool = []
+_pool_lock = threading.Lock()
+
+
+class UploadTooLarge(RequestEntityTooLarge):
+    """上传的文件超过大小限制，在解析请求数据时抛出，由蓝图的413错误处理函数返回"""
+    description = "upload exceeds IMAGE_UPLOAD_MAX_SIZE"
+
+
+class UploadFile(object):
+    """
+    保存上传文件的临时文件，关闭时删除
+    写入的数据超过max_size时删除临时文件并抛出UploadTooLarge，werkzeug随即停止解析请求数据
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.size = 0
+        self.file = tempfile.NamedTemporaryFile(prefix="upload_")
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.max_size:
+            self.file.close()
+            raise UploadTooLarge()
+        self.file.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+
+class UploadRequest(Request):
+    """上传的文件写入UploadFile的请求类，由create_app()设置为应用的request_class"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return UploadFile(current_app.config["IMAGE_UPLOAD_MAX_SIZE"])
+
+
+def _variant_format():
+    """图片版本的编码格式"""
+    Image.init()
+    if constants.IMAGE_VARIANT_FORMAT in Image.SAVE:
+        return constants.IMAGE_VARIANT_FORMAT
+    return "JPEG"
+
+
+def _exif_transpose(image):
+    """按照EXIF中记录的拍摄方向摆正图片，去掉元数据后浏览器无法再根据EXIF旋转"""
+    try:
+        orientation = image._getexif().get(0x0112)
+    except Exception:
+        return image
+    if orientation in _ORIENTATION_TRANSPOSE:
+        return image.transpose(_ORIENTATION_TRANSPOSE[orientation])
+    return image
+
+
+def render_variants(path):
+    """
+    在子进程中执行：解码原图并生成各尺寸版本
+    :param path: 原图文件的路径
+    :return: {版本名称: 编码后的图片数据}
+    :raise IOError: 文件不是可以识别的图片
+    """
+    image = Image.open(path)
+    icc_profile = image.info.get("icc_profile")
+    # JPEG直接按最大版本的尺寸缩小解码，减少解码的像素，方向可能旋转，按长边取正方形
+    longest = max(max(width, height) for _, width, height in constants.IMAGE_VARIANTS)
+    image.draft("RGB", (longest, longest))
+    image = _exif_transpose(image)
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        # 透明的部分填充白色
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.split()[-1])
+        image = background
+    elif image.mode != "RGB":
+        image = image.convert("RGB")
+
+    fmt = _variant_format()
+    options = {"quality": constants.IMAGE_VARIANT_QUALITY}
+    if fmt == "JPEG":
+        options.update(optimize=True, progressive=True)
+    if icc_profile:
+        options["icc_profile"] = icc_profile
+    variants = {}
+    # 从大到小依次缩小，每个版本都在上一个版本的基础上缩放
+    for name, width, height in sorted(constants.IMAGE_VARIANTS, key=lambda v: v[1] * v[2], reverse=True):
+        image.thumbnail((width, height), Image.LANCZOS)
+        output = io.BytesIO()
+        # 不传入exif等信息，保存的图片不包含元数据
+        image.save(output, fmt, **options)
+        variants[name] = output.getvalue()
+    return variants
+
+
+def init_pool(processes=constants.IMAGE_PROCESS_POOL_SIZE):
+    """
+    在当前进程中创建处理图片的进程池，必须在当前进程打开数据库和redis连接之前调用
+    不设置maxtasksperchild，替换子进程时会从已经打开连接的web进程中fork
+    """
+    with _pool_lock:
+        if not _pool:
+            _pool.append((os.getpid(), multiprocessing.Pool(processes)))
+
+
+def _get_pool():
+    """当前进程创建的进程池，没有调用init_pool()或者进程池由fork前的父进程创建时返回None"""
+    with _pool_lock:
+        if _pool and _pool[0][0] == os.getpid():
+            return _pool[0][1]
+    return None
+
+
+def make_variants(upload):
+    """
+    在进程池中生成上传图片的各尺寸版本，图片的解码和缩放不占用web进程，没有进程池时在当前进程中生成
+    子进程直接读取解析请求数据时写入的临时文件，图片数据不经过进程间的管道，临时文件在请求结束时删除
+    :param upload: request.files中的文件，由UploadRequest解析
+    :raise IOError: 文件不是可以识别的图片
+    """
+    upload.stream.flush()
+    path = upload.stream.name
+    pool = _get_pool()
+    if pool is None:
+        logging.warning("image process pool is not initialized, rendering in the web process")
+        return render_variants(path)
+    return pool.apply_async(render_variants, (path,)).get(constants.IMAGE_PROCESS_TIMEOUT)
+
+
+def store_variants(variants):
+    """
+    保存各尺寸版本
+    :return: {版本名称: 保存的文件名}
+    """
+    return dict((name, image_storage.storage(data)) for name, data in variants.items())
@@ -1,8 +1,20 @@
 # -*- coding: utf-8 -*-
 
+import abc
+import errno
+import hashlib
+import imghdr
 import logging
+import os
+import tempfile
+import threading
+import time
 
-from qiniu import Auth, put_data
+import requests
+from flask import current_app
+from qiniu import Auth, config
+
+from ehome import constants
 
 
 # 需要填写你的 Access Key 和 Secret Key
@@ -13,33 +25,189 @@ secret_key = 'Stn2mB5GEGDt8X9iKd4lADhcTxW-R4tOC8nnMQaA'
 bucket_name = 'ehome'
 
 
-def storage(data):
-    """七牛云存储上传文件接口"""
-    if not data:
-        return None
-    try:
-        # 构建鉴权对象
-        q = Auth(access_key, secret_key)
+class StorageBackend(object):
+    """
+    图片存储后端的接口
+    数据库中只保存storage()返回的文件名，不同后端的文件名互不通用
+    """
+    __metaclass__ = abc.ABCMeta
+
+    @abc.abstractmethod
+    def storage(self, data):
+        """保存文件，返回文件名"""
+
+    @abc.abstractmethod
+    def url(self, name):
+        """文件的访问路径"""
+
+
+class QiniuStorage(StorageBackend):
+    """
+    七牛云存储客户端
+    上传凭证在过期前重复使用，上传请求复用同一个HTTP会话的keep-alive连接
+    """
+
+    def __init__(self, access_key, secret_key, bucket, up_host=None,
+                 token_expires=constants.QINIU_UPLOAD_TOKEN_EXPIRES, timeout=constants.QINIU_UPLOAD_TIMEOUT):
+        """
+        :param up_host: 上传地址，为None时按存储空间所在区域查询，测试时可以指向本地的模拟存储服务器
+        :param token_expires: 上传凭证的有效期，单位：秒
+        """
+        self.auth = Auth(access_key, secret_key)
+        self.bucket = bucket
+        self.up_host = up_host
+        self.token_expires = token_expires
+        self.timeout = timeout
+        self.session = requests.Session()
+        self._token = None
+        self._token_deadline = 0
+        self._token_lock = threading.Lock()
+
+    def upload_token(self):
+        """获取上传凭证，缓存的凭证即将过期时重新签发"""
+        with self._token_lock:
+            now = time.time()
+            if self._token is None or now >= self._token_deadline:
+                self._token = self.auth.upload_token(self.bucket, expires=self.token_expires)
+                self._token_deadline = now + self.token_expires - constants.QINIU_UPLOAD_TOKEN_MARGIN
+            return self._token
+
+    def upload_url(self, token):
+        """上传地址，第一次上传时由七牛SDK按存储空间所在的区域查询，之后直接使用"""
+        if self.up_host is None:
+            self.up_host = config.get_default('default_zone').get_up_host_by_token(token)
+        return self.up_host + "/"
+
+    def storage(self, data):
+        """
+        七牛云存储上传文件接口
+        :return: 七牛中保存的文件名，未指定文件名时由七牛根据文件内容生成
+        """
+        if not data:
+            return None
+        try:
+            # 表单上传，与qiniu.put_data相同
+            token = self.upload_token()
+            response = self.session.post(self.upload_url(token), data={"token": token},
+                                         files={"file": ("file_name", data, "application/octet-stream")},
+                                         timeout=self.timeout)
+        except Exception as e:
+            logging.error(e)
+            raise e
+
+        if response.status_code != 200:
+            raise Exception("上传文件到七牛失败")
+
+        # 返回七牛中保存的图片名，这个图片名也是访问七牛获取图片的路径
+        return response.json()["key"]
+
+    def url(self, name):
+        return constants.QINIU_DOMIN_PREFIX + name
+
+
+# imghdr识别的图片类型对应的扩展名
+_EXTENSIONS = {"jpeg": "jpg"}
+
+# 图片扩展名对应的类型
+_MIMETYPES = {"jpg": "image/jpeg", "png": "image/png", "gif": "image/gif", "webp": "image/webp", "bmp": "image/bmp"}
 
-        # 生成上传 Token，可以指定过期时间等
-        token = q.upload_token(bucket_name)
 
-        # 上传文件
-        ret, info = put_data(token, None, data)
+def _image_extension(data):
+    """根据文件内容识别图片的扩展名，无法识别时返回None"""
+    # python2的imghdr不能识别webp
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "webp"
+    extension = imghdr.what(None, data)
+    return _EXTENSIONS.get(extension, extension)
 
-    except Exception as e:
-        logging.error(e)
-        raise e
 
-    if info and info.status_code != 200:
-        raise Exception("上传文件到七牛失败")
+class LocalStorage(StorageBackend):
+    """
+    本地文件系统存储
+    文件以内容的sha1命名，按哈希值的前两级分目录保存，相同内容的文件只保存一份
+    """
 
-    # 返回七牛中保存的图片名，这个图片名也是访问七牛获取图片的路径
-    return ret["key"]
+    def __init__(self, root, url_prefix="/images/"):
+        self.root = root
+        self.url_prefix = url_prefix
+
+    def path(self, name):
+        """文件的保存路径，例如 root/ab/cd/abcd....jpg"""
+        return os.path.join(self.root, name[:2], name[2:4], name)
+
+    def mimetype(self, name):
+        """根据文件名中的扩展名返回图片类型"""
+        return _MIMETYPES.get(name.rpartition(".")[2], "application/octet-stream")
+
+    def storage(self, data):
+        """
+        保存文件，相同内容的文件已存在时直接返回文件名
+        :return: 文件内容的sha1加上图片扩展名
+        """
+        if not data:
+            return None
+        name = hashlib.sha1(data).hexdigest()
+        extension = _image_extension(data)
+        if extension:
+            name += "." + extension
+        path = self.path(name)
+        if os.path.exists(path):
+            return name
+
+        directory = os.path.dirname(path)
+        try:
+            os.makedirs(directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        # 先写入临时文件再改名，并发上传相同内容或写入中途失败都不会留下不完整的文件
+        fd, temp_path = tempfile.mkstemp(dir=directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.chmod(temp_path, 0o644)
+            os.rename(temp_path, path)
+        except Exception:
+            os.remove(temp_path)
+            raise
+        return name
+
+    def url(self, name):
+        return self.url_prefix + name
+
+
+# 七牛上传共用的客户端
+client = QiniuStorage(access_key, secret_key, bucket_name)
+
+# 本地存储后端，键为存储目录
+_local_backends = {}
+
+
+def get_backend():
+    """
+    当前应用使用的存储后端，由配置IMAGE_STORAGE选择qiniu或local
+    已保存的图片名只能由保存它的后端访问，修改配置后已有的头像和房屋图片都无法显示，需要先迁移图片文件
+    """
+    if current_app.config.get("IMAGE_STORAGE") != "local":
+        return client
+    root = current_app.config["IMAGE_STORAGE_ROOT"]
+    backend = _local_backends.get(root)
+    if backend is None:
+        backend = _local_backends.setdefault(root, LocalStorage(root))
+    return backend
+
+
+def storage(data):
+    """上传文件接口，返回保存的文件名"""
+    return get_backend().storage(data)
+
+
+def image_url(name):
+    """拼接图片的完整路径，name为空时返回空字符串"""
+    return get_backend().url(name) if name else ""
 
 
 if __name__ == '__main__':
     file_name = raw_input("输入上传的文件")
     with open(file_name, "rb") as f:
-        storage(f.read())
-
+        client.storage(f.read())
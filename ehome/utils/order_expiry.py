@@ -0,0 +1,97 @@
+# -*- coding:utf-8 -*-
+
+"""
+超时订单自动取消
+等待接单的订单保存在redis有序集合order_expiry中，分值为超时时间，
+订单状态变化时在事务提交后增量更新；manage.py order_expiry_worker启动的后台进程
+分批取出到期的订单编号取消订单，取消后订单占用的日期和相关缓存由模型中的事务钩子处理
+"""
+
+import logging
+import time
+
+from ehome import redis_store, constants
+
+
+# 超时订单在redis中的键，有序集合类型，分值为超时时间
+ORDER_EXPIRY_KEY = "order_expiry"
+
+# 会超时的订单状态及其超时时间，单位：秒，项目没有支付环节，没有等待支付的订单
+WAITING_EXPIRES = {
+    "WAIT_ACCEPT": constants.ORDER_WAIT_ACCEPT_EXPIRES,
+}
+
+# 取出到期的订单编号，同时把它们的分值推迟到ARGV[3]，
+# 处理进程中途退出时，这些订单在推迟的时间到达后会被重新取出
+_CLAIM_DUE_SCRIPT = """
+local ids = redis.call("zrangebyscore", KEYS[1], "-inf", ARGV[1], "limit", "0", ARGV[2])
+for _, id in ipairs(ids) do
+    redis.call("zadd", KEYS[1], ARGV[3], id)
+end
+return ids
+"""
+
+
+def deadline(status, since):
+    """
+    订单的超时时间
+    :param since: 订单进入当前状态的时间
+    :return: 时间戳，不会超时的状态返回None
+    """
+    expires = WAITING_EXPIRES.get(status)
+    if expires is None:
+        return None
+    return time.mktime(since.timetuple()) + expires
+
+
+def schedule(pipeline, order_id, status, since):
+    """在redis管道中更新订单的超时时间，订单不再处于等待状态时移除"""
+    order_deadline = deadline(status, since)
+    if order_deadline is None:
+        pipeline.zrem(ORDER_EXPIRY_KEY, order_id)
+    else:
+        pipeline.zadd(ORDER_EXPIRY_KEY, order_deadline, order_id)
+
+
+def rebuild(orders):
+    """
+    根据数据库中的订单补充超时时间，已在集合中的订单会被覆盖为相同的值
+    :param orders: 可迭代的(订单编号, 订单状态, 进入该状态的时间)
+    """
+    pipeline = redis_store.pipeline(transaction=False)
+    for order_id, status, since in orders:
+        schedule(pipeline, order_id, status, since)
+    pipeline.execute()
+
+
+def claim_due(batch=constants.ORDER_EXPIRY_BATCH):
+    """取出最多batch个已到超时时间的订单编号"""
+    now = time.time()
+    ids = redis_store.eval(_CLAIM_DUE_SCRIPT, 1, ORDER_EXPIRY_KEY, now, batch,
+                           now + constants.ORDER_EXPIRY_CLAIM_SECONDS)
+    return [int(order_id) for order_id in ids]
+
+
+def run_worker(cancel_expired, batch=constants.ORDER_EXPIRY_BATCH, interval=constants.ORDER_EXPIRY_POLL_INTERVAL):
+    """
+    持续取消超时的订单
+    :param cancel_expired: 取消订单的函数，参数为订单编号列表，返回{订单编号: 超时时间}，
+        超时时间为None表示订单已取消或者已不在等待状态，否则按返回的超时时间重新等待
+    """
+    while True:
+        try:
+            order_ids = claim_due(batch)
+            if order_ids:
+                pipeline = redis_store.pipeline(transaction=False)
+                for order_id, order_deadline in cancel_expired(order_ids).items():
+                    if order_deadline is None:
+                        pipeline.zrem(ORDER_EXPIRY_KEY, order_id)
+                    else:
+                        pipeline.zadd(ORDER_EXPIRY_KEY, order_deadline, order_id)
+                pipeline.execute()
+                # 取满一批说明可能还有到期的订单，立即处理下一批
+                if len(order_ids) >= batch:
+                    continue
+        except Exception as e:
+            logging.error(e)
+        time.sleep(interval)
@@ -0,0 +1,67 @@
+# -*- coding:utf-8 -*-
+
+"""
+游标（keyset）分页
+游标记录上一页最后一条数据的排序字段和编号，下一页通过带索引的where条件直接定位，
+不再使用offset跳过前面的数据，也不需要每次count全部数据
+"""
+
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+
+
+# 游标中日期时间的格式
+_DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {"dt": value.strftime(_DATETIME_FORMAT)}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        return datetime.strptime(value["dt"], _DATETIME_FORMAT)
+    return value
+
+
+def encode_cursor(*values):
+    """把排序字段的值编码为不透明的游标字符串"""
+    data = json.dumps([_encode_value(value) for value in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(data.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    """
+    解析游标字符串
+    :return: 编码时的排序字段值列表
+    :raise ValueError: 游标格式错误
+    """
+    try:
+        data = base64.urlsafe_b64decode(str(cursor) + "=" * (-len(cursor) % 4))
+        values = json.loads(data.decode("utf-8"))
+        if isinstance(values, list):
+            return [_decode_value(value) for value in values]
+    except Exception:
+        pass
+    raise ValueError("invalid cursor: %s" % cursor)
+
+
+def seek(query, sort_column, id_column, descending, cursor_values=None):
+    """
+    对查询进行游标分页，按照排序字段和编号排序，编号保证排序结果唯一
+    :param cursor_values: 上一页最后一条数据的(排序字段值, 编号)，None表示第一页
+    """
+    if cursor_values is not None:
+        value, last_id = cursor_values
+        if descending:
+            query = query.filter(or_(sort_column < value, and_(sort_column == value, id_column < last_id)))
+        else:
+            query = query.filter(or_(sort_column > value, and_(sort_column == value, id_column > last_id)))
+    if descending:
+        return query.order_by(sort_column.desc(), id_column.desc())
+    return query.order_by(sort_column.asc(), id_column.asc())
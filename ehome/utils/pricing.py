@@ -0,0 +1,168 @@
+# -*- coding:utf-8 -*-
+
+"""
+按天计价的订单报价
+房屋的每一天默认按House.price计价，房东可以设置三类价格规则：
+WEEKDAY: 每周指定的几天使用另一个单价，例如周五和周六
+SEASON: 日期区间内使用另一个单价，优先于WEEKDAY，多个区间重叠时后设置的规则优先
+LONG_STAY: 入住天数达到min_days时总价打折，满足多条时使用最低的折扣
+报价把日期区间展开为numpy的日期数组，多个房屋同一日期区间的每日单价组成一个矩阵，
+整个计算过程没有按天的python循环；numpy不可用时按天逐个计算，结果相同
+"""
+
+import datetime
+
+try:
+    import numpy
+except ImportError:
+    # numpy是可选依赖，没有安装时使用纯python计算
+    numpy = None
+
+
+# 价格规则的类型
+RULE_KINDS = ("WEEKDAY", "SEASON", "LONG_STAY")
+
+
+def _weekday_flags(rule):
+    """WEEKDAY规则适用的星期几，weekdays为7位字符串，从周一到周日，"1"表示适用"""
+    return [i for i, flag in enumerate(rule.weekdays or "") if flag == "1"]
+
+
+def _group_rules(house_ids, rules):
+    """
+    按房屋分组价格规则
+    :param rules: 可迭代的价格规则，按设置的先后顺序排列
+    :return: {房屋编号: [价格规则, ...]}
+    """
+    groups = dict((house_id, []) for house_id in house_ids)
+    for rule in rules:
+        if rule.house_id in groups:
+            groups[rule.house_id].append(rule)
+    return groups
+
+
+def _quote_python(base_price, rules, start_date, days):
+    """逐天计算一个房屋的报价，numpy不可用时使用"""
+    weekday_prices = [base_price] * 7
+    discount = 100
+    for rule in rules:
+        if rule.kind == "WEEKDAY":
+            for weekday in _weekday_flags(rule):
+                weekday_prices[weekday] = rule.price
+        elif rule.kind == "LONG_STAY" and days >= rule.min_days:
+            discount = min(discount, rule.discount)
+    seasons = [rule for rule in rules if rule.kind == "SEASON"]
+    prices = []
+    for i in range(days):
+        day = start_date + datetime.timedelta(days=i)
+        price = weekday_prices[day.weekday()]
+        for rule in seasons:
+            if rule.begin_date <= day <= rule.end_date:
+                price = rule.price
+        prices.append(price)
+    return prices, discount
+
+
+def _assign_last(matrix, rows, cols, values):
+    """
+    按(rows, cols)给矩阵赋值，同一位置出现多次时使用最后一次的值
+    numpy的花式索引赋值不保证重复位置的先后，先按位置去重再赋值
+    """
+    if not len(rows):
+        return
+    positions = rows * matrix.shape[1] + cols
+    _, last = numpy.unique(positions[::-1], return_index=True)
+    last = len(positions) - 1 - last
+    matrix[rows[last], cols[last]] = values[last]
+
+
+def _quote_numpy(house_ids, base_prices, groups, start_date, days):
+    """
+    计算多个房屋在同一日期区间的每日单价矩阵和折扣
+    :return: (形状为(房屋数, 天数)的每日单价矩阵, 每个房屋的折扣百分比数组)
+    """
+    dates = numpy.datetime64(start_date, "D") + numpy.arange(days)
+    # 1970-01-01是星期四，换算为周一为0的星期几
+    weekdays = (dates.astype("int64") + 3) % 7
+    rows = dict((house_id, row) for row, house_id in enumerate(house_ids))
+    weekday_rules = []
+    season_rules = []
+    long_stay_rules = []
+    for house_id in house_ids:
+        for rule in groups[house_id]:
+            if rule.kind == "WEEKDAY":
+                weekday_rules.extend((rows[house_id], weekday, rule.price) for weekday in _weekday_flags(rule))
+            elif rule.kind == "SEASON":
+                season_rules.append((rows[house_id], rule.begin_date, rule.end_date, rule.price))
+            elif rule.kind == "LONG_STAY":
+                long_stay_rules.append((rows[house_id], rule.min_days, rule.discount))
+
+    # 每个房屋一周七天的单价，再按日期的星期几展开为每日单价
+    week_prices = numpy.repeat(numpy.array(base_prices, dtype="int64")[:, None], 7, axis=1)
+    if weekday_rules:
+        rule_rows, rule_weekdays, rule_prices = (numpy.array(column, dtype="int64") for column in zip(*weekday_rules))
+        _assign_last(week_prices, rule_rows, rule_weekdays, rule_prices)
+    matrix = week_prices[:, weekdays]
+
+    # 季节规则：每条规则覆盖的日期组成掩码，取出被覆盖的位置后一次赋值
+    if season_rules:
+        rule_rows, begins, ends, rule_prices = zip(*season_rules)
+        begins = numpy.array(begins, dtype="datetime64[D]")
+        ends = numpy.array(ends, dtype="datetime64[D]")
+        covered = (dates >= begins[:, None]) & (dates <= ends[:, None])
+        rule_index, cols = numpy.nonzero(covered)
+        _assign_last(matrix, numpy.array(rule_rows, dtype="int64")[rule_index], cols,
+                     numpy.array(rule_prices, dtype="int64")[rule_index])
+
+    # 长租规则：入住天数达到要求的规则中取每个房屋的最低折扣
+    discounts = numpy.full(len(house_ids), 100, dtype="int64")
+    if long_stay_rules:
+        rule_rows, min_days, rule_discounts = (numpy.array(column, dtype="int64") for column in zip(*long_stay_rules))
+        matched = min_days <= days
+        numpy.minimum.at(discounts, rule_rows[matched], rule_discounts[matched])
+    return matrix, discounts
+
+
+def _total(prices_sum, discount):
+    """折扣后的总价，不足1分的部分舍去"""
+    return int(prices_sum) * int(discount) // 100
+
+
+def quote_many(house_ids, base_prices, rules, start_date, end_date):
+    """
+    批量计算多个房屋在同一日期区间的总价
+    :param house_ids: 房屋编号列表
+    :param base_prices: 与house_ids对应的房屋单价列表，单位：分
+    :param rules: 这些房屋的价格规则，按设置的先后顺序排列
+    :param start_date: 入住日期，date类型
+    :param end_date: 离开日期，date类型，与订单一致，包含在入住天数内
+    :return: {房屋编号: 总价}
+    """
+    days = (end_date - start_date).days + 1
+    if not house_ids or days < 1:
+        return {}
+    groups = _group_rules(house_ids, rules)
+    if numpy is None:
+        amounts = {}
+        for house_id, base_price in zip(house_ids, base_prices):
+            prices, discount = _quote_python(base_price, groups[house_id], start_date, days)
+            amounts[house_id] = _total(sum(prices), discount)
+        return amounts
+    matrix, discounts = _quote_numpy(house_ids, base_prices, groups, start_date, days)
+    totals = matrix.sum(axis=1) * discounts // 100
+    return dict((house_id, int(total)) for house_id, total in zip(house_ids, totals))
+
+
+def quote(house_id, base_price, rules, start_date, end_date):
+    """
+    计算一个房屋在日期区间的报价
+    :return: (每日单价列表, 折扣百分比, 总价)
+    """
+    days = (end_date - start_date).days + 1
+    groups = _group_rules([house_id], rules)
+    if numpy is None:
+        prices, discount = _quote_python(base_price, groups[house_id], start_date, days)
+    else:
+        matrix, discounts = _quote_numpy([house_id], [base_price], groups, start_date, days)
+        prices, discount = matrix[0].tolist(), discounts[0]
+    return prices, int(discount), _total(sum(prices), discount)
@@ -0,0 +1,36 @@
+# -*- coding:utf-8 -*-
+
+"""
+redis分布式锁
+通过SET NX PX加锁，锁的值为随机令牌，释放时只删除自己持有的锁
+"""
+
+import uuid
+
+from ehome import redis_store
+
+
+# 只删除自己持有的锁，避免锁超时后误删其他进程的锁
+_RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+def acquire(key, expires):
+    """
+    尝试加锁
+    :param expires: 锁的有效期，单位：毫秒
+    :return: 加锁成功返回令牌，锁被其他进程持有时返回None
+    """
+    token = uuid.uuid4().hex
+    if redis_store.set(key, token, px=expires, nx=True):
+        return token
+    return None
+
+
+def release(key, token):
+    """释放锁，锁已超时并被其他进程持有时不做处理"""
+    return redis_store.eval(_RELEASE_LOCK_SCRIPT, 1, key, token)
@@ -1,5 +1,7 @@
 # -*- coding:utf-8 -*-
 
+import urlparse
+
 from ehome.libs.yuntongxun.CCPRestSDK import REST
 
 # 说明：主账号，登陆云通讯网站后，可在"控制台-应用"中看到开发者主账号ACCOUNT SID
@@ -69,6 +71,16 @@ class CCP(object):
             # 返回-1 表示发送失败
             return -1
 
+    def use_server(self, url):
+        """
+        更换云通讯的请求地址，例如对接本地的测试服务器
+        :param url: 服务器地址，格式为 协议://主机:端口，例如 http://127.0.0.1:8883
+        """
+        result = urlparse.urlparse(url)
+        self.rest.Protocol = result.scheme or "https"
+        self.rest.ServerIP = result.hostname
+        self.rest.ServerPort = str(result.port or _serverPort)
+
 
 if __name__ == '__main__':
     ccp = CCP()
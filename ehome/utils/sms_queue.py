@@ -0,0 +1,148 @@
+# -*- coding:utf-8 -*-
+
+"""
+短信发送队列
+接口只把发送任务写入redis列表，由manage.py sms_worker启动的后台进程调用云通讯发送，
+发送失败的任务按指数退避放入重试有序集合，到期后重新进入队列，短信验证码过期后不再重试
+发送进程用BRPOPLPUSH把任务移入处理中列表，发送完成或安排重试后才从处理中列表删除，
+进程在发送过程中退出时，任务在确认期限过后重新进入队列，因此一条短信可能被发送两次，但不会丢失
+"""
+
+import json
+import logging
+import time
+import uuid
+
+from ehome import redis_store, constants
+from ehome.utils import sms
+
+
+# 待发送任务在redis中的键，列表类型
+SMS_QUEUE_KEY = "sms_queue"
+
+# 等待重试的任务在redis中的键，有序集合类型，分值为重试时间
+SMS_RETRY_KEY = "sms_queue_retry"
+
+# 已被发送进程取出、尚未确认的任务在redis中的键，列表类型
+SMS_PROCESSING_KEY = "sms_queue_processing"
+
+# 处理中任务的确认期限在redis中的键，有序集合类型，分值为确认期限
+SMS_CLAIM_KEY = "sms_queue_claim"
+
+# 把到期的重试任务移回待发送队列
+_MOVE_DUE_SCRIPT = """
+local jobs = redis.call("zrangebyscore", KEYS[1], "-inf", ARGV[1])
+for _, job in ipairs(jobs) do
+    redis.call("zrem", KEYS[1], job)
+    redis.call("lpush", KEYS[2], job)
+end
+return #jobs
+"""
+
+# 把超过确认期限的处理中任务移回待发送队列的出队一端，尽快重新发送；
+# 刚被取出、还没有记录确认期限的任务补上期限ARGV[2]，下次检查时仍未确认再移回
+_RECOVER_SCRIPT = """
+local jobs = redis.call("lrange", KEYS[1], 0, -1)
+local count = 0
+for _, job in ipairs(jobs) do
+    local claim = redis.call("zscore", KEYS[2], job)
+    if not claim then
+        redis.call("zadd", KEYS[2], ARGV[2], job)
+    elseif tonumber(claim) <= tonumber(ARGV[1]) then
+        redis.call("lrem", KEYS[1], 1, job)
+        redis.call("zrem", KEYS[2], job)
+        redis.call("rpush", KEYS[3], job)
+        count = count + 1
+    end
+end
+return count
+"""
+
+
+def enqueue(mobile, datas, temp_id, expires=constants.SMS_CODE_REDIS_EXPIRES):
+    """
+    提交发送模板短信的任务
+    :param datas: 模板短信的内容数据
+    :param expires: 短信内容的有效期，超过有效期仍未发送成功的任务直接丢弃，单位：秒
+    """
+    job = {
+        # 保证内容相同的任务在处理中列表里也能区分
+        "id": uuid.uuid4().hex,
+        "mobile": mobile,
+        "datas": datas,
+        "temp_id": temp_id,
+        "expire_time": time.time() + expires,
+        "attempts": 0,
+    }
+    redis_store.lpush(SMS_QUEUE_KEY, json.dumps(job))
+
+
+def retry_delay(attempts):
+    """第attempts次发送失败后等待重试的时间，单位：秒"""
+    return min(constants.SMS_SEND_RETRY_DELAY * 2 ** (attempts - 1), constants.SMS_SEND_RETRY_MAX_DELAY)
+
+
+def claim(timeout=constants.SMS_QUEUE_POLL_TIMEOUT):
+    """
+    取出一个待发送任务，任务在确认前保留在处理中列表
+    :return: 任务在redis中保存的数据，超时没有任务时返回None
+    """
+    raw = redis_store.brpoplpush(SMS_QUEUE_KEY, SMS_PROCESSING_KEY, timeout)
+    if raw is not None:
+        redis_store.zadd(SMS_CLAIM_KEY, time.time() + constants.SMS_QUEUE_CLAIM_SECONDS, raw)
+    return raw
+
+
+def recover():
+    """把超过确认期限的处理中任务移回待发送队列，返回移回的任务数"""
+    now = time.time()
+    return redis_store.eval(_RECOVER_SCRIPT, 3, SMS_PROCESSING_KEY, SMS_CLAIM_KEY, SMS_QUEUE_KEY,
+                            now, now + constants.SMS_QUEUE_CLAIM_SECONDS)
+
+
+def process(job, ccp=None, raw=None):
+    """
+    执行一个发送任务，失败时安排重试
+    :param raw: claim()取出的任务数据，不为None时在安排重试的同一个事务中确认任务
+    :return: 是否发送成功
+    """
+    ccp = ccp or sms.CCP()
+    try:
+        result = ccp.send_template_sms(job["mobile"], job["datas"], job["temp_id"])
+    except Exception as e:
+        logging.error(e)
+        result = -1
+
+    pipeline = redis_store.pipeline()
+    if 0 != result:
+        job["attempts"] += 1
+        retry_time = time.time() + retry_delay(job["attempts"])
+        if job["attempts"] >= constants.SMS_SEND_MAX_ATTEMPTS or retry_time >= job["expire_time"]:
+            logging.error("send sms to %s failed after %s attempts" % (job["mobile"], job["attempts"]))
+        else:
+            pipeline.zadd(SMS_RETRY_KEY, retry_time, json.dumps(job))
+    if raw is not None:
+        pipeline.lrem(SMS_PROCESSING_KEY, 1, raw)
+        pipeline.zrem(SMS_CLAIM_KEY, raw)
+    pipeline.execute()
+    return 0 == result
+
+
+def run_worker(server=None, timeout=constants.SMS_QUEUE_POLL_TIMEOUT):
+    """
+    持续从队列中取出任务发送短信
+    :param server: 云通讯的请求地址，为None时使用sms模块中的配置，例如http://127.0.0.1:8883
+    """
+    ccp = sms.CCP()
+    if server:
+        ccp.use_server(server)
+    while True:
+        try:
+            redis_store.eval(_MOVE_DUE_SCRIPT, 2, SMS_RETRY_KEY, SMS_QUEUE_KEY, time.time())
+            recover()
+            raw = claim(timeout)
+            if raw is not None:
+                process(json.loads(raw), ccp, raw)
+        except Exception as e:
+            logging.error(e)
+            time.sleep(timeout)
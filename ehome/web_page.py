@@ -1,13 +1,36 @@
 # -*- coding:utf-8 -*-
 
 
-from flask import Blueprint, current_app, make_response, session
+import os
+
+from flask import Blueprint, abort, current_app, make_response, request, send_file, session
 from flask_wtf import csrf
 
+from ehome import constants
+from ehome.utils import image_storage
+
 
 html = Blueprint("html", __name__)
 
 
+@html.route("/images/<regex(r'[0-9a-f]{40}(\.[a-z]+)?'):name>")
+def image_file(name):
+    """
+    本地存储的图片
+    文件由wsgi服务器的file_wrapper以sendfile发送，文件名就是内容哈希，直接作为强ETag
+    """
+    backend = image_storage.get_backend()
+    if not isinstance(backend, image_storage.LocalStorage):
+        abort(404)
+    path = backend.path(name)
+    if not os.path.isfile(path):
+        abort(404)
+    response = send_file(path, mimetype=backend.mimetype(name), add_etags=False, conditional=False,
+                         cache_timeout=constants.IMAGE_CACHE_MAX_AGE)
+    response.set_etag(name.split(".")[0])
+    return response.make_conditional(request)
+
+
 @html.route("/<regex('.*'):file_name>")
 def html_file(file_name):
 
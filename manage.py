@@ -3,10 +3,16 @@
 
 
 # 项目启动文件
-from ehome import create_app, db
+import datetime
+import sys
+
+from ehome import create_app, db, constants
 from flask_script import Manager
 from flask_migrate import Migrate, MigrateCommand
+from sqlalchemy import event
 from ehome import models
+from ehome.utils import availability, cache, house_bloom, house_rank, image_processing, order_expiry, pagination, sms_queue
+from ehome.utils.captcha import pool as captcha_pool
 
 
 app = create_app("development")
@@ -16,7 +22,446 @@ manager = Manager(app)
 manager.add_command("db", MigrateCommand)
 
 
+@manager.command
+def rebuild_calendar():
+    """根据订单数据重建房屋可预订日期索引和每天的占用计数"""
+    house_ids = [house_id for house_id, in db.session.query(models.House.id)]
+    order_ranges = db.session.query(models.Order.house_id, models.Order.begin_date, models.Order.end_date)\
+        .filter(models.Order.status.in_(availability.OCCUPYING_STATUS))
+    availability.rebuild(house_ids, order_ranges)
+
+
+@manager.command
+def rebuild_house_rank():
+    """根据房屋数据重建首页房屋排行"""
+    house_rank.rebuild(db.session.query(models.House.id, models.House.order_count)
+                       .filter(models.House.index_image_url != ""))
+
+
+@manager.command
+def rebuild_house_bloom():
+    """根据房屋数据建立已存在房屋编号的布隆过滤器，清除已删除房屋的编号，过滤器只由这个命令建立"""
+    # 结束当前事务，查询房屋编号时开始新的快照，晚于重建标记的设置
+    db.session.remove()
+    if not house_bloom.rebuild(models.House.all_ids):
+        print("house bloom filter is being rebuilt by another process or was discarded, try again later")
+        sys.exit(1)
+    print("house bloom filter rebuilt")
+
+
+@manager.command
+def cache_stats():
+    """查看读穿缓存的命中与合并重建次数"""
+    for name, count in sorted(cache.stats().items()):
+        print("%s: %s" % (name, count))
+
+
+def count_statements(func):
+    """
+    统计调用func时向数据库发出的sql语句数
+    :return: (func的返回值, 语句数)
+    """
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        result = func()
+    finally:
+        event.remove(db.engine, "before_cursor_execute", before_cursor_execute)
+    return result, len(statements)
+
+
+@manager.option("-n", "--houses", dest="houses", type=int, default=50, help="生成的房屋数量")
+def check_query_counts(houses):
+    """
+    在不提交的事务中生成房屋数据，检查批量序列化房屋列表的查询次数不随房屋数量变化，
+    次数变化时以状态1退出，生成的数据在检查结束后回滚
+    """
+    import uuid
+
+    House = models.House
+    house_ids = []
+    try:
+        # 每个房屋使用不同的区域和房屋主人，逐个懒加载时查询次数会随房屋数量增加
+        for i in range(houses):
+            suffix = uuid.uuid4().hex[:8]
+            area = models.Area(name="qc_%s" % suffix)
+            user = models.User(name="qc_%s" % suffix, mobile="199%08d" % (int(suffix, 16) % 10 ** 8),
+                               password_hash="-")
+            house = House(title="qc_%s" % suffix, area=area, user=user, price=i)
+            db.session.add(house)
+            db.session.flush()
+            house_ids.append(house.id)
+
+        def by_query(ids):
+            return count_statements(lambda: House.to_basic_dict_list(House.query.filter(House.id.in_(ids))))
+
+        def by_list(ids):
+            # 房屋列表预先查出，只统计序列化时的查询
+            houses_list = House.query.filter(House.id.in_(ids)).all()
+            return count_statements(lambda: House.to_basic_dict_list(houses_list))
+
+        failed = False
+        for name, serialize in (("查询对象", by_query), ("房屋列表", by_list)):
+            counts = []
+            for count in (1, houses):
+                # 清空会话中的对象，区域和房屋主人需要重新查询
+                db.session.expunge_all()
+                houses_dict_list, statements = serialize(house_ids[:count])
+                assert len(houses_dict_list) == count
+                counts.append(statements)
+                print("%s: %d houses, %d statements" % (name, count, statements))
+            if len(set(counts)) > 1:
+                failed = True
+    finally:
+        db.session.rollback()
+    if failed:
+        print("statement count grows with the number of houses")
+        sys.exit(1)
+
+
+def seed_explain_data(houses):
+    """
+    生成检查查询计划用的区域、房东、房客、房屋和订单数据，每个房屋10个订单，直接插入不经过模型的事务钩子
+    :return: (区域编号, 房东编号, 房客编号, 房屋编号, 删除这些数据的函数)
+    """
+    import random
+    import uuid
+
+    suffix = uuid.uuid4().hex[:8]
+    areas = [models.Area(name="explain_%s_%d" % (suffix, i)) for i in range(10)]
+    landlord = models.User(name="explain_l_%s" % suffix, mobile="198%08d" % (int(suffix, 16) % 10 ** 8),
+                           password_hash="-")
+    custom = models.User(name="explain_c_%s" % suffix, mobile="197%08d" % (int(suffix, 16) % 10 ** 8),
+                         password_hash="-")
+    db.session.add_all(areas + [landlord, custom])
+    db.session.commit()
+    area_ids = [area.id for area in areas]
+    first_house_id = (db.session.query(db.func.max(models.House.id)).scalar() or 0) + 1
+    now = datetime.datetime.now()
+    db.session.execute(models.House.__table__.insert(), [{
+        "id": first_house_id + i, "user_id": landlord.id, "area_id": random.choice(area_ids), "title": "explain",
+        "price": random.randint(1, 1000) * 100, "order_count": random.randint(0, 100),
+        "create_time": now - datetime.timedelta(minutes=i), "update_time": now,
+    } for i in range(houses)])
+    orders = []
+    for i in range(houses):
+        for _ in range(10):
+            begin = now + datetime.timedelta(days=random.randint(-180, 180))
+            orders.append({
+                "user_id": random.choice([landlord.id, custom.id]), "house_id": first_house_id + i,
+                "landlord_id": landlord.id,
+                "begin_date": begin, "end_date": begin + datetime.timedelta(days=2), "days": 3,
+                "house_price": 100, "amount": 300, "status": random.choice(availability.OCCUPYING_STATUS),
+                "comment": "explain", "create_time": now - datetime.timedelta(minutes=random.randint(0, 10 ** 6)),
+                "update_time": now,
+            })
+    for i in range(0, len(orders), 1000):
+        db.session.execute(models.Order.__table__.insert(), orders[i:i + 1000])
+    db.session.commit()
+    # 更新索引统计信息，查询计划按生成数据后的表估算
+    db.session.execute("ANALYZE TABLE ih_house_info, ih_order_info")
+
+    def cleanup():
+        last_house_id = first_house_id + houses - 1
+        db.session.query(models.Order).filter(models.Order.house_id.between(first_house_id, last_house_id))\
+            .delete(synchronize_session=False)
+        db.session.query(models.House).filter(models.House.id.between(first_house_id, last_house_id))\
+            .delete(synchronize_session=False)
+        db.session.query(models.User).filter(models.User.id.in_([landlord.id, custom.id]))\
+            .delete(synchronize_session=False)
+        db.session.query(models.Area).filter(models.Area.id.in_(area_ids)).delete(synchronize_session=False)
+        db.session.commit()
+
+    return area_ids[0], landlord.id, custom.id, first_house_id, cleanup
+
+
+@manager.option("-s", "--seed", dest="seed", type=int, default=0,
+                help="检查前临时生成的房屋数量，每个房屋10个订单，检查结束后删除")
+@manager.option("-r", "--max-rows", dest="max_rows", type=int, default=1000, help="不使用索引时允许估算扫描的最多行数")
+def explain_queries(seed, max_rows):
+    """
+    对各接口实际发出的查询语句执行EXPLAIN，有查询不使用索引且估算扫描的行数超过max_rows时以状态1退出
+    表中数据很少时MySQL会直接选择全表扫描，需要通过--seed生成足够的数据后再检查
+    """
+    from ehome.api_1_0.house import HOUSE_LIST_SORTS, query_houses, query_houses_ids
+
+    House, Order = models.House, models.Order
+    cleanup = None
+    if seed:
+        area_id, landlord_id, custom_id, house_id, cleanup = seed_explain_data(seed)
+    else:
+        area_id, landlord_id, custom_id, house_id = 1, 1, 1, 1
+    start_date = datetime.datetime.now()
+    end_date = start_date + datetime.timedelta(days=3)
+    queries = [
+        ("首页房屋", House.query.filter(House.id.in_([house_id, house_id + 1]))
+            .options(db.joinedload(House.area), db.joinedload(House.user))),
+        ("房屋详情", House.query.options(db.joinedload(House.user), db.joinedload(House.images))
+            .filter(House.id == house_id)),
+        ("房屋设施", db.session.query(models.house_facility.c.facility_id)
+            .filter(models.house_facility.c.house_id == house_id)),
+        ("房屋评论", Order.query_comments(house_id)),
+        ("房屋日期冲突", Order.query_conflicts(house_id, start_date, end_date)),
+    ]
+    # 列表页缓存的房屋编号查询，日期条件使用索引不可用时的订单子查询
+    for sort_key in sorted(HOUSE_LIST_SORTS):
+        queries.append(("列表-%s" % sort_key, query_houses_ids("", None, None, sort_key)))
+        queries.append(("列表-区域-%s" % sort_key, query_houses_ids(area_id, None, None, sort_key)))
+        queries.append(("列表-区域-日期-%s" % sort_key,
+                        query_houses_ids(area_id, start_date, end_date, sort_key, use_calendar=False)))
+    # 游标分页的总条数，与Query.count()发出的语句相同
+    queries.append(("列表-区域-日期-总数", query_houses(area_id, start_date, end_date, use_calendar=False)
+                    .order_by(None).from_self(db.func.count(db.literal_column("*")))))
+    queries += [
+        ("列表-区域-游标", pagination.seek(query_houses(area_id, None, None), House.create_time, House.id,
+                                         True, (start_date, house_id)).limit(constants.HOUSE_LIST_PAGE_CAPACITY + 1)),
+        ("房客订单-游标", pagination.seek(Order.query.filter(Order.user_id == custom_id), Order.create_time, Order.id,
+                                        True, (start_date, house_id)).limit(constants.ORDER_LIST_PAGE_CAPACITY + 1)),
+        ("房东订单-游标", pagination.seek(Order.query.join(House, Order.house_id == House.id)
+                                        .filter(Order.landlord_id == landlord_id), Order.create_time, Order.id,
+                                        True, (start_date, house_id)).limit(constants.ORDER_LIST_PAGE_CAPACITY + 1)),
+    ]
+    slow_queries = []
+    connection = db.engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        for name, query in queries:
+            # 使用数据库驱动的参数格式执行EXPLAIN
+            compiled = query.statement.compile(dialect=db.engine.dialect)
+            params = [compiled.params[key] for key in compiled.positiontup]
+            cursor.execute("EXPLAIN " + str(compiled), params)
+            columns = [column[0] for column in cursor.description]
+            for row in cursor.fetchall():
+                row = dict(zip(columns, row))
+                print("%s: table=%s type=%s key=%s rows=%s extra=%s" % (name, row["table"], row["type"], row["key"],
+                                                                     row["rows"], row.get("Extra")))
+                # 派生表是子查询的结果，不属于表扫描
+                if row["table"] and row["table"].startswith("<"):
+                    continue
+                if row["key"] is None and (row["rows"] or 0) > max_rows:
+                    slow_queries.append(name)
+    finally:
+        connection.close()
+        if cleanup is not None:
+            cleanup()
+    if slow_queries:
+        print("queries scanning more than %d rows without an index: %s" % (max_rows, ", ".join(slow_queries)))
+        sys.exit(1)
+
+
+@manager.command
+def check_image_storage():
+    """
+    检查图片存储后端：七牛客户端上传到本地启动的模拟上传服务器，本地存储写入临时目录，
+    检查失败时以状态1退出
+    """
+    import BaseHTTPServer
+    import SocketServer
+    import cgi
+    import hashlib
+    import shutil
+    import tempfile
+    import threading
+    from cStringIO import StringIO
+    from ehome.utils import image_storage
+
+    received = {"connections": 0, "tokens": []}
+
+    class FakeUploadHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+        """模拟七牛的表单上传，返回文件内容的sha1作为文件名，请求路径为/fail时返回500"""
+        protocol_version = "HTTP/1.1"
+
+        def setup(self):
+            BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+            received["connections"] += 1
+
+        def do_POST(self):
+            # 先按Content-Length读出请求包体，直接解析rfile会一直等待keep-alive连接关闭
+            body = self.rfile.read(int(self.headers["Content-Length"]))
+            form = cgi.FieldStorage(fp=StringIO(body), headers=self.headers,
+                                    environ={"REQUEST_METHOD": "POST", "CONTENT_TYPE": self.headers["Content-Type"]})
+            received["tokens"].append(form.getfirst("token"))
+            if self.path == "/fail/":
+                status, body = 500, '{"error": "fail"}'
+            else:
+                status, body = 200, '{"key": "%s"}' % hashlib.sha1(form["file"].value).hexdigest()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    class FakeUploadServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+        # 每个keep-alive连接由单独的线程处理，关闭服务器时不等待这些连接
+        daemon_threads = True
+
+    server = FakeUploadServer(("127.0.0.1", 0), FakeUploadHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    root = tempfile.mkdtemp()
+    failures = []
+    try:
+        up_host = "http://127.0.0.1:%d" % server.server_address[1]
+        client = image_storage.QiniuStorage("test-ak", "test-sk", "test-bucket", up_host=up_host)
+        names = [client.storage(data) for data in (b"first image", b"second image")]
+        if names != [hashlib.sha1(data).hexdigest() for data in (b"first image", b"second image")]:
+            failures.append("qiniu: unexpected file names %s" % names)
+        if len(set(received["tokens"])) != 1:
+            failures.append("qiniu: upload token was not reused")
+        if received["connections"] != 1:
+            failures.append("qiniu: %d connections for 2 uploads" % received["connections"])
+        if client.storage(b"") is not None:
+            failures.append("qiniu: empty data was uploaded")
+        client.up_host = up_host + "/fail"
+        try:
+            client.storage(b"third image")
+            failures.append("qiniu: failed upload did not raise")
+        except Exception:
+            pass
+
+        local = image_storage.LocalStorage(root)
+        png = b"\x89PNG\r\n\x1a\n" + b"\0" * 16
+        name = local.storage(png)
+        if name != hashlib.sha1(png).hexdigest() + ".png" or local.storage(png) != name:
+            failures.append("local: unexpected file name %s" % name)
+        with open(local.path(name), "rb") as f:
+            if f.read() != png:
+                failures.append("local: stored content differs")
+        if local.mimetype(name) != "image/png" or local.url(name) != "/images/" + name:
+            failures.append("local: unexpected mimetype or url")
+    finally:
+        server.shutdown()
+        server.server_close()
+        shutil.rmtree(root)
+    for failure in failures:
+        print(failure)
+    if failures:
+        sys.exit(1)
+    print("image storage OK")
+
+
+@manager.option("-H", "--house", dest="house_id", type=int, required=True, help="预订的房屋编号")
+@manager.option("-u", "--users", dest="users", default="", help="下订单的用户编号，以逗号分隔，默认为房东以外的前20个用户")
+@manager.option("-n", "--requests", dest="requests", type=int, default=200, help="预订请求的总数")
+@manager.option("-c", "--concurrency", dest="concurrency", type=int, default=20, help="同时发送请求的线程数")
+@manager.option("-d", "--days", dest="days", type=int, default=30, help="预订日期的范围，从明天开始的天数")
+@manager.option("-k", "--keep", dest="keep", action="store_true", default=False, help="保留压测生成的订单")
+def booking_load_test(house_id, users, requests, concurrency, days, keep):
+    """同时对一个房屋发送大量日期重叠的预订请求，检查生成的订单没有日期冲突"""
+    import json
+    import random
+    import threading
+    import time
+
+    house = models.House.query.get(house_id)
+    if house is None:
+        print("house %s not found" % house_id)
+        sys.exit(1)
+    if users:
+        user_ids = [int(user_id) for user_id in users.split(",")]
+    else:
+        user_ids = [user_id for user_id, in db.session.query(models.User.id)
+                    .filter(models.User.id != house.user_id).limit(20)]
+    if not user_ids:
+        print("no users to book the house")
+        sys.exit(1)
+    max_order_id = db.session.query(db.func.max(models.Order.id)).scalar() or 0
+    db.session.remove()
+
+    # 压测在进程内通过测试客户端发送请求，不经过CSRF校验
+    app.config["WTF_CSRF_ENABLED"] = False
+    first_day = datetime.date.today() + datetime.timedelta(days=1)
+    results = {}
+    latencies = []
+    results_lock = threading.Lock()
+    counter = [requests]
+
+    def worker():
+        client = app.test_client()
+        while True:
+            with results_lock:
+                if counter[0] <= 0:
+                    return
+                counter[0] -= 1
+            with client.session_transaction() as session:
+                session["user_id"] = random.choice(user_ids)
+            begin = first_day + datetime.timedelta(days=random.randrange(days))
+            end = begin + datetime.timedelta(days=random.randrange(max(house.min_days, 1) - 1, max(house.min_days, 3)))
+            data = json.dumps({"house_id": house_id, "start_date": begin.strftime("%Y-%m-%d"),
+                               "end_date": end.strftime("%Y-%m-%d")})
+            start = time.time()
+            resp = client.post("/api/v1.0/orders", data=data, content_type="application/json")
+            elapsed = time.time() - start
+            errno = json.loads(resp.data)["errno"]
+            with results_lock:
+                results[errno] = results.get(errno, 0) + 1
+                latencies.append(elapsed)
+
+    start = time.time()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    total_time = time.time() - start
+
+    latencies.sort()
+    print("requests: %d, concurrency: %d, time: %.2fs, %.1f req/s" % (requests, concurrency, total_time,
+                                                                     requests / total_time))
+    print("latency p50: %.1fms, p99: %.1fms" % (latencies[len(latencies) // 2] * 1000,
+                                               latencies[int(len(latencies) * 0.99)] * 1000))
+    for errno, count in sorted(results.items()):
+        print("errno %s: %d" % (errno, count))
+
+    # 检查所有占用日期的订单两两之间没有重叠
+    orders = models.Order.query.filter(models.Order.house_id == house_id,
+                                       models.Order.status.in_(availability.OCCUPYING_STATUS))\
+        .order_by(models.Order.begin_date).all()
+    overlaps = [(a.id, b.id) for a, b in zip(orders, orders[1:]) if b.begin_date <= a.end_date]
+    print("occupying orders: %d, overlapping pairs: %d" % (len(orders), len(overlaps)))
+    if not keep:
+        for order in models.Order.query.filter(models.Order.house_id == house_id, models.Order.id > max_order_id):
+            db.session.delete(order)
+        db.session.commit()
+    if overlaps:
+        sys.exit(1)
+
+
+@manager.option("-s", "--size", dest="size", type=int, default=constants.CAPTCHA_POOL_SIZE, help="验证码池容量")
+@manager.option("-p", "--processes", dest="processes", type=int, default=None, help="生成验证码的进程数")
+def captcha_pool_worker(size, processes):
+    """在后台持续补充预先生成的图片验证码池"""
+    captcha_pool.run_refill_worker(size, processes)
+
+
+@manager.option("-s", "--server", dest="server", default=None, help="云通讯请求地址，例如http://127.0.0.1:8883")
+def sms_worker(server):
+    """在后台持续发送短信队列中的短信，失败时按指数退避重试"""
+    sms_queue.run_worker(server)
+
+
+@manager.option("-b", "--batch", dest="batch", type=int, default=constants.ORDER_EXPIRY_BATCH, help="每批取消的订单数")
+def order_expiry_worker(batch):
+    """在后台持续取消超时未接单的订单，释放订单占用的日期"""
+    # 启动时补充数据库中等待中订单的超时时间
+    order_expiry.rebuild(db.session.query(models.Order.id, models.Order.status, models.Order.update_time)
+                         .filter(models.Order.status.in_(list(order_expiry.WAITING_EXPIRES))))
+    db.session.remove()
+    order_expiry.run_worker(models.Order.cancel_expired, batch)
+
+
 if __name__ == '__main__':
     print app.url_map
+    # 处理图片的进程池需要在打开数据库和redis连接之前创建，其他命令不处理图片
+    if sys.argv[1:2] == ["runserver"]:
+        image_processing.init_pool()
     manager.run()
 